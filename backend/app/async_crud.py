@@ -0,0 +1,161 @@
+"""
+Асинхронные версии горячих функций из crud.py для async-эндпоинтов.
+
+Запросы не дублируются: используются те же построители запросов, что и в crud.py,
+меняется только способ выполнения (AsyncSession вместо Session).
+Для редких операций записи async-роутеры вызывают синхронный crud через db.run_sync().
+"""
+from typing import Dict, Iterable, Optional, Set, Tuple, List as TypingList
+from uuid import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, crud, pagination, social_graph
+
+
+# --- Пользователи ---
+
+async def get_user(db: AsyncSession, user_id: int) -> Optional[models.User]:
+    result = await db.execute(crud._user_stmt(user_id))
+    return result.scalars().first()
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[models.User]:
+    result = await db.execute(crud._user_by_email_stmt(email))
+    return result.scalars().first()
+
+async def get_user_by_name(db: AsyncSession, name: str) -> Optional[models.User]:
+    result = await db.execute(crud._user_by_name_stmt(name))
+    return result.scalars().first()
+
+async def get_user_by_email_or_name(db: AsyncSession, login_identifier: str) -> Optional[models.User]:
+    """Ищет пользователя по email ИЛИ по имени."""
+    result = await db.execute(crud._user_by_email_or_name_stmt(login_identifier))
+    return result.scalars().first()
+
+# --- Друзья ---
+
+async def are_users_friends(db: AsyncSession, user1_id: int, user2_id: int) -> bool:
+    """Проверяет, являются ли два пользователя друзьями (статус ACCEPTED)."""
+    return await social_graph.are_friends_async(db, user1_id, user2_id)
+
+# --- Списки ---
+
+async def get_list_by_public_key(db: AsyncSession, public_key: UUID) -> Optional[models.List]:
+    """Получить один список по его публичному UUID ключу с полной информацией."""
+    result = await db.execute(crud._list_by_public_key_stmt(public_key))
+    return result.unique().scalars().first()
+
+async def get_list_version_by_public_key(db: AsyncSession, public_key: UUID):
+    """(id, version, privacy_level) списка по публичному ключу или None."""
+    result = await db.execute(crud._list_version_by_public_key_stmt(public_key))
+    return result.first()
+
+async def get_lists_by_user(db: AsyncSession, user_id: int, skip: int = 0, limit: int = 100) -> TypingList[models.List]:
+    """Получить все списки конкретного пользователя."""
+    result = await db.execute(crud._lists_by_user_stmt(user_id, skip, limit))
+    return result.scalars().all()
+
+async def get_list_header(db: AsyncSession, list_id: int) -> Optional[models.List]:
+    """Заголовок списка без элементов."""
+    result = await db.execute(crud._list_header_stmt(list_id))
+    return result.scalars().first()
+
+async def get_list_items_page(db: AsyncSession, list_id: int, cursor: Optional[str] = None, limit: int = pagination.DEFAULT_PAGE_SIZE):
+    """Страница элементов списка в порядке (created_at, id): (элементы, курсор следующей страницы или None)."""
+    result = await db.execute(crud._list_items_page_stmt(list_id, cursor, limit))
+    return pagination.split_page(result.scalars().all(), limit)
+
+async def get_item_like_stats(db: AsyncSession, item_ids: Iterable[int], user_id: Optional[int] = None) -> Dict[int, crud.LikeStats]:
+    """Число лайков и лайкнул ли пользователь — для каждого элемента; элементов без лайков в словаре нет."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+    result = await db.execute(crud._item_like_stats_stmt(item_ids, user_id))
+    return crud._like_stats_from_rows(result.all())
+
+async def get_comment_previews(db: AsyncSession, item_ids: Iterable[int], size: int = crud.COMMENT_PREVIEW_SIZE) -> Dict[int, crud.CommentPreview]:
+    """Число комментариев и последние size комментариев для каждого элемента; элементов без комментариев в словаре нет."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+    result = await db.execute(crud._comment_previews_stmt(item_ids, size))
+    return crud._comment_previews_from_rows(result.all())
+
+# --- Элементы ---
+
+async def get_item(db: AsyncSession, item_id: int) -> Optional[models.Item]:
+    """Получить один элемент по его ID."""
+    result = await db.execute(crud._item_stmt(item_id))
+    return result.scalars().first()
+
+async def get_item_comments_page(db: AsyncSession, item_id: int, cursor: Optional[str] = None, limit: int = pagination.DEFAULT_PAGE_SIZE):
+    """Страница комментариев элемента, от новых к старым: (комментарии, курсор следующей страницы или None)."""
+    result = await db.execute(crud._item_comments_page_stmt(item_id, cursor, limit))
+    return pagination.split_page(result.scalars().all(), limit)
+
+# --- Бронирования ---
+
+async def get_reservation_by_item_id(db: AsyncSession, item_id: int) -> Optional[models.Reservation]:
+    """Получить бронирование по ID элемента."""
+    result = await db.execute(crud._reservation_by_item_id_stmt(item_id))
+    return result.scalars().first()
+
+async def get_reserved_item_ids(db: AsyncSession, item_ids: Iterable[int]) -> Set[int]:
+    """Какие из элементов забронированы."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return set()
+    result = await db.execute(crud._reserved_item_ids_stmt(item_ids))
+    return set(result.scalars())
+
+# --- Уведомления ---
+
+async def get_notifications_for_user(db: AsyncSession, user_id: int, limit: int = 20) -> TypingList[models.Notification]:
+    """Получить последние уведомления пользователя, отсортированные по дате."""
+    result = await db.execute(crud._notifications_for_user_stmt(user_id, limit))
+    return result.scalars().all()
+
+async def get_notification_events_since(
+    db: AsyncSession, user_id: int, last_event_id: int, limit: int = crud.NOTIFICATION_REPLAY_LIMIT
+) -> TypingList[models.Notification]:
+    """Асинхронный аналог crud.get_notification_events_since."""
+    result = await db.execute(crud._notification_events_since_stmt(user_id, last_event_id, limit))
+    return result.scalars().all()
+
+async def count_unread_notifications(db: AsyncSession, user_id: int) -> int:
+    """Подсчитать количество непрочитанных уведомлений (COUNT по таблице; для опроса есть счетчик в users)."""
+    result = await db.execute(crud._count_unread_notifications_stmt(user_id))
+    return result.scalar_one()
+
+async def get_notifications_version(db: AsyncSession, user_id: int):
+    """(id и время последнего уведомления, счетчик непрочитанных) — для ETag и значка."""
+    result = await db.execute(crud._notifications_version_stmt(user_id))
+    return tuple(result.one())
+
+async def mark_notification_as_read(db: AsyncSession, notification_id: int, user_id: int) -> Optional[Tuple[models.Notification, int]]:
+    """Пометить уведомление как прочитанное: (уведомление, новый счетчик непрочитанных) или None."""
+    result = await db.execute(crud._user_notification_stmt(notification_id, user_id))
+    db_notification = result.scalars().first()
+
+    if db_notification and not db_notification.is_read:
+        marked = await db.execute(crud._mark_notifications_read_stmt(user_id, models.Notification.id == notification_id))
+        if marked.rowcount:
+            unread_count = (await db.execute(crud._change_unread_count_stmt(user_id, -1))).scalar_one()
+            await db.commit()
+            return db_notification, unread_count
+        await db.rollback()
+    return None
+
+async def mark_all_notifications_as_read(db: AsyncSession, user_id: int) -> int:
+    """Пометить все уведомления прочитанными. Возвращает новое значение счетчика непрочитанных."""
+    marked = await db.execute(crud._mark_notifications_read_stmt(user_id))
+    result = await db.execute(crud._change_unread_count_stmt(user_id, -marked.rowcount))
+    unread_count = result.scalar_one()
+    await db.commit()
+    return unread_count
+
+# --- Лента ---
+
+async def get_friends_feed_lists(db: AsyncSession, user_id: int, cursor: Optional[str] = None, limit: int = crud.FEED_PAGE_SIZE):
+    """Лента списков от друзей (новые сверху): ([(список, число элементов)], курсор следующей страницы или None)."""
+    result = await db.execute(crud._friends_feed_lists_stmt(user_id, cursor, limit))
+    return pagination.split_page(result.all(), limit, key=lambda row: row[0])
@@ -0,0 +1,69 @@
+"""
+Ограниченный внутрипроцессный LRU-кэш с временем жизни записей.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from . import metrics
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU-кэш на OrderedDict с ограничением размера и TTL. Потокобезопасен.
+    Если передано имя, попадания/промахи и размер публикуются в metrics как cache.<name>.*
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float], name: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        if name:
+            metrics.register_gauge(f"cache.{name}.size", self.__len__)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > now:
+                    self._data.move_to_end(key)
+                    self._record("hits")
+                    return value
+                del self._data[key]
+            self._record("misses")
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _record(self, outcome: str) -> None:
+        if self.name:
+            metrics.inc(f"cache.{self.name}.{outcome}")
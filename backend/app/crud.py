@@ -1,9 +1,15 @@
-from typing import Optional, List as TypingList
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple, List as TypingList
 from uuid import UUID
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import case, or_, select, func, update, delete, false, true, literal, union, union_all
+from sqlalchemy.dialects.postgresql import array, insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 
-from . import models, schemas, security
+from . import models, pagination, schemas, social_graph, ws_manager
 
 # Define default list title for copied items
 DEFAULT_COPY_LIST_TITLE = "Мои сохраненные элементы" 
@@ -11,21 +17,38 @@ DEFAULT_COPY_LIST_TITLE = "Мои сохраненные элементы"
 
 # --- CRUD для Пользователей ---
 
+# Запросы горячих функций собираются отдельно, чтобы их выполняли
+# и синхронный crud, и асинхронный async_crud
+def _user_stmt(user_id: int):
+    return select(models.User).where(models.User.id == user_id)
+
 def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    return db.execute(_user_stmt(user_id)).scalars().first()
+
+def _user_by_email_stmt(email: str):
+    return select(models.User).where(models.User.email == email)
 
 def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+    return db.execute(_user_by_email_stmt(email)).scalars().first()
+
+def _user_by_name_stmt(name: str):
+    return select(models.User).where(models.User.name == name)
+
+def get_user_by_name(db: Session, name: str) -> Optional[models.User]:
+    return db.execute(_user_by_name_stmt(name)).scalars().first()
 
 # --- НОВАЯ ФУНКЦИЯ ДЛЯ ВХОДА ---
-def get_user_by_email_or_name(db: Session, login_identifier: str) -> Optional[models.User]:
-    """Ищет пользователя по email ИЛИ по имени."""
-    return db.query(models.User).filter(
+def _user_by_email_or_name_stmt(login_identifier: str):
+    return select(models.User).where(
         or_(
             models.User.email == login_identifier,
             models.User.name == login_identifier
         )
-    ).first()
+    )
+
+def get_user_by_email_or_name(db: Session, login_identifier: str) -> Optional[models.User]:
+    """Ищет пользователя по email ИЛИ по имени."""
+    return db.execute(_user_by_email_or_name_stmt(login_identifier)).scalars().first()
 
 # --- ИЗМЕНИТЬ ЭТУ ФУНКЦИЮ ---
 def search_users_by_email(db: Session, query: str, current_user_id: int, limit: int = 10):
@@ -39,8 +62,8 @@ def search_users_by_email(db: Session, query: str, current_user_id: int, limit:
     ).limit(limit).all()
 
 # --- ИЗМЕНИТЬ ЭТУ ФУНКЦИЮ ---
-def create_user(db: Session, user: schemas.UserCreate):
-    hashed_password = security.get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str):
+    # Хеш считается заранее в пуле хеширования (await hashing.hash_password), здесь только сохраняется
     # Добавляем user.name при создании
     db_user = models.User(email=user.email, name=user.name, hashed_password=hashed_password)
     db.add(db_user)
@@ -48,62 +71,140 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.refresh(db_user)
     return db_user
 
+# --- CRUD для refresh-токенов ---
+
+def create_refresh_token(db: Session, user_id: int, token_hash: str, expires_at: datetime, family_id: Optional[UUID] = None) -> models.RefreshToken:
+    """Сохранить refresh-токен; без family_id начинается новое семейство (новый вход)."""
+    db_token = models.RefreshToken(
+        user_id=user_id, token_hash=token_hash, expires_at=expires_at, family_id=family_id or uuid.uuid4()
+    )
+    db.add(db_token)
+    db.commit()
+    return db_token
+
+def _refresh_token_by_hash_stmt(token_hash: str):
+    return select(models.RefreshToken).options(
+        joinedload(models.RefreshToken.user)
+    ).where(models.RefreshToken.token_hash == token_hash)
+
+def _revoke_refresh_tokens_stmt(*criteria):
+    return update(models.RefreshToken).where(
+        models.RefreshToken.revoked_at.is_(None), *criteria
+    ).values(revoked_at=datetime.now(timezone.utc))
+
+def rotate_refresh_token(db: Session, token_hash: str, new_token_hash: str, expires_at: datetime) -> Optional[models.User]:
+    """
+    Обменять refresh-токен на новый из того же семейства.
+    Возвращает владельца токена или None, если токен недействителен.
+    Повторное предъявление уже обмененного токена означает утечку — отзывается все семейство.
+    """
+    db_token = db.execute(_refresh_token_by_hash_stmt(token_hash)).scalars().first()
+    if db_token is None:
+        return None
+
+    # Помечаем токен использованным одним UPDATE: из двух параллельных обменов пройдет только один
+    claimed = db.execute(_revoke_refresh_tokens_stmt(models.RefreshToken.id == db_token.id)).rowcount
+    if not claimed:
+        revoke_refresh_token_family(db, family_id=db_token.family_id)
+        return None
+
+    if db_token.expires_at <= datetime.now(timezone.utc) or not db_token.user.is_active:
+        db.commit()
+        return None
+
+    db.add(models.RefreshToken(
+        user_id=db_token.user_id, token_hash=new_token_hash, expires_at=expires_at, family_id=db_token.family_id
+    ))
+    db.commit()
+    return db_token.user
+
+def revoke_refresh_token_family(db: Session, family_id: UUID) -> None:
+    """Отозвать все действующие токены семейства."""
+    db.execute(_revoke_refresh_tokens_stmt(models.RefreshToken.family_id == family_id))
+    db.commit()
+
+def revoke_refresh_token(db: Session, token_hash: str) -> None:
+    """Выход: отозвать семейство, к которому относится токен."""
+    db_token = db.execute(_refresh_token_by_hash_stmt(token_hash)).scalars().first()
+    if db_token is not None:
+        revoke_refresh_token_family(db, family_id=db_token.family_id)
+
 # --- (Задача 4.1) CRUD для Друзей ---
 
 def get_friendship_request(db: Session, request_id: int) -> Optional[models.Friendship]:
     """Получить заявку в друзья по ее ID."""
     return db.query(models.Friendship).filter(models.Friendship.id == request_id).first()
 
+def _friendship_edge(user1_id: int, user2_id: int):
+    # Пара в каноническом порядке (user_low_id, user_high_id)
+    return (user1_id, user2_id) if user1_id < user2_id else (user2_id, user1_id)
+
 def get_existing_friendship(db: Session, user1_id: int, user2_id: int) -> Optional[models.Friendship]:
     """Проверить, существует ли какая-либо связь (заявка или дружба) между двумя пользователями."""
+    user_low_id, user_high_id = _friendship_edge(user1_id, user2_id)
     return db.query(models.Friendship).filter(
-        or_(
-            (models.Friendship.requester_id == user1_id) & (models.Friendship.addressee_id == user2_id),
-            (models.Friendship.requester_id == user2_id) & (models.Friendship.addressee_id == user1_id)
-        )
+        models.Friendship.user_low_id == user_low_id,
+        models.Friendship.user_high_id == user_high_id,
     ).first()
 
-def create_friend_request(db: Session, requester_id: int, addressee_id: int) -> models.Friendship:
-    """Создать новую заявку в друзья."""
-    db_request = models.Friendship(requester_id=requester_id, addressee_id=addressee_id, status=models.FriendshipStatus.PENDING)
+def create_friend_request(
+    db: Session, requester_id: int, addressee_id: int, requester=None
+) -> Optional[Tuple[models.Friendship, "NotificationEvent"]]:
+    """
+    Создать новую заявку в друзья и уведомление получателю (одна транзакция).
+    requester (пользователь) — для сообщения WebSocket в событии.
+    None — связь между пользователями уже есть (встречная заявка).
+    """
+    user_low_id, user_high_id = _friendship_edge(requester_id, addressee_id)
+    db_request = models.Friendship(
+        requester_id=requester_id,
+        addressee_id=addressee_id,
+        user_low_id=user_low_id,
+        user_high_id=user_high_id,
+        status=models.FriendshipStatus.PENDING,
+    )
     db.add(db_request)
-    db.commit()
-    db.refresh(db_request)
-    
-    # Создаем уведомление для получателя
-    create_notification(
-        db,
-        recipient_id=addressee_id,
-        sender_id=requester_id,
-        type=models.NotificationType.FRIEND_REQUEST
-    )
-    # Перезагружаем объект, чтобы подгрузить связь с уведомлением
-    db.refresh(db_request, attribute_names=['addressee'])
-    
-    return db_request # <-- Возвращаем объект Friendship
+    try:
+        # flush уведомления вставляет и заявку: конфликт может всплыть уже здесь
+        event = _add_notification(
+            db,
+            recipient_id=addressee_id,
+            sender_id=requester_id,
+            type=models.NotificationType.FRIEND_REQUEST,
+            sender=requester,
+        )
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    return db_request, event
 
 def update_friendship_status(db: Session, db_friendship: models.Friendship, status: models.FriendshipStatus) -> models.Friendship:
     """Обновить статус заявки (принять/отклонить)."""
+    became_friends = (
+        status == models.FriendshipStatus.ACCEPTED and db_friendship.status != models.FriendshipStatus.ACCEPTED
+    )
     db_friendship.status = status
+    if became_friends:
+        db.flush()
+        _on_friendship_accepted(db, db_friendship.requester_id, db_friendship.addressee_id)
     db.commit()
     db.refresh(db_friendship)
     return db_friendship
 
 def delete_friendship(db: Session, db_friendship: models.Friendship):
     """Удалить дружбу или заявку."""
+    were_friends = db_friendship.status == models.FriendshipStatus.ACCEPTED
+    user1_id, user2_id = db_friendship.requester_id, db_friendship.addressee_id
     db.delete(db_friendship)
+    if were_friends:
+        db.flush()
+        _on_friendship_removed(db, user1_id, user2_id)
     db.commit()
 
 def are_users_friends(db: Session, user1_id: int, user2_id: int) -> bool:
     """Проверяет, являются ли два пользователя друзьями (статус ACCEPTED)."""
-    friendship = db.query(models.Friendship).filter(
-        (models.Friendship.status == models.FriendshipStatus.ACCEPTED) &
-        or_(
-            (models.Friendship.requester_id == user1_id) & (models.Friendship.addressee_id == user2_id),
-            (models.Friendship.requester_id == user2_id) & (models.Friendship.addressee_id == user1_id)
-        )
-    ).first()
-    return friendship is not None
+    return social_graph.are_friends(db, user1_id, user2_id)
 
 def get_all_user_friendships(db: Session, user_id: int) -> TypingList[models.Friendship]:
     """Получить все связи (друзья, заявки) для пользователя."""
@@ -112,13 +213,38 @@ def get_all_user_friendships(db: Session, user_id: int) -> TypingList[models.Fri
         joinedload(models.Friendship.addressee)
     ).filter(
         or_(
-            models.Friendship.requester_id == user_id,
-            models.Friendship.addressee_id == user_id
+            models.Friendship.user_low_id == user_id,
+            models.Friendship.user_high_id == user_id
         )
     ).all()
 
 # --- CRUD для Списков ---
 
+def _visible_lists_stmt(profile_owner_id: int, are_friends: bool):
+    if are_friends:
+        # Если друзья, то разрешаем смотреть 'public' и 'friends_only'
+        levels = (models.PrivacyLevel.PUBLIC, models.PrivacyLevel.FRIENDS_ONLY)
+    else:
+        # Если не друзья, то только 'public'
+        levels = (models.PrivacyLevel.PUBLIC,)
+    return select(models.List).where(
+        models.List.owner_id == profile_owner_id,
+        models.List.privacy_level.in_(levels),
+    )
+
+def _visible_list_versions_stmt(profile_owner_id: int, are_friends: bool):
+    # Для ETag профиля: (id, version) без загрузки самих списков
+    return (
+        _visible_lists_stmt(profile_owner_id, are_friends)
+        .with_only_columns(models.List.id, models.List.version)
+        .order_by(models.List.id)
+    )
+
+def get_visible_list_versions(db: Session, profile_owner_id: int, viewer_id: int):
+    """[(id, version)] списков пользователя, видимых зрителю."""
+    are_friends = are_users_friends(db, user1_id=profile_owner_id, user2_id=viewer_id)
+    return db.execute(_visible_list_versions_stmt(profile_owner_id, are_friends)).all()
+
 # ЗАМЕНЯЕМ get_public_lists_by_user НА ЭТУ ФУНКЦИЮ
 def get_visible_lists_by_user(db: Session, profile_owner_id: int, viewer_id: int):
     """
@@ -128,96 +254,208 @@ def get_visible_lists_by_user(db: Session, profile_owner_id: int, viewer_id: int
     """
     # Сначала проверяем, являются ли пользователи друзьями
     are_friends = are_users_friends(db, user1_id=profile_owner_id, user2_id=viewer_id)
+    return db.execute(_visible_lists_stmt(profile_owner_id, are_friends)).scalars().all()
 
-    query = db.query(models.List).filter(models.List.owner_id == profile_owner_id)
-
-    if are_friends:
-        # Если друзья, то разрешаем смотреть 'public' и 'friends_only'
-        query = query.filter(
-            or_(
-                models.List.privacy_level == models.PrivacyLevel.PUBLIC,
-                models.List.privacy_level == models.PrivacyLevel.FRIENDS_ONLY
-            )
-        )
-    else:
-        # Если не друзья, то только 'public'
-        query = query.filter(models.List.privacy_level == models.PrivacyLevel.PUBLIC)
-
-    return query.all()
-
-def get_list(db: Session, list_id: int) -> Optional[models.List]:
-    """Получить один список по его ID с полной информацией."""
-    # Используем joinedload для оптимизации запросов к связанным таблицам
+def _list_stmt(list_id: int):
+    # selectinload: дочерние коллекции грузятся отдельными пакетными запросами,
+    # без размножения строк одного большого JOIN
     return (
-        db.query(models.List)
+        select(models.List)
         .options(
-            joinedload(models.List.items)
-            .joinedload(models.Item.comments)
+            selectinload(models.List.items)
+            .selectinload(models.Item.comments)
             .joinedload(models.Comment.owner)
         )
-        .options(
-            joinedload(models.List.items)
-            .joinedload(models.Item.likes)
-        )
+        # Лайки не загружаются: счетчики считает get_item_like_stats
         # (Этап 13) Подгружаем данные трекера вместе с элементом
         .options(
-            joinedload(models.List.items)
-            .joinedload(models.Item.goal_tracker)
+            selectinload(models.List.items)
+            .selectinload(models.Item.goal_tracker)
         )
-        .filter(models.List.id == list_id)
-        .first()
+        .where(models.List.id == list_id)
     )
 
+def get_list(db: Session, list_id: int) -> Optional[models.List]:
+    """Получить один список по его ID с полной информацией."""
+    return db.execute(_list_stmt(list_id)).unique().scalars().first()
+
 # Новая функция для получения списка по публичному ключу
+def _list_by_public_key_stmt(public_key: UUID):
+    return (
+        select(models.List)
+        .options(joinedload(models.List.owner)) # <--- ДОБАВЛЕНА ЭТА СТРОКА
+        # Комментарии не загружаются целиком: превью собирает get_comment_previews
+        .options(selectinload(models.List.items))
+        .where(models.List.public_url_key == public_key)
+    )
+
+def _list_version_by_public_key_stmt(public_key: UUID):
+    # Одна строка по уникальному индексу: хватает для проверки кэша ответа
+    return select(models.List.id, models.List.version, models.List.privacy_level).where(
+        models.List.public_url_key == public_key
+    )
+
 def get_list_by_public_key(db: Session, public_key: UUID) -> Optional[models.List]:
     """Получить один список по его публичному UUID ключу с полной информацией."""
+    return db.execute(_list_by_public_key_stmt(public_key)).unique().scalars().first()
+
+def _lists_by_user_stmt(user_id: int, skip: int, limit: int):
+    # selectinload вместо ленивой загрузки: ответ собирается из всех элементов списков,
+    # а в async-сессии ленивая загрузка недоступна
     return (
-        db.query(models.List)
-        .options(joinedload(models.List.owner)) # <--- ДОБАВЛЕНА ЭТА СТРОКА
+        select(models.List)
         .options(
-            joinedload(models.List.items)
-            .joinedload(models.Item.comments)
-            .joinedload(models.Comment.owner)
+            selectinload(models.List.items).selectinload(models.Item.goal_tracker),
         )
-        .options(joinedload(models.List.items).joinedload(models.Item.likes))
-        .filter(models.List.public_url_key == public_key)
-        .first()
+        .where(models.List.owner_id == user_id)
+        .order_by(models.List.id)
+        .offset(skip)
+        .limit(limit)
     )
 
 def get_lists_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> TypingList[models.List]:
     """Получить все списки конкретного пользователя."""
-    return db.query(models.List).filter(models.List.owner_id == user_id).offset(skip).limit(limit).all()
+    return db.execute(_lists_by_user_stmt(user_id, skip, limit)).scalars().all()
+
+# Заголовок списка без элементов; элементы читаются постранично (get_list_items_page)
+def _list_header_stmt(list_id: int):
+    return select(models.List).where(models.List.id == list_id)
+
+def get_list_header(db: Session, list_id: int) -> Optional[models.List]:
+    return db.execute(_list_header_stmt(list_id)).scalars().first()
+
+def _list_items_page_stmt(list_id: int, cursor: Optional[str], limit: int):
+    stmt = (
+        select(models.Item)
+        .options(selectinload(models.Item.goal_tracker))
+        .where(models.Item.list_id == list_id)
+    )
+    # limit + 1: лишняя строка показывает, что есть следующая страница
+    return pagination.after_cursor(stmt, models.Item.created_at, models.Item.id, cursor).limit(limit + 1)
+
+def get_list_items_page(db: Session, list_id: int, cursor: Optional[str] = None, limit: int = pagination.DEFAULT_PAGE_SIZE):
+    """Страница элементов списка в порядке (created_at, id): (элементы, курсор следующей страницы или None)."""
+    items = db.execute(_list_items_page_stmt(list_id, cursor, limit)).scalars().all()
+    return pagination.split_page(items, limit)
+
+# --- Лайки элементов в ответах со списками ---
+
+class LikeStats(NamedTuple):
+    likes_count: int = 0
+    is_liked: bool = False
+
+def _item_like_stats_stmt(item_ids: Iterable[int], user_id: Optional[int]):
+    # Агрегат по индексу likes(item_id, user_id) вместо загрузки всех строк Like
+    is_liked = func.bool_or(models.Like.user_id == user_id) if user_id is not None else false()
+    return (
+        select(
+            models.Like.item_id,
+            func.count().label("likes_count"),
+            is_liked.label("is_liked"),
+        )
+        .where(models.Like.item_id.in_(list(item_ids)))
+        .group_by(models.Like.item_id)
+    )
+
+def _like_stats_from_rows(rows) -> Dict[int, LikeStats]:
+    return {row.item_id: LikeStats(row.likes_count, bool(row.is_liked)) for row in rows}
+
+def get_item_like_stats(db: Session, item_ids: Iterable[int], user_id: Optional[int] = None) -> Dict[int, LikeStats]:
+    """Число лайков и лайкнул ли пользователь — для каждого элемента; элементов без лайков в словаре нет."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+    return _like_stats_from_rows(db.execute(_item_like_stats_stmt(item_ids, user_id)).all())
+
+# Версия списка увеличивается в той же транзакции, что и изменение (без commit).
+# Порядок блокировок: строка lists (увеличение версии) берется раньше строк users
+# (счетчики и номера уведомлений) — иначе удаление и лайк в одном списке могут взаимно заблокироваться.
+# updated_at (onupdate) не трогается: это время правки списка владельцем, а не чужих лайков и броней
+def _bump_list_versions(db: Session, *criteria) -> int:
+    return db.execute(
+        update(models.List).where(*criteria).values(version=models.List.version + 1, updated_at=models.List.updated_at)
+    ).rowcount
+
+def bump_list_version(db: Session, list_id: int, expected_version: Optional[int] = None) -> bool:
+    """
+    Увеличить версию списка. С expected_version — только если версия не изменилась
+    (If-Match): False означает, что список успел измениться в другом запросе.
+    """
+    criteria = [models.List.id == list_id]
+    if expected_version is not None:
+        criteria.append(models.List.version == expected_version)
+    return _bump_list_versions(db, *criteria) == 1
+
+def _bump_item_list_version(db: Session, item_id: int) -> None:
+    _bump_list_versions(db, models.List.id == select(models.Item.list_id).where(models.Item.id == item_id).scalar_subquery())
+
+def _bump_user_activity_list_versions(db: Session, user_id: int) -> None:
+    # Списки пользователя и списки, где видны его комментарии, лайки и брони
+    touched_item_ids = union(
+        select(models.Comment.item_id).where(models.Comment.owner_id == user_id),
+        select(models.Like.item_id).where(models.Like.user_id == user_id),
+        select(models.Reservation.item_id).where(models.Reservation.reserver_id == user_id),
+    )
+    _bump_list_versions(db, or_(
+        models.List.owner_id == user_id,
+        models.List.id.in_(select(models.Item.list_id).where(models.Item.id.in_(touched_item_ids))),
+    ))
 
 def create_user_list(db: Session, list_data: schemas.ListCreate, user_id: int) -> models.List:
     """Создать новый список для пользователя."""
     db_list = models.List(**list_data.dict(), owner_id=user_id)
     db.add(db_list)
+    db.flush()
+    if db_list.privacy_level in FEED_VISIBLE_LEVELS:
+        fan_out_list(db, db_list)
     db.commit()
     db.refresh(db_list)
     return db_list
 
-def update_list(db: Session, db_list: models.List, list_data: schemas.ListUpdate) -> models.List:
-    """Обновить существующий список."""
+def update_list(
+    db: Session, db_list: models.List, list_data: schemas.ListUpdate, expected_version: Optional[int] = None
+) -> Optional[models.List]:
+    """Обновить существующий список. None — версия уже не expected_version (ничего не изменено)."""
+    # Условное увеличение версии первым: при конфликте дальше не идем
+    if not bump_list_version(db, db_list.id, expected_version):
+        db.rollback()
+        return None
     update_data = list_data.dict(exclude_unset=True)
+    was_visible = db_list.privacy_level in FEED_VISIBLE_LEVELS
     for key, value in update_data.items():
         setattr(db_list, key, value)
     db.add(db_list)
+    db.flush()
+    # Смена приватности: список появляется в лентах друзей или убирается из них
+    is_visible = db_list.privacy_level in FEED_VISIBLE_LEVELS
+    if is_visible and not was_visible:
+        fan_out_list(db, db_list)
+    elif was_visible and not is_visible:
+        db.execute(delete(models.FeedEntry).where(models.FeedEntry.list_id == db_list.id))
     db.commit()
     db.refresh(db_list)
     return db_list
 
 def delete_list(db: Session, db_list: models.List):
     """Удалить список."""
+    # Строка списка блокируется до счетчиков пользователей (порядок блокировок — у _bump_list_versions)
+    bump_list_version(db, db_list.id)
+    _forget_unread_notifications(
+        db, models.Notification.related_item_id.in_(select(models.Item.id).where(models.Item.list_id == db_list.id))
+    )
     db.delete(db_list)
     db.commit()
     return db_list
 
 # --- CRUD для Элементов ---
 
+def _item_stmt(item_id: int):
+    # Используем joinedload, чтобы подтянуть список для проверки прав
+    return select(models.Item).options(joinedload(models.Item.list)).where(models.Item.id == item_id)
+
 def get_item(db: Session, item_id: int) -> Optional[models.Item]:
     """Получить один элемент по его ID."""
-    # Используем joinedload, чтобы подтянуть список для проверки прав
-    return db.query(models.Item).options(joinedload(models.Item.list)).filter(models.Item.id == item_id).first()
+    return db.execute(_item_stmt(item_id)).scalars().first()
 
 def create_list_item(db: Session, item_data: schemas.ItemCreate, list_id: int) -> models.Item:
     """Создать новый элемент в списке. Если переданы настройки цели, создать и связать GoalTracker."""
@@ -240,12 +478,18 @@ def create_list_item(db: Session, item_data: schemas.ItemCreate, list_id: int) -
         )
         db.add(db_goal_tracker)
     
+    bump_list_version(db, list_id)
     db.commit()
     db.refresh(db_item) # Обновляем, чтобы подгрузить связи
     return db_item
 
-def update_item(db: Session, db_item: models.Item, item_data: schemas.ItemUpdate) -> models.Item:
-    """Обновить существующий элемент."""
+def update_item(
+    db: Session, db_item: models.Item, item_data: schemas.ItemUpdate, expected_version: Optional[int] = None
+) -> Optional[models.Item]:
+    """Обновить существующий элемент. None — версия списка уже не expected_version."""
+    if not bump_list_version(db, db_item.list_id, expected_version):
+        db.rollback()
+        return None
     update_data = item_data.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_item, key, value)
@@ -254,8 +498,12 @@ def update_item(db: Session, db_item: models.Item, item_data: schemas.ItemUpdate
     db.refresh(db_item)
     return db_item
 
-def delete_item(db: Session, db_item: models.Item):
-    """Удалить элемент."""
+def delete_item(db: Session, db_item: models.Item, expected_version: Optional[int] = None):
+    """Удалить элемент. None — версия списка уже не expected_version."""
+    if not bump_list_version(db, db_item.list_id, expected_version):
+        db.rollback()
+        return None
+    _forget_unread_notifications(db, models.Notification.related_item_id == db_item.id)
     db.delete(db_item)
     db.commit()
     return db_item
@@ -284,30 +532,70 @@ def update_goal_tracker(db: Session, db_tracker: models.GoalTracker, tracker_dat
     for key, value in update_data.items():
         setattr(db_tracker, key, value)
     db.add(db_tracker)
+    _bump_item_list_version(db, db_tracker.item_id)
+    db.commit()
+    db.refresh(db_tracker)
+    return db_tracker
+
+def log_goal_progress(db: Session, db_tracker: models.GoalTracker, value: float) -> models.GoalTracker:
+    """Записать прогресс цели; при достижении цели элемент отмечается выполненным."""
+    db.add(models.GoalLog(tracker_id=db_tracker.id, value_added=value))
+
+    # Прогресс не уходит в минус
+    db_tracker.current_value = max(db_tracker.current_value + value, 0)
+
+    if db_tracker.goal_type == models.GoalType.CUMULATIVE:
+        target = db_tracker.target_value
+    else:
+        target = db_tracker.target_count
+    if target is not None and db_tracker.current_value >= target and not db_tracker.item.is_completed:
+        db_tracker.item.is_completed = True
+
+    # Прогресс и выполнение видны в ответе списка: версия растет в той же транзакции
+    _bump_item_list_version(db, db_tracker.item_id)
     db.commit()
     db.refresh(db_tracker)
     return db_tracker
 
 # --- CRUD для Бронирования ---
 
+def _reservation_by_item_id_stmt(item_id: int):
+    return select(models.Reservation).where(models.Reservation.item_id == item_id)
+
 def get_reservation_by_item_id(db: Session, item_id: int) -> Optional[models.Reservation]:
     """Получить бронирование по ID элемента."""
-    return db.query(models.Reservation).filter(models.Reservation.item_id == item_id).first()
+    return db.execute(_reservation_by_item_id_stmt(item_id)).scalars().first()
+
+def _reserved_item_ids_stmt(item_ids: Iterable[int]):
+    # Один IN-запрос по уникальному индексу reservations(item_id) на все элементы списка
+    return select(models.Reservation.item_id).where(models.Reservation.item_id.in_(list(item_ids)))
+
+def get_reserved_item_ids(db: Session, item_ids: Iterable[int]) -> Set[int]:
+    """Какие из элементов забронированы."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return set()
+    return set(db.execute(_reserved_item_ids_stmt(item_ids)).scalars())
+
+def _reservations_by_user_stmt(user_id: int):
+    return select(models.Reservation).where(models.Reservation.reserver_id == user_id)
 
 def get_reservations_by_user(db: Session, user_id: int) -> TypingList[models.Reservation]:
     """Получить все бронирования пользователя."""
-    return db.query(models.Reservation).filter(models.Reservation.reserver_id == user_id).all()
+    return db.execute(_reservations_by_user_stmt(user_id)).scalars().all()
 
 def create_reservation(db: Session, item: models.Item, user: models.User) -> models.Reservation:
     """Создать новое бронирование."""
     db_reservation = models.Reservation(item_id=item.id, reserver_id=user.id)
     db.add(db_reservation)
+    bump_list_version(db, item.list_id)
     db.commit()
     db.refresh(db_reservation)
     return db_reservation
 
 def delete_reservation(db: Session, db_reservation: models.Reservation):
     """Удалить бронирование."""
+    _bump_item_list_version(db, db_reservation.item_id)
     db.delete(db_reservation)
     db.commit()
     return db_reservation
@@ -318,27 +606,29 @@ def get_like(db: Session, item_id: int, user_id: int) -> Optional[models.Like]:
     """Получить лайк по ID элемента и ID пользователя."""
     return db.query(models.Like).filter(models.Like.item_id == item_id, models.Like.user_id == user_id).first()
 
-def add_like(db: Session, item: models.Item, user: models.User) -> models.Like:
-    """Добавить лайк."""
+def add_like(db: Session, item: models.Item, user: models.User) -> Tuple[models.Like, Optional["NotificationEvent"]]:
+    """Добавить лайк и уведомление владельцу списка (одна транзакция). Уведомления нет, если лайк свой."""
     db_like = models.Like(item_id=item.id, user_id=user.id)
     db.add(db_like)
-    db.commit()
-    db.refresh(db_like) # <-- Добавляем refresh
-
+    # Версия списка до уведомления: lists блокируется раньше users, как при удалении
+    bump_list_version(db, item.list_id)
+    event = None
     if item.list.owner_id != user.id:
-        create_notification(
+        event = _add_notification(
             db,
             recipient_id=item.list.owner_id,
             sender_id=user.id,
             type=models.NotificationType.LIKE,
-            related_item_id=item.id
+            related_item_id=item.id,
+            sender=user,
+            related_list_id=item.list_id,
         )
-        db.refresh(db_like, attribute_names=['item']) # <-- Обновляем связи
-    
-    return db_like # <-- Возвращаем объект
+    db.commit()
+    return db_like, event
 
 def remove_like(db: Session, db_like: models.Like):
     """Удалить лайк."""
+    _bump_item_list_version(db, db_like.item_id)
     db.delete(db_like)
     db.commit()
     return db_like
@@ -349,145 +639,565 @@ def get_comment(db: Session, comment_id: int) -> Optional[models.Comment]:
     """Получить комментарий по его ID."""
     return db.query(models.Comment).filter(models.Comment.id == comment_id).first()
 
-def create_comment(db: Session, comment_data: schemas.CommentCreate, item_id: int, user_id: int) -> models.Comment:
-    """Создать новый комментарий."""
-    db_comment = models.Comment(**comment_data.dict(), item_id=item_id, owner_id=user_id)
-    db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+# Сколько последних комментариев элемента встраивается в ответы со списками
+COMMENT_PREVIEW_SIZE = 3
+
+class CommentPreview(NamedTuple):
+    comments_count: int = 0
+    comments: TypingList[models.Comment] = []
+
+def _comment_previews_stmt(item_ids: Iterable[int], size: int):
+    # Оконные функции: номер комментария от новых к старым и общее число комментариев элемента
+    ranked = (
+        select(
+            models.Comment.id,
+            func.row_number().over(
+                partition_by=models.Comment.item_id,
+                order_by=(models.Comment.created_at.desc(), models.Comment.id.desc()),
+            ).label("position"),
+            func.count().over(partition_by=models.Comment.item_id).label("total"),
+        )
+        .where(models.Comment.item_id.in_(list(item_ids)))
+        .subquery()
+    )
+    return (
+        select(models.Comment, ranked.c.total)
+        .join(ranked, models.Comment.id == ranked.c.id)
+        .options(joinedload(models.Comment.owner))
+        .where(ranked.c.position <= size)
+        .order_by(models.Comment.item_id, models.Comment.created_at, models.Comment.id)
+    )
 
-    # (Новое) Получаем элемент, чтобы узнать владельца
-    item = get_item(db, item_id)
-    # Создаем уведомление для владельца элемента, если это не он сам
-    if item and item.list.owner_id != user_id:
-        create_notification(
+def _comment_previews_from_rows(rows) -> Dict[int, CommentPreview]:
+    previews: Dict[int, CommentPreview] = {}
+    for comment, total in rows:
+        previews.setdefault(comment.item_id, CommentPreview(total, [])).comments.append(comment)
+    return previews
+
+def get_comment_previews(db: Session, item_ids: Iterable[int], size: int = COMMENT_PREVIEW_SIZE) -> Dict[int, CommentPreview]:
+    """Число комментариев и последние size комментариев для каждого элемента; элементов без комментариев в словаре нет."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return {}
+    return _comment_previews_from_rows(db.execute(_comment_previews_stmt(item_ids, size)).all())
+
+def _item_comments_page_stmt(item_id: int, cursor: Optional[str], limit: int):
+    stmt = (
+        select(models.Comment)
+        .options(joinedload(models.Comment.owner))
+        .where(models.Comment.item_id == item_id)
+    )
+    return pagination.after_cursor(
+        stmt, models.Comment.created_at, models.Comment.id, cursor, descending=True
+    ).limit(limit + 1)
+
+def get_item_comments_page(db: Session, item_id: int, cursor: Optional[str] = None, limit: int = pagination.DEFAULT_PAGE_SIZE):
+    """Страница комментариев элемента, от новых к старым: (комментарии, курсор следующей страницы или None)."""
+    comments = db.execute(_item_comments_page_stmt(item_id, cursor, limit)).scalars().all()
+    return pagination.split_page(comments, limit)
+
+def create_comment(
+    db: Session, comment_data: schemas.CommentCreate, item: models.Item, user_id: int, user=None
+) -> Tuple[models.Comment, Optional["NotificationEvent"]]:
+    """
+    Создать комментарий и уведомление владельцу списка (одна транзакция). Уведомления нет, если комментарий свой.
+    user (автор) — для сообщения WebSocket в событии.
+    """
+    db_comment = models.Comment(**comment_data.dict(), item_id=item.id, owner_id=user_id)
+    db.add(db_comment)
+    # Версия списка до уведомления: lists блокируется раньше users, как при удалении
+    bump_list_version(db, item.list_id)
+    event = None
+    if item.list.owner_id != user_id:
+        event = _add_notification(
             db,
             recipient_id=item.list.owner_id,
             sender_id=user_id,
             type=models.NotificationType.COMMENT,
-            related_item_id=item.id
+            related_item_id=item.id,
+            sender=user,
+            related_list_id=item.list_id,
         )
-        db.refresh(db_comment, attribute_names=['item']) # <-- Обновляем связи
-
-    return db_comment
+    db.commit()
+    db.refresh(db_comment)
+    return db_comment, event
 
 def delete_comment(db: Session, db_comment: models.Comment):
     """Удалить комментарий."""
+    _bump_item_list_version(db, db_comment.item_id)
     db.delete(db_comment)
     db.commit()
     return db_comment
 
 # --- (Новое) CRUD для Уведомлений ---
 
-def create_notification(db: Session, recipient_id: int, sender_id: int, type: models.NotificationType, related_item_id: Optional[int] = None):
-    """Создать новое уведомление (без отправки WS)."""
+# Счетчик непрочитанных (users.unread_notifications_count) меняется в транзакции изменения уведомлений
+def _change_unread_count_stmt(user_id: int, delta):
+    return (
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(unread_notifications_count=models.User.unread_notifications_count + delta)
+        .returning(models.User.unread_notifications_count)
+        .execution_options(synchronize_session=False)
+    )
+
+def _forget_unread_notifications(db: Session, *criteria) -> None:
+    # Непрочитанные уведомления, которые удаляются каскадом (related_item ON DELETE CASCADE), уходят из счетчиков
+    unread = (
+        select(models.Notification.recipient_id, func.count(models.Notification.id).label("total"))
+        .where(models.Notification.is_read == False, *criteria)
+        .group_by(models.Notification.recipient_id)
+        .subquery()
+    )
+    db.execute(
+        update(models.User)
+        .where(models.User.id == unread.c.recipient_id)
+        .values(unread_notifications_count=models.User.unread_notifications_count - unread.c.total)
+        .execution_options(synchronize_session=False)
+    )
+
+def _next_notification_seq_stmt(user_id: int):
+    return (
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(notification_seq=models.User.notification_seq + 1)
+        .returning(models.User.notification_seq)
+        .execution_options(synchronize_session=False)
+    )
+
+# Лайки и комментарии к одному элементу за окно (секунды) копятся в одной непрочитанной строке
+NOTIFICATION_COALESCE_WINDOW = int(os.environ.get("NOTIFICATION_COALESCE_WINDOW", "3600"))
+COALESCED_NOTIFICATION_TYPES = (models.NotificationType.LIKE, models.NotificationType.COMMENT)
+# Сколько последних участников хранится в recent_actor_ids
+NOTIFICATION_RECENT_ACTORS = 3
+# Попыток вставить или дополнить открытую строку окна; дальше пишется отдельное уведомление
+NOTIFICATION_COALESCE_ATTEMPTS = 3
+
+class NotificationEvent(NamedTuple):
+    notification: models.Notification
+    # False — действие добавлено к уже существующему уведомлению
+    created: bool
+    # Сообщение WebSocket, собранное в транзакции записи (если известен отправитель)
+    message: Optional[ws_manager.NotificationMessage] = None
+
+def _coalesce_window_start(bucket: int) -> datetime:
+    # created_at (ключ партиции) — начало окна: одинаков у всех действий окна и не меняется
+    return datetime.fromtimestamp(bucket * NOTIFICATION_COALESCE_WINDOW, tz=timezone.utc)
+
+def _open_coalesced_notification_stmt(recipient_id: int, sender_id: int, type: models.NotificationType, related_item_id: int, bucket: int, event_seq: int):
+    """Новая строка окна; если открытая (непрочитанная) уже есть — ничего не вставляет."""
+    notification = models.Notification
+    return pg_insert(notification).values(
+        recipient_id=recipient_id,
+        sender_id=sender_id,
+        type=type,
+        related_item_id=related_item_id,
+        coalesce_bucket=bucket,
+        created_at=_coalesce_window_start(bucket),
+        actor_count=1,
+        recent_actor_ids=[sender_id],
+        event_seq=event_seq,
+    ).on_conflict_do_nothing(
+        index_elements=[
+            notification.recipient_id, notification.type, notification.related_item_id,
+            notification.coalesce_bucket, notification.created_at,
+        ],
+        index_where=(notification.is_read == False) & notification.coalesce_bucket.isnot(None),
+    ).returning(notification)
+
+def _merge_coalesced_notification_stmt(recipient_id: int, sender_id: int, type: models.NotificationType, related_item_id: int, bucket: int, event_seq: int):
+    """Добавить действие к открытой строке окна."""
+    notification = models.Notification
+    return (
+        update(notification)
+        .where(
+            notification.recipient_id == recipient_id,
+            notification.type == type,
+            notification.related_item_id == related_item_id,
+            notification.coalesce_bucket == bucket,
+            notification.created_at == _coalesce_window_start(bucket),
+            notification.is_read == False,
+        )
+        .values(
+            sender_id=sender_id,
+            updated_at=func.now(),
+            event_seq=event_seq,
+            # Повторное действие одного из последних участников не увеличивает число участников
+            actor_count=notification.actor_count + case((notification.recent_actor_ids.any(sender_id), 0), else_=1),
+            recent_actor_ids=(array([literal(sender_id)]) + func.array_remove(notification.recent_actor_ids, sender_id, type_=notification.recent_actor_ids.type))[1:NOTIFICATION_RECENT_ACTORS],
+        )
+        .returning(notification)
+        .execution_options(synchronize_session=False)
+    )
+
+def _new_notification(db: Session, recipient_id: int, sender_id: int, type: models.NotificationType, related_item_id: Optional[int], event_seq: int) -> models.Notification:
+    """Отдельная (не схлопываемая) строка уведомления."""
     db_notification = models.Notification(
         recipient_id=recipient_id,
         sender_id=sender_id,
         type=type,
-        related_item_id=related_item_id
+        related_item_id=related_item_id,
+        recent_actor_ids=[sender_id],
+        event_seq=event_seq,
     )
     db.add(db_notification)
+    return db_notification
+
+def _coalesce_notification(db: Session, recipient_id: int, sender_id: int, type: models.NotificationType, related_item_id: int, event_seq: int) -> NotificationEvent:
+    # Одним INSERT ... ON CONFLICT DO UPDATE не обойтись: у партиционированной таблицы RETURNING
+    # не отдает xmax, и не отличить вставку от обновления. Вставка или добавление к открытой строке;
+    # если ее между шагами прочитали (is_read), следующая попытка вставит новую
+    bucket = int(time.time() // NOTIFICATION_COALESCE_WINDOW)
+    args = (recipient_id, sender_id, type, related_item_id, bucket, event_seq)
+    options = {"populate_existing": True}
+    for _ in range(NOTIFICATION_COALESCE_ATTEMPTS):
+        db_notification = db.scalars(_open_coalesced_notification_stmt(*args), execution_options=options).one_or_none()
+        if db_notification is not None:
+            return NotificationEvent(db_notification, True)
+        db_notification = db.scalars(_merge_coalesced_notification_stmt(*args), execution_options=options).one_or_none()
+        if db_notification is not None:
+            return NotificationEvent(db_notification, False)
+    # Строку окна раз за разом читают между шагами: действие не теряется, а пишется отдельно
+    return NotificationEvent(_new_notification(db, recipient_id, sender_id, type, related_item_id, event_seq), True)
+
+def _add_notification(
+    db: Session,
+    recipient_id: int,
+    sender_id: int,
+    type: models.NotificationType,
+    related_item_id: Optional[int] = None,
+    sender=None,
+    related_list_id: Optional[int] = None,
+) -> NotificationEvent:
+    """
+    Без commit: уведомление пишется в транзакции действия, которое его вызвало.
+    С sender (отправитель) в событие кладется готовое сообщение WebSocket.
+    """
+    # Номер события выдается первым: строка пользователя блокируется до commit, и события
+    # получателя фиксируются в порядке номеров — клиент с last_event_id ничего не пропустит.
+    # Строку списка вызывающий код блокирует раньше (порядок блокировок — у _bump_list_versions)
+    event_seq = db.execute(_next_notification_seq_stmt(recipient_id)).scalar_one()
+    if type in COALESCED_NOTIFICATION_TYPES and related_item_id is not None:
+        event = _coalesce_notification(db, recipient_id, sender_id, type, related_item_id, event_seq)
+    else:
+        event = NotificationEvent(_new_notification(db, recipient_id, sender_id, type, related_item_id, event_seq), True)
+    # Счетчик непрочитанных растет только на новую строку
+    if event.created:
+        db.execute(_change_unread_count_stmt(recipient_id, 1))
+    if sender is None:
+        return event
+    # id и серверные значения приходят из RETURNING; после commit строка уже не читается
+    db.flush()
+    message = ws_manager.encode_notification(event.notification, sender, related_list_id, merged=not event.created)
+    return event._replace(message=message)
+
+def create_notification(db: Session, recipient_id: int, sender_id: int, type: models.NotificationType, related_item_id: Optional[int] = None):
+    """Создать новое уведомление или добавить действие к схлопнутому (без отправки WS)."""
+    db_notification = _add_notification(db, recipient_id, sender_id, type, related_item_id).notification
     db.commit()
     db.refresh(db_notification)
     return db_notification
 
+# Список уведомлений читает только последние партиции: старше горизонта уведомления не показываются
+NOTIFICATION_LIST_HORIZON_DAYS = int(os.environ.get("NOTIFICATION_LIST_HORIZON_DAYS", "90"))
+
+def _notifications_horizon():
+    return models.Notification.created_at >= datetime.now(timezone.utc) - timedelta(days=NOTIFICATION_LIST_HORIZON_DAYS)
+
+def _notifications_for_user_stmt(user_id: int, limit: int):
+    return select(models.Notification).options(
+        joinedload(models.Notification.sender),
+        # related_item нужен роутеру для related_list_id
+        joinedload(models.Notification.related_item)
+    ).where(
+        models.Notification.recipient_id == user_id,
+        _notifications_horizon(),
+    ).order_by(models.Notification.updated_at.desc(), models.Notification.id.desc()).limit(limit)
+
 def get_notifications_for_user(db: Session, user_id: int, limit: int = 20) -> TypingList[models.Notification]:
     """Получить все уведомления для пользователя, отсортированные по дате."""
-    return db.query(models.Notification).options(
-        joinedload(models.Notification.sender)
-    ).filter(
-        models.Notification.recipient_id == user_id
-    ).order_by(models.Notification.created_at.desc()).limit(limit).all()
+    return db.execute(_notifications_for_user_stmt(user_id, limit)).scalars().all()
+
+# Сколько пропущенных событий повторяется при переподключении WebSocket; больше — клиент перечитывает список
+NOTIFICATION_REPLAY_LIMIT = int(os.environ.get("NOTIFICATION_REPLAY_LIMIT", "100"))
+
+def _notification_events_since_stmt(user_id: int, last_event_id: int, limit: int):
+    # Диапазон по (recipient_id, event_seq) в последних партициях; у схлопнутой строки — только ее последнее событие.
+    # До limit строк в произвольном порядке отправителей: selectinload догружает их по ключу, без соединения с users
+    return select(models.Notification).options(
+        selectinload(models.Notification.sender),
+        selectinload(models.Notification.related_item),
+    ).where(
+        models.Notification.recipient_id == user_id,
+        models.Notification.event_seq > last_event_id,
+        _notifications_horizon(),
+    ).order_by(models.Notification.event_seq).limit(limit)
 
-def count_unread_notifications(db: Session, user_id: int) -> int:
-    """Подсчитать количество непрочитанных уведомлений."""
-    return db.query(models.Notification).filter(
+def get_notification_events_since(db: Session, user_id: int, last_event_id: int, limit: int = NOTIFICATION_REPLAY_LIMIT) -> TypingList[models.Notification]:
+    """Уведомления, измененные после события last_event_id, в порядке событий."""
+    return db.execute(_notification_events_since_stmt(user_id, last_event_id, limit)).scalars().all()
+
+def _mark_notifications_read_stmt(user_id: int, *criteria):
+    # Условие is_read == False в самом UPDATE: параллельные запросы не вычтут одно уведомление дважды
+    return (
+        update(models.Notification)
+        .where(models.Notification.recipient_id == user_id, models.Notification.is_read == False, *criteria)
+        .values(is_read=True)
+    )
+
+def _count_unread_notifications_stmt(user_id: int):
+    return select(func.count(models.Notification.id)).where(
         models.Notification.recipient_id == user_id,
         models.Notification.is_read == False
-    ).count()
+    )
 
-def mark_notification_as_read(db: Session, notification_id: int, user_id: int) -> Optional[models.Notification]:
-    """Пометить уведомление как прочитанное."""
-    db_notification = db.query(models.Notification).filter(
+def _notifications_version_stmt(user_id: int):
+    # Для ETag уведомлений: последнее уведомление и счетчик непрочитанных — без подсчета строк.
+    # updated_at входит в версию: схлопнутое уведомление обновляется на месте и поднимается наверх
+    latest = (
+        select(models.Notification.id, models.Notification.updated_at)
+        .where(models.Notification.recipient_id == user_id, _notifications_horizon())
+        .order_by(models.Notification.updated_at.desc(), models.Notification.id.desc())
+        .limit(1)
+        .subquery()
+    )
+    return (
+        select(latest.c.id, latest.c.updated_at, models.User.unread_notifications_count)
+        .select_from(models.User)
+        .outerjoin(latest, true())
+        .where(models.User.id == user_id)
+    )
+
+def count_unread_notifications(db: Session, user_id: int) -> int:
+    """Подсчитать количество непрочитанных уведомлений."""
+    return db.execute(_count_unread_notifications_stmt(user_id)).scalar_one()
+
+def _user_notification_stmt(notification_id: int, user_id: int):
+    # sender нужен для ответа NotificationRead
+    return select(models.Notification).options(
+        joinedload(models.Notification.sender)
+    ).where(
         models.Notification.id == notification_id,
         models.Notification.recipient_id == user_id
-    ).first()
+    )
+
+def mark_notification_as_read(db: Session, notification_id: int, user_id: int) -> Optional[Tuple[models.Notification, int]]:
+    """Пометить уведомление как прочитанное: (уведомление, новый счетчик непрочитанных) или None."""
+    db_notification = db.execute(_user_notification_stmt(notification_id, user_id)).scalars().first()
 
     if db_notification and not db_notification.is_read:
-        db_notification.is_read = True
-        db.commit()
-        db.refresh(db_notification)
-        return db_notification
+        if db.execute(_mark_notifications_read_stmt(user_id, models.Notification.id == notification_id)).rowcount:
+            unread_count = db.execute(_change_unread_count_stmt(user_id, -1)).scalar_one()
+            db.commit()
+            db.refresh(db_notification)
+            return db_notification, unread_count
+        db.rollback()
     return None
 
+def mark_all_notifications_as_read(db: Session, user_id: int) -> int:
+    """Пометить все уведомления пользователя прочитанными. Возвращает новое значение счетчика непрочитанных."""
+    marked = db.execute(_mark_notifications_read_stmt(user_id)).rowcount
+    unread_count = db.execute(_change_unread_count_stmt(user_id, -marked)).scalar_one()
+    db.commit()
+    return unread_count
+
 # --- (Этап 11) CRUD для Ленты ---
-def get_friends_feed_lists(db: Session, user_id: int, skip: int = 0, limit: int = 10) -> TypingList[models.List]:
-    """
-    Получает ленту списков от друзей пользователя.
-    Включает публичные списки и списки "только для друзей".
-    Сортировка по дате создания (новые сверху).
-    """
-    # 1. Найти всех друзей пользователя
-    friendships = db.query(models.Friendship).filter(
-        (models.Friendship.status == models.FriendshipStatus.ACCEPTED) &
-        or_(
-            models.Friendship.requester_id == user_id,
-            models.Friendship.addressee_id == user_id
-        )
-    ).all()
 
-    friend_ids = set()
-    for fs in friendships:
-        if fs.requester_id == user_id:
-            friend_ids.add(fs.addressee_id)
-        else:
-            friend_ids.add(fs.requester_id)
+FEED_PAGE_SIZE = 10
+# Списки, которые видят друзья владельца
+FEED_VISIBLE_LEVELS = (models.PrivacyLevel.PUBLIC, models.PrivacyLevel.FRIENDS_ONLY)
+# Авторы с большим числом друзей не раскладывают списки по лентам (fan-out on write),
+# их списки подмешиваются при чтении ленты (fan-out on read)
+FEED_FANOUT_MAX_FRIENDS = int(os.environ.get("FEED_FANOUT_MAX_FRIENDS", "500"))
+
+def _is_fanout_author(db: Session, user_id: int) -> bool:
+    friends_count = db.execute(select(models.User.friends_count).where(models.User.id == user_id)).scalar()
+    return (friends_count or 0) <= FEED_FANOUT_MAX_FRIENDS
+
+def _insert_feed_entries(select_stmt):
+    # (user_id, list_id, owner_id, created_at) из select_stmt; уже существующие записи пропускаются
+    return pg_insert(models.FeedEntry).from_select(
+        ["user_id", "list_id", "owner_id", "created_at"], select_stmt
+    ).on_conflict_do_nothing()
+
+def fan_out_list(db: Session, db_list: models.List) -> None:
+    """Разложить список по лентам всех друзей владельца (без commit)."""
+    if not _is_fanout_author(db, db_list.owner_id):
+        return
+    friend_ids = social_graph.friend_ids_stmt(db_list.owner_id).subquery()
+    db.execute(_insert_feed_entries(
+        select(friend_ids.c[0], models.List.id, models.List.owner_id, models.List.created_at)
+        .select_from(friend_ids)
+        .join(models.List, models.List.id == db_list.id)
+    ))
+
+def _backfill_feed(db: Session, reader_id: int, author_id: int) -> None:
+    # Новый друг: видимые списки автора попадают в ленту читателя
+    if not _is_fanout_author(db, author_id):
+        return
+    db.execute(_insert_feed_entries(
+        select(literal(reader_id), models.List.id, models.List.owner_id, models.List.created_at)
+        .where(models.List.owner_id == author_id, models.List.privacy_level.in_(FEED_VISIBLE_LEVELS))
+    ))
+
+def _fan_out_author(db: Session, author_id: int) -> None:
+    # Все видимые списки автора — в ленты всех его друзей
+    friend_ids = social_graph.friend_ids_stmt(author_id).subquery()
+    db.execute(_insert_feed_entries(
+        select(friend_ids.c[0], models.List.id, models.List.owner_id, models.List.created_at)
+        .select_from(friend_ids)
+        .join(models.List, models.List.owner_id == author_id)
+        .where(models.List.privacy_level.in_(FEED_VISIBLE_LEVELS))
+    ))
+
+def _change_friends_count(db: Session, user_ids, delta: int) -> None:
+    db.execute(
+        update(models.User)
+        .where(models.User.id.in_(user_ids))
+        .values(friends_count=models.User.friends_count + delta)
+        .execution_options(synchronize_session=False)
+    )
 
-    if not friend_ids:
-        return []
+def _on_friendship_accepted(db: Session, user1_id: int, user2_id: int) -> None:
+    _change_friends_count(db, [user1_id, user2_id], 1)
+    _backfill_feed(db, reader_id=user1_id, author_id=user2_id)
+    _backfill_feed(db, reader_id=user2_id, author_id=user1_id)
 
-    # 2. Найти все списки этих друзей, которые являются public или friends_only
-    lists = db.query(models.List).options(
-        joinedload(models.List.owner),
-        joinedload(models.List.items) # Загружаем элементы, чтобы посчитать их
-    ).filter(
-        models.List.owner_id.in_(friend_ids),
+def _on_friendship_removed(db: Session, user1_id: int, user2_id: int) -> None:
+    _change_friends_count(db, [user1_id, user2_id], -1)
+    db.execute(delete(models.FeedEntry).where(
         or_(
-            models.List.privacy_level == models.PrivacyLevel.PUBLIC,
-            models.List.privacy_level == models.PrivacyLevel.FRIENDS_ONLY
+            (models.FeedEntry.user_id == user1_id) & (models.FeedEntry.owner_id == user2_id),
+            (models.FeedEntry.user_id == user2_id) & (models.FeedEntry.owner_id == user1_id),
         )
-    ).order_by(
-        models.List.created_at.desc()
-    ).offset(
-        skip
-    ).limit(
-        limit
-    ).all()
+    ))
+    # Автор опустился до порога: дальше его списки раскладываются по лентам,
+    # поэтому уже существующие нужно разложить сейчас
+    for user_id in (user1_id, user2_id):
+        friends_count = db.execute(select(models.User.friends_count).where(models.User.id == user_id)).scalar()
+        if friends_count == FEED_FANOUT_MAX_FRIENDS:
+            _fan_out_author(db, user_id)
+
+def rebuild_feed_entries(db: Session) -> None:
+    """Заполнить ленты по текущим дружбам и спискам (первичное заполнение или восстановление)."""
+    authors = select(models.User.id).where(models.User.friends_count <= FEED_FANOUT_MAX_FRIENDS)
+    for direction in (
+        (models.Friendship.user_low_id, models.Friendship.user_high_id),
+        (models.Friendship.user_high_id, models.Friendship.user_low_id),
+    ):
+        reader_id, author_id = direction
+        db.execute(_insert_feed_entries(
+            select(reader_id, models.List.id, models.List.owner_id, models.List.created_at)
+            .select_from(models.Friendship)
+            .join(models.List, models.List.owner_id == author_id)
+            .where(
+                models.Friendship.status == models.FriendshipStatus.ACCEPTED,
+                models.List.privacy_level.in_(FEED_VISIBLE_LEVELS),
+                author_id.in_(authors),
+            )
+        ))
+    db.commit()
 
-    return lists
+def _friends_feed_page(user_id: int, cursor: Optional[str], limit: int):
+    """Подзапрос (list_id, created_at) страницы ленты."""
+    # Каждая ветка сама отрезает свою страницу по индексу, объединяется не больше 2 * (limit + 1) строк
+    def page(stmt, created_at_column, id_column):
+        return pagination.after_cursor(stmt, created_at_column, id_column, cursor, descending=True).limit(limit + 1)
+
+    # 1. Материализованная лента: диапазон по (user_id, created_at, list_id)
+    timeline = page(
+        select(models.FeedEntry.list_id.label("list_id"), models.FeedEntry.created_at.label("created_at"))
+        .where(models.FeedEntry.user_id == user_id),
+        models.FeedEntry.created_at, models.FeedEntry.list_id,
+    )
+    # 2. Списки друзей, которые не раскладываются по лентам (слишком много друзей)
+    heavy_friend_ids = select(models.User.id).where(
+        models.User.id.in_(social_graph.friend_ids_stmt(user_id)),
+        models.User.friends_count > FEED_FANOUT_MAX_FRIENDS,
+    )
+    pulled = page(
+        select(models.List.id.label("list_id"), models.List.created_at.label("created_at"))
+        .where(models.List.owner_id.in_(heavy_friend_ids), models.List.privacy_level.in_(FEED_VISIBLE_LEVELS)),
+        models.List.created_at, models.List.id,
+    )
+    return union(timeline, pulled).subquery()
+
+def _friends_feed_lists_stmt(user_id: int, cursor: Optional[str], limit: int):
+    feed = _friends_feed_page(user_id, cursor, limit)
+
+    # Число элементов — коррелированный агрегат, сами элементы не загружаются
+    items_count = (
+        select(func.count(models.Item.id))
+        .where(models.Item.list_id == models.List.id)
+        .correlate(models.List)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(models.List, items_count.label("items_count"))
+        .join(feed, models.List.id == feed.c.list_id)
+        .options(joinedload(models.List.owner))
+        .where(models.List.privacy_level.in_(FEED_VISIBLE_LEVELS))
+    )
+    # Новые сверху; limit + 1 — признак следующей страницы
+    return pagination.after_cursor(
+        stmt, feed.c.created_at, feed.c.list_id, None, descending=True
+    ).limit(limit + 1)
+
+def get_friends_feed_lists(db: Session, user_id: int, cursor: Optional[str] = None, limit: int = FEED_PAGE_SIZE):
+    """
+    Получает ленту списков от друзей пользователя.
+    Включает публичные списки и списки "только для друзей".
+    Сортировка по дате создания (новые сверху).
+    Возвращает ([(список, число элементов)], курсор следующей страницы или None).
+    """
+    rows = db.execute(_friends_feed_lists_stmt(user_id, cursor, limit)).all()
+    return pagination.split_page(rows, limit, key=lambda row: row[0])
 
 # --- CRUD для Настроек пользователя ---
 
-def update_user_password(db: Session, db_user: models.User, new_password: str):
-    """Обновляет пароль пользователя."""
-    hashed_password = security.get_password_hash(new_password)
+def update_user_password(db: Session, db_user: models.User, hashed_password: str):
+    """Сохраняет хеш нового пароля (посчитанный в пуле хеширования) и отзывает ранее выданные токены."""
     db_user.hashed_password = hashed_password
+    db_user.token_version += 1
     db.add(db_user)
+    # Вместе с access-токенами отзываются и все refresh-токены
+    db.execute(_revoke_refresh_tokens_stmt(models.RefreshToken.user_id == db_user.id))
     db.commit()
     db.refresh(db_user)
     return db_user
 
+def update_user_password_hash(db: Session, db_user: models.User, hashed_password: str):
+    """Пересохраняет хеш того же пароля (смена стоимости хеширования); токены остаются действительными."""
+    db_user.hashed_password = hashed_password
+    db.add(db_user)
+    db.commit()
+    return db_user
+
 def update_user_email(db: Session, db_user: models.User, new_email: str):
     """Обновляет email пользователя."""
     db_user.email = new_email
     db.add(db_user)
+    # email владельца и комментаторов входит в публичные ответы списков
+    _bump_user_activity_list_versions(db, db_user.id)
     db.commit()
     db.refresh(db_user)
     return db_user
 
 def delete_user(db: Session, db_user: models.User):
     """Удаляет пользователя."""
+    user_id = db_user.id
+    # Вместе с пользователем исчезают его комментарии, лайки и брони в чужих списках
+    _bump_user_activity_list_versions(db, user_id)
+    # Дружбы удаляются каскадом: у каждого друга те же изменения, что в delete_friendship
+    friend_ids = db.execute(social_graph.friend_ids_stmt(user_id)).scalars().all()
+    # Уведомления, отправленные пользователем (заявки в друзья, лайки), уходят из чужих счетчиков
+    sent = models.Notification.sender_id == user_id
+    _forget_unread_notifications(db, sent)
+    db.execute(delete(models.Notification).where(sent).execution_options(synchronize_session=False))
     db.delete(db_user)
+    db.flush()
+    for friend_id in friend_ids:
+        _on_friendship_removed(db, user_id, friend_id)
     db.commit()
+    social_graph.invalidate(user_id, *friend_ids)
     return db_user
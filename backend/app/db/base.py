@@ -1,6 +1,11 @@
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 import os
+import random
+import uuid
+
+from .pool import InstrumentedQueuePool, InstrumentedAsyncQueuePool, register_pool_metrics
 
 # Формируем URL подключения к БД на основе переменных окружения
 DB_USER = os.environ.get("POSTGRES_USER")
@@ -12,15 +17,116 @@ DB_NAME = os.environ.get("POSTGRES_DB")
 if not all([DB_USER, DB_PASS, DB_HOST, DB_NAME]):
     raise EnvironmentError("Database configuration variables are missing or incomplete.")
 
-SQLALCHEMY_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
+# Реплики для чтения: хосты через запятую (host или host:port), учетные данные и БД те же
+DB_REPLICA_HOSTS = [host.strip() for host in os.environ.get("POSTGRES_REPLICA_SERVERS", "").split(",") if host.strip()]
+
+# Настройки пула соединений (на каждый движок)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Сколько секунд после успешной записи клиент читает только с primary (отставание реплик)
+DB_READ_AFTER_WRITE_SECONDS = float(os.environ.get("DB_READ_AFTER_WRITE_SECONDS", "5"))
+# Работа через PgBouncer в transaction mode: никакого состояния на уровне серверной сессии
+DB_PGBOUNCER = os.environ.get("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+
+def _database_url(host: str, driver: str = "postgresql") -> str:
+    return f"{driver}://{DB_USER}:{DB_PASS}@{host}/{DB_NAME}"
+
+SQLALCHEMY_DATABASE_URL = _database_url(DB_HOST)
+# LISTEN (рассылка WebSocket между воркерами) требует сессионного соединения:
+# при PgBouncer в transaction mode сюда указывается Postgres напрямую
+DB_LISTEN_HOST = os.environ.get("POSTGRES_LISTEN_SERVER") or DB_HOST
+LISTEN_DATABASE_URL = _database_url(DB_LISTEN_HOST)
+# Асинхронный драйвер asyncpg для async-эндпоинтов
+SQLALCHEMY_ASYNC_DATABASE_URL = _database_url(DB_HOST, "postgresql+asyncpg")
+
+
+def _pool_options() -> dict:
+    return dict(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+def _make_engine(url: str, label: str):
+    db_engine = create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        **_pool_options()
+    )
+    register_pool_metrics(db_engine, label)
+    return db_engine
+
+def _make_async_engine(url: str, label: str):
+    connect_args = {}
+    if DB_PGBOUNCER:
+        # PgBouncer в transaction mode отдает каждую транзакцию любому серверному соединению,
+        # поэтому кэш подготовленных выражений asyncpg отключается, а имена делаются уникальными
+        url += "?prepared_statement_cache_size=0"
+        connect_args = {
+            "statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    db_engine = create_async_engine(
+        url,
+        poolclass=InstrumentedAsyncQueuePool,
+        connect_args=connect_args,
+        **_pool_options()
+    )
+    register_pool_metrics(db_engine, label)
+    return db_engine
+
 
 # Создаем движок SQLAlchemy
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL
-)
+engine = _make_engine(SQLALCHEMY_DATABASE_URL, "primary")
+replica_engines = [
+    _make_engine(_database_url(host), f"replica-{i}") for i, host in enumerate(DB_REPLICA_HOSTS)
+]
+
+# Асинхронные движки.
+# Синхронный путь (engine/get_db) остается для остальных роутеров и для сравнения под нагрузкой.
+async_engine = _make_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, "primary-async")
+async_replica_engines = [
+    _make_async_engine(_database_url(host, "postgresql+asyncpg"), f"replica-{i}-async")
+    for i, host in enumerate(DB_REPLICA_HOSTS)
+]
+
+
+class RoutingSession(Session):
+    """
+    Сессия, выбирающая движок на каждый запрос к БД.
+    Read-only сессии (info["read_only"], выставляется зависимостями get_read_db/get_async_read_db)
+    читают с реплик; запись, flush и все остальные сессии идут на primary.
+    """
+    primary_engine = engine
+    replica_engines = replica_engines
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self._flushing:
+            # После первой записи сессия до конца читает с primary (read-your-writes)
+            self.info["read_only"] = False
+        if self.info.get("read_only") and self.replica_engines:
+            # Одна реплика на всю сессию, чтобы не держать соединения из нескольких пулов
+            if "replica" not in self.info:
+                self.info["replica"] = random.choice(self.replica_engines)
+            return self.info["replica"]
+        return self.primary_engine
+
+class AsyncRoutingSession(RoutingSession):
+    # AsyncSession работает поверх синхронной сессии, которой нужны sync_engine асинхронных движков
+    primary_engine = async_engine.sync_engine
+    replica_engines = [e.sync_engine for e in async_replica_engines]
+
 
 # Создаем сессию
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+
+# expire_on_commit=False: после commit объекты не должны лениво догружаться вне greenlet
+AsyncSessionLocal = async_sessionmaker(sync_session_class=AsyncRoutingSession, autoflush=False, expire_on_commit=False)
 
 # Создаем базовый класс для моделей
 Base = declarative_base()
@@ -31,4 +137,14 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Асинхронный аналог get_db для async-эндпоинтов
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Фабрика сессий для долгоживущих обработчиков (WebSocket): сессия открывается на время запроса к БД,
+# а не на все время соединения, как у get_async_db
+def get_async_session_factory():
+    return AsyncSessionLocal
@@ -0,0 +1,95 @@
+"""
+Миграции схемы БД. Запускаются отдельно от приложения, до старта воркеров:
+
+    python -m app.db.migrate
+
+Порядок работы:
+1. create_all создает таблицы, которых еще нет (новые модели, пустая БД) — вместе с их индексами;
+2. файлы из app/db/migrations применяются по порядку имен, каждый в своей транзакции,
+   и записываются в schema_migrations. *.sql выполняется как есть, *.py должен содержать upgrade(connection).
+
+Изменения существующих таблиц (колонки, индексы, заполнение данных) делаются только миграциями
+и пишутся идемпотентно (IF NOT EXISTS), чтобы на новой БД после create_all они ничего не ломали.
+Параллельные запуски (несколько контейнеров) ждут друг друга на advisory lock.
+"""
+import importlib.util
+from pathlib import Path
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+# Произвольный ключ pg_advisory_lock, общий для всех запусков
+MIGRATION_LOCK_KEY = 7_340_021
+
+
+def _migration_files() -> List[Path]:
+    return sorted(
+        path for path in MIGRATIONS_DIR.iterdir()
+        if path.suffix in (".sql", ".py") and not path.name.startswith("_")
+    )
+
+def _apply(connection: Connection, path: Path) -> None:
+    if path.suffix == ".sql":
+        # Строки-комментарии серверу не нужны (и не всякая кодировка клиента их пропустит)
+        sql = "\n".join(
+            line for line in path.read_text(encoding="utf-8").splitlines()
+            if not line.lstrip().startswith("--")
+        )
+        connection.exec_driver_sql(sql)
+        return
+    spec = importlib.util.spec_from_file_location(f"migration_{path.stem}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.upgrade(connection)
+
+def pending(connection: Connection) -> List[Path]:
+    """Еще не примененные миграции."""
+    applied = set(connection.execute(text("SELECT version FROM schema_migrations")).scalars())
+    return [path for path in _migration_files() if path.stem not in applied]
+
+def run(engine: Optional[Engine] = None) -> List[str]:
+    """Привести схему к актуальной. Возвращает имена примененных миграций."""
+    from .base import Base, engine as default_engine
+    from .. import models  # noqa: F401 — регистрирует модели в Base.metadata
+
+    engine = engine or default_engine
+    applied = []
+    with engine.connect() as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        connection.commit()
+        try:
+            with connection.begin():
+                connection.execute(text(
+                    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                    " version VARCHAR PRIMARY KEY,"
+                    " applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+                ))
+                Base.metadata.create_all(bind=connection)
+                todo = pending(connection)
+            for path in todo:
+                with connection.begin():
+                    _apply(connection, path)
+                    connection.execute(
+                        text("INSERT INTO schema_migrations (version) VALUES (:version)"),
+                        {"version": path.stem},
+                    )
+                applied.append(path.stem)
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            connection.commit()
+    return applied
+
+
+def main() -> None:
+    applied = run()
+    if applied:
+        for version in applied:
+            print(f"applied {version}")
+    else:
+        print("schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+-- Изменения схемы, сделанные до появления миграций: новые колонки и индексы существующих таблиц.
+-- Новые таблицы (refresh_tokens, feed_entries) создает create_all в начале migrate.run().
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0;
+-- Значения friends_count пересчитываются в 001_canonical_friendships.sql
+ALTER TABLE users ADD COLUMN IF NOT EXISTS friends_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS ix_lists_owner_id_created_at_id ON lists (owner_id, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_items_list_id_created_at_id ON items (list_id, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_comments_item_id_created_at_id ON comments (item_id, created_at, id);
@@ -0,0 +1,47 @@
+-- Каноническое ребро дружбы (user_low_id, user_high_id) вместо поиска по паре в обоих направлениях.
+-- Скрипт идемпотентен: повторный запуск ничего не меняет.
+
+ALTER TABLE friendships ADD COLUMN IF NOT EXISTS user_low_id INTEGER REFERENCES users (id);
+ALTER TABLE friendships ADD COLUMN IF NOT EXISTS user_high_id INTEGER REFERENCES users (id);
+
+UPDATE friendships
+SET user_low_id = LEAST(requester_id, addressee_id),
+    user_high_id = GREATEST(requester_id, addressee_id)
+WHERE user_low_id IS NULL OR user_high_id IS NULL;
+
+-- Встречные заявки A->B и B->A становятся одной связью: остается принятая, иначе более ранняя
+DELETE FROM friendships
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, row_number() OVER (
+            PARTITION BY user_low_id, user_high_id
+            ORDER BY (status = 'ACCEPTED') DESC, id
+        ) AS rn
+        FROM friendships
+    ) ranked
+    WHERE rn > 1
+);
+
+-- После удаления дублей счетчики друзей пересчитываются
+UPDATE users u
+SET friends_count = (
+    SELECT count(*) FROM friendships f
+    WHERE f.status = 'ACCEPTED' AND (f.user_low_id = u.id OR f.user_high_id = u.id)
+);
+
+ALTER TABLE friendships ALTER COLUMN user_low_id SET NOT NULL;
+ALTER TABLE friendships ALTER COLUMN user_high_id SET NOT NULL;
+ALTER TABLE friendships DROP CONSTRAINT IF EXISTS unique_friendship_request;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'ck_friendships_canonical_pair') THEN
+        ALTER TABLE friendships
+            ADD CONSTRAINT ck_friendships_canonical_pair CHECK (user_low_id < user_high_id);
+    END IF;
+END $$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_friendships_user_low_id_user_high_id
+    ON friendships (user_low_id, user_high_id) INCLUDE (status);
+CREATE INDEX IF NOT EXISTS ix_friendships_user_high_id_user_low_id
+    ON friendships (user_high_id, user_low_id) INCLUDE (status);
@@ -0,0 +1,14 @@
+-- Составные индексы под горячие запросы crud.py (проверяются тестом tests/test_query_plans.py)
+
+CREATE INDEX IF NOT EXISTS ix_notifications_recipient_id_created_at
+    ON notifications (recipient_id, created_at);
+CREATE INDEX IF NOT EXISTS ix_notifications_recipient_id_is_read_created_at
+    ON notifications (recipient_id, is_read, created_at);
+CREATE INDEX IF NOT EXISTS ix_lists_owner_id_privacy_level_created_at
+    ON lists (owner_id, privacy_level, created_at);
+CREATE INDEX IF NOT EXISTS ix_reservations_reserver_id ON reservations (reserver_id);
+CREATE INDEX IF NOT EXISTS ix_feed_entries_list_id ON feed_entries (list_id);
+-- Лента: друзья с числом друзей выше порога fan-out
+CREATE INDEX IF NOT EXISTS ix_users_friends_count ON users (friends_count);
+
+ANALYZE users, notifications, lists, reservations, feed_entries;
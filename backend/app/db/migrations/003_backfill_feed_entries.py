@@ -0,0 +1,10 @@
+"""Первичное заполнение материализованной ленты по уже существующим дружбам и спискам."""
+from sqlalchemy.orm import Session
+
+from app import crud
+
+
+def upgrade(connection):
+    # Сессия работает внутри транзакции миграции: commit в rebuild_feed_entries ее не завершает
+    with Session(bind=connection) as db:
+        crud.rebuild_feed_entries(db)
@@ -0,0 +1,2 @@
+-- Версия содержимого списка (ключ кэша публичных ответов)
+ALTER TABLE lists ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,12 @@
+-- Счетчик непрочитанных уведомлений вместо COUNT при каждом опросе
+ALTER TABLE users ADD COLUMN IF NOT EXISTS unread_notifications_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE users
+SET unread_notifications_count = unread.total
+FROM (
+    SELECT recipient_id, count(*) AS total
+    FROM notifications
+    WHERE NOT is_read
+    GROUP BY recipient_id
+) AS unread
+WHERE users.id = unread.recipient_id;
@@ -0,0 +1,12 @@
+-- Схлопывание уведомлений: число участников, последние участники и окно времени
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS actor_count INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS recent_actor_ids INTEGER[] NOT NULL DEFAULT '{}';
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS coalesce_bucket INTEGER;
+
+UPDATE notifications SET recent_actor_ids = ARRAY[sender_id] WHERE recent_actor_ids = '{}';
+
+-- Старые строки (coalesce_bucket IS NULL) не схлопываются и в индекс не попадают.
+-- created_at в ключе: на партиционированной таблице (007) уникальный индекс обязан содержать ключ партиций
+CREATE UNIQUE INDEX IF NOT EXISTS ux_notifications_coalesce
+    ON notifications (recipient_id, type, related_item_id, coalesce_bucket, created_at)
+    WHERE NOT is_read AND coalesce_bucket IS NOT NULL;
@@ -0,0 +1,57 @@
+"""
+notifications -> таблица с помесячными партициями по created_at.
+
+На новой БД таблицу уже создал create_all (postgresql_partition_by) — создаются только партиции.
+На существующей старая таблица переименовывается, новая создается по модели, строки переносятся.
+Открытые схлопнутые уведомления старой таблицы закрываются (coalesce_bucket = NULL):
+у них created_at — время последнего действия, а не начало окна.
+"""
+from app import models
+from app.db import partitions
+
+COLUMNS = (
+    "id, is_read, type, created_at, updated_at, recipient_id, sender_id,"
+    " related_item_id, actor_count, recent_actor_ids, coalesce_bucket"
+)
+
+
+def _convert(connection):
+    connection.exec_driver_sql("ALTER TABLE notifications RENAME TO notifications_legacy")
+    connection.exec_driver_sql("ALTER SEQUENCE notifications_id_seq RENAME TO notifications_legacy_id_seq")
+    connection.exec_driver_sql("ALTER TABLE notifications_legacy RENAME CONSTRAINT notifications_pkey TO notifications_legacy_pkey")
+    # Имена индексов общие на схему: старые индексы не нужны для переноса
+    legacy_indexes = connection.exec_driver_sql(
+        "SELECT indexname FROM pg_indexes"
+        " WHERE tablename = 'notifications_legacy' AND indexname <> 'notifications_legacy_pkey'"
+    ).scalars().all()
+    for index in legacy_indexes:
+        connection.exec_driver_sql(f"DROP INDEX {index}")
+
+    models.Notification.__table__.create(connection, checkfirst=True)
+    oldest = connection.exec_driver_sql("SELECT min(created_at) FROM notifications_legacy").scalar()
+    partitions.ensure_notification_partitions(connection, first_month=oldest)
+    connection.exec_driver_sql(
+        f"INSERT INTO notifications ({COLUMNS})"
+        " SELECT id, is_read, type, coalesce(created_at, now()), coalesce(created_at, now()), recipient_id, sender_id,"
+        " related_item_id, actor_count, recent_actor_ids, NULL"
+        " FROM notifications_legacy"
+    )
+    connection.exec_driver_sql(
+        "SELECT setval('notifications_id_seq', (SELECT coalesce(max(id), 0) + 1 FROM notifications_legacy), false)"
+    )
+    connection.exec_driver_sql("DROP TABLE notifications_legacy")
+
+
+def upgrade(connection):
+    is_partitioned = connection.exec_driver_sql(
+        "SELECT relkind = 'p' FROM pg_class WHERE relname = 'notifications' AND relnamespace = 'public'::regnamespace"
+    ).scalar()
+    if is_partitioned:
+        partitions.ensure_notification_partitions(connection)
+    else:
+        _convert(connection)
+    # Индекс 002 заменен на (recipient_id, updated_at)
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_notifications_recipient_id_created_at")
+    # Архив прочитанных уведомлений (python -m app.maintenance notifications --archive)
+    connection.exec_driver_sql("CREATE TABLE IF NOT EXISTS notifications_archive (LIKE notifications)")
+    connection.exec_driver_sql("ANALYZE notifications")
@@ -0,0 +1,8 @@
+-- Номера событий уведомлений для повтора пропущенного после переподключения WebSocket
+ALTER TABLE users ADD COLUMN IF NOT EXISTS notification_seq INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS event_seq INTEGER;
+-- Архив повторяет колонки notifications (INSERT ... SELECT * в app.maintenance)
+ALTER TABLE notifications_archive ADD COLUMN IF NOT EXISTS event_seq INTEGER;
+
+-- Старые уведомления без номера не повторяются
+CREATE INDEX IF NOT EXISTS ix_notifications_recipient_id_event_seq ON notifications (recipient_id, event_seq);
@@ -0,0 +1,3 @@
+-- Очистка refresh-токенов в app.maintenance: истекшие и давно отозванные выбираются по индексам
+CREATE INDEX IF NOT EXISTS ix_refresh_tokens_expires_at ON refresh_tokens (expires_at);
+CREATE INDEX IF NOT EXISTS ix_refresh_tokens_revoked_at ON refresh_tokens (revoked_at) WHERE revoked_at IS NOT NULL;
@@ -0,0 +1,3 @@
+-- Очистка старых прочитанных уведомлений в app.maintenance: пачки выбираются диапазоном
+-- по частичному индексу, а не чтением партиций целиком (индекс создается на каждой партиции)
+CREATE INDEX IF NOT EXISTS ix_notifications_read_created_at ON notifications (created_at) WHERE is_read;
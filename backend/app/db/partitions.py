@@ -0,0 +1,88 @@
+"""
+Помесячные партиции notifications (PARTITION BY RANGE (created_at)).
+
+Партиции notifications_YYYY_MM создаются заранее: миграцией 007 и командой
+python -m app.maintenance notifications (запускается по расписанию).
+notifications_default принимает строки, для которых месячной партиции еще нет; если там
+уже лежат строки нового месяца, при создании партиции они переносятся в нее в той же транзакции.
+"""
+import os
+import re
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+PARENT = "notifications"
+DEFAULT_PARTITION = "notifications_default"
+# На сколько месяцев вперед держать готовые партиции
+PARTITIONS_AHEAD = int(os.environ.get("NOTIFICATION_PARTITIONS_AHEAD", "2"))
+
+_PARTITION_NAME = re.compile(r"^notifications_(\d{4})_(\d{2})$")
+
+
+def month_start(moment: datetime) -> datetime:
+    moment = moment.astimezone(timezone.utc)
+    return datetime(moment.year, moment.month, 1, tzinfo=timezone.utc)
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+def partition_name(month: datetime) -> str:
+    return f"{PARENT}_{month:%Y_%m}"
+
+
+def monthly_partitions(connection: Connection) -> Dict[str, datetime]:
+    """Месячные партиции notifications: имя -> начало месяца."""
+    names = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits"
+        " JOIN pg_class parent ON parent.oid = pg_inherits.inhparent"
+        " JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+        " WHERE parent.relname = :parent"
+    ), {"parent": PARENT}).scalars()
+    partitions = {}
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if match:
+            partitions[name] = datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)
+    return partitions
+
+def _create_partition(connection: Connection, name: str, lower: datetime, upper: datetime) -> None:
+    bounds = f"FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    in_range = f"created_at >= '{lower.isoformat()}' AND created_at < '{upper.isoformat()}'"
+    has_rows = connection.exec_driver_sql(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_range})").scalar()
+    if not has_rows:
+        connection.exec_driver_sql(f"CREATE TABLE {name} PARTITION OF {PARENT} FOR VALUES {bounds}")
+        return
+    # Строки месяца уже попали в default: переносим их и подключаем готовую таблицу
+    connection.exec_driver_sql(f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)")
+    connection.exec_driver_sql(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE {in_range} RETURNING *)"
+        f" INSERT INTO {name} SELECT * FROM moved"
+    )
+    connection.exec_driver_sql(f"ALTER TABLE {PARENT} ATTACH PARTITION {name} FOR VALUES {bounds}")
+
+def ensure_notification_partitions(
+    connection: Connection,
+    first_month: Optional[datetime] = None,
+    months_ahead: int = PARTITIONS_AHEAD,
+    now: Optional[datetime] = None,
+) -> List[str]:
+    """
+    Создать default-партицию и недостающие месячные партиции с first_month
+    (по умолчанию прошлый месяц) по текущий месяц + months_ahead. Возвращает имена созданных.
+    """
+    current = month_start(now or datetime.now(timezone.utc))
+    month = month_start(first_month) if first_month else add_months(current, -1)
+    connection.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT")
+    existing = monthly_partitions(connection)
+    created = []
+    while month <= add_months(current, months_ahead):
+        name = partition_name(month)
+        if name not in existing:
+            _create_partition(connection, name, month, add_months(month, 1))
+            created.append(name)
+        month = add_months(month, 1)
+    return created
@@ -0,0 +1,51 @@
+"""
+Пулы соединений с метриками: время ожидания соединения из пула и насыщенность пула.
+"""
+import time
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from .. import metrics
+
+
+class _InstrumentedPoolMixin:
+    # Имя пула в метриках (primary, replica-0, ...); задается в register_pool_metrics
+    label = "db"
+
+    def _do_get(self):
+        # Время от запроса соединения до его выдачи, включая ожидание свободного слота
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            metrics.inc(f"db.pool.{self.label}.checkout_errors")
+            raise
+        finally:
+            metrics.observe(f"db.pool.{self.label}.checkout_seconds", time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() пересоздает пул; имя в метриках должно сохраниться
+        pool = super().recreate()
+        pool.label = self.label
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def register_pool_metrics(engine, label: str) -> None:
+    """Подписать пул движка и зарегистрировать gauge'и его заполненности."""
+    engine.pool.label = label
+
+    def capacity():
+        pool = engine.pool
+        return pool.size() + max(pool._max_overflow, 0)
+
+    metrics.register_gauge(f"db.pool.{label}.checked_out", lambda: engine.pool.checkedout())
+    metrics.register_gauge(f"db.pool.{label}.capacity", capacity)
+    # Доля занятых соединений от максимума (pool_size + max_overflow); 1.0 = запросы ждут в очереди
+    metrics.register_gauge(f"db.pool.{label}.saturation", lambda: engine.pool.checkedout() / capacity())
@@ -1,64 +1,214 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
+import math
+import os
+import time
 
-from . import crud, models, schemas, security
-from .db.base import get_db
+from . import crud, async_crud, models, schemas, security
+from .cache import TTLCache
+from .db.base import get_db, get_async_db, DB_READ_AFTER_WRITE_SECONDS
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token", auto_error=False) # auto_error=False делает токен опциональным
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> models.User:
-    # Эта зависимость по-прежнему требует токен
+# --- Кэш аутентифицированных пользователей ---
+
+# Ключ — id пользователя из токена (claim "uid"). Запись сбрасывается при смене email/пароля
+# и удалении аккаунта; токен с другой версией, чем в кэше, перечитывает пользователя из БД,
+# TTL ограничивает устаревание остальных полей между воркерами.
+AUTH_PRINCIPAL_CACHE_TTL = float(os.environ.get("AUTH_PRINCIPAL_CACHE_TTL", "60"))
+AUTH_PRINCIPAL_CACHE_SIZE = int(os.environ.get("AUTH_PRINCIPAL_CACHE_SIZE", "10000"))
+_principal_cache = TTLCache(maxsize=AUTH_PRINCIPAL_CACHE_SIZE, ttl=AUTH_PRINCIPAL_CACHE_TTL, name="auth_principals")
+
+def invalidate_principal(user_id: int) -> None:
+    """Сбросить закэшированные данные пользователя (после изменения email, пароля, удаления)."""
+    _principal_cache.pop(user_id)
+
+def _decode_claims(token: Optional[str]) -> Optional[dict]:
     if token is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not authenticated",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-        
-    credentials_exception = HTTPException(
+        return None
+    payload = security.decode_token(token)
+    if payload is None or payload.get("sub") is None:
+        return None
+    return payload
+
+def _cached_principal(payload: dict) -> Optional[schemas.UserPrincipal]:
+    uid = payload.get("uid")
+    return _principal_cache.get(uid) if uid is not None else None
+
+def _remember_principal(user: Optional[models.User]) -> Optional[schemas.UserPrincipal]:
+    if user is None:
+        return None
+    principal = schemas.UserPrincipal.from_orm(user)
+    _principal_cache.set(principal.id, principal)
+    return principal
+
+def _token_is_current(payload: dict, principal: Optional[schemas.UserPrincipal]) -> bool:
+    # Токены, выданные до смены пароля, несут старую версию. Старые токены без "ver" считаются версией 0
+    return principal is not None and payload.get("ver", 0) == principal.token_version
+
+def _fresh_cached_principal(payload: dict) -> Optional[schemas.UserPrincipal]:
+    principal = _cached_principal(payload)
+    if principal is not None and not _token_is_current(payload, principal):
+        # Версия не совпала: пароль мог смениться на другом воркере, а кэш этого еще не знает.
+        # Запись сбрасывается, решение принимается по token_version из БД
+        invalidate_principal(principal.id)
+        return None
+    return principal
+
+def _resolve_principal(payload: Optional[dict], db: Session) -> Optional[schemas.UserPrincipal]:
+    if payload is None:
+        return None
+    principal = _fresh_cached_principal(payload)
+    if principal is None:
+        # Токены без "uid" (выданные до появления кэша) ищем по email
+        if payload.get("uid") is not None:
+            user = crud.get_user(db, user_id=payload["uid"])
+        else:
+            user = crud.get_user_by_email(db, email=payload["sub"])
+        principal = _remember_principal(user)
+    return principal if _token_is_current(payload, principal) else None
+
+async def _resolve_principal_async(payload: Optional[dict], db: AsyncSession) -> Optional[schemas.UserPrincipal]:
+    if payload is None:
+        return None
+    principal = _fresh_cached_principal(payload)
+    if principal is None:
+        if payload.get("uid") is not None:
+            user = await async_crud.get_user(db, user_id=payload["uid"])
+        else:
+            user = await async_crud.get_user_by_email(db, email=payload["sub"])
+        principal = _remember_principal(user)
+    return principal if _token_is_current(payload, principal) else None
+
+def _not_authenticated() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Not authenticated",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    payload = security.decode_token(token)
-    if payload is None:
-        raise credentials_exception
+# --- Маршрутизация чтения на реплики ---
 
-    email: str = payload.get("sub")
-    if email is None:
-        raise credentials_exception
+# Время последней записи клиента хранит сам клиент — в короткоживущей cookie. Она приходит в любой
+# воркер и переживает обновление токена; пока реплики могут отставать, чтения этого клиента идут на primary.
+# Подделка cookie ничего не дает: клиент лишь сам себя направляет на primary.
+READ_AFTER_WRITE_COOKIE = "last_write_at"
 
-    user = crud.get_user_by_email(db, email=email)
-    if user is None:
-        raise credentials_exception
+def remember_write(response: Response) -> None:
+    """Отметить, что клиент только что записал данные (вызывается middleware после успешной записи)."""
+    response.set_cookie(
+        READ_AFTER_WRITE_COOKIE,
+        f"{time.time():.3f}",
+        max_age=math.ceil(DB_READ_AFTER_WRITE_SECONDS),
+        httponly=True,
+        samesite="lax",
+    )
+
+def _can_read_from_replica(request: Request) -> bool:
+    if request.method not in ("GET", "HEAD"):
+        return False
+    try:
+        written_at = float(request.cookies.get(READ_AFTER_WRITE_COOKIE, ""))
+    except ValueError:
+        return True
+    return time.time() - written_at >= DB_READ_AFTER_WRITE_SECONDS
 
-    return user
+def get_read_db(request: Request, db: Session = Depends(get_db)) -> Session:
+    """
+    Сессия для read-only эндпоинтов: запросы уходят на реплику, если она настроена.
+    Пользователя такие эндпоинты получают через get_current_active_read_user: он зависит от этой же
+    сессии, и флаг выставлен до первого запроса при любом порядке параметров.
+    """
+    if _can_read_from_replica(request):
+        db.info["read_only"] = True
+    return db
+
+async def get_async_read_db(request: Request, db: AsyncSession = Depends(get_async_db)) -> AsyncSession:
+    """Асинхронный аналог get_read_db."""
+    if _can_read_from_replica(request):
+        db.info["read_only"] = True
+    return db
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> schemas.UserPrincipal:
+    # Эта зависимость по-прежнему требует токен
+    if token is None:
+        raise _not_authenticated()
+
+    # В обычном случае пользователь берется из кэша, без запроса к БД
+    principal = _resolve_principal(_decode_claims(token), db)
+    if principal is None:
+        raise _credentials_exception()
+
+    return principal
 
 # --- НОВАЯ ФУНКЦИЯ ---
-def get_optional_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Optional[models.User]:
+def get_optional_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Optional[schemas.UserPrincipal]:
     """
     Возвращает текущего пользователя, если токен предоставлен и валиден.
     В противном случае возвращает None, не вызывая ошибку.
     """
+    return _resolve_principal(_decode_claims(token), db)
+
+
+def get_current_active_user(current_user: schemas.UserPrincipal = Depends(get_current_user)) -> schemas.UserPrincipal:
+    if not current_user.is_active:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
+    return current_user
+
+def get_current_active_read_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)) -> schemas.UserPrincipal:
+    """get_current_active_user для read-only эндпоинтов (get_read_db)."""
+    return get_current_active_user(get_current_user(token, db))
+
+
+# --- Асинхронные версии для async-эндпоинтов (используют AsyncSession) ---
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> schemas.UserPrincipal:
     if token is None:
-        return None
-    
-    payload = security.decode_token(token)
-    if payload is None:
-        return None
+        raise _not_authenticated()
 
-    email: str = payload.get("sub")
-    if email is None:
-        return None
+    principal = await _resolve_principal_async(_decode_claims(token), db)
+    if principal is None:
+        raise _credentials_exception()
 
-    user = crud.get_user_by_email(db, email=email)
-    return user
+    return principal
 
+async def get_optional_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)) -> Optional[schemas.UserPrincipal]:
+    """Асинхронный аналог get_optional_current_user."""
+    return await _resolve_principal_async(_decode_claims(token), db)
 
-def get_current_active_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+async def get_current_active_user_async(current_user: schemas.UserPrincipal = Depends(get_current_user_async)) -> schemas.UserPrincipal:
     if not current_user.is_active:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
     return current_user
+
+# Варианты для read-only эндпоинтов: пользователь читается через ту же сессию get_async_read_db
+async def get_current_active_read_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_read_db)) -> schemas.UserPrincipal:
+    return await get_current_active_user_async(await get_current_user_async(token, db))
+
+async def get_optional_read_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_read_db)) -> Optional[schemas.UserPrincipal]:
+    return await get_optional_current_user_async(token, db)
+
+async def get_websocket_user(token: Optional[str], session_factory) -> Optional[schemas.UserPrincipal]:
+    """
+    Пользователь WebSocket-соединения. Обычно берется из кэша; иначе — короткая сессия только на поиск
+    пользователя: соединение с БД возвращается в пул до начала работы с сокетом.
+    """
+    payload = _decode_claims(token)
+    if payload is None:
+        return None
+    # AsyncSession берет соединение только на первом запросе: при попадании в кэш БД не трогается
+    async with session_factory() as db:
+        principal = await _resolve_principal_async(payload, db)
+    if principal is None or not principal.is_active:
+        return None
+    return principal
@@ -0,0 +1,65 @@
+"""
+Условные запросы: ETag, If-None-Match (304) и If-Match (412).
+
+ETag собирается из дешевых версий данных (lists.version, версии списков страницы,
+max id уведомлений) и id зрителя — ответы персональные (лайкнул ли я, статус дружбы).
+Совпавший If-None-Match отдается как 304 до сборки ответа.
+
+If-Match у изменений — оптимистичная блокировка: ожидаемая версия проверяется в том же UPDATE,
+который ее увеличивает (crud.bump_list_version(expected_version=...)), без блокировок строк.
+"""
+import hashlib
+from typing import List, Optional
+
+from fastapi import HTTPException, Request, Response, status
+
+# Ответ можно хранить только в браузере и только с перепроверкой
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Сильный ETag из частей версии (хэш: наружу не уходят id и счетчики)."""
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+def list_etag(list_id: int, version: int, viewer_id: int) -> str:
+    """ETag ответа GET /lists/{list_id} для зрителя; им же проверяется If-Match изменений списка."""
+    return make_etag("list", list_id, version, viewer_id)
+
+
+def _header_tags(value: str) -> List[str]:
+    return [tag.strip() for tag in value.split(",") if tag.strip()]
+
+def _headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers.update(_headers(etag))
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304, если If-None-Match совпал с etag (слабое сравнение), иначе None."""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return None
+    tags = [tag[2:] if tag.startswith("W/") else tag for tag in _header_tags(header)]
+    if "*" in tags or etag in tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_headers(etag))
+    return None
+
+def if_match(request: Request, etag: str) -> bool:
+    """
+    Проверка If-Match (сильное сравнение): 412, если не совпал.
+    True — клиент ждет именно эту версию, и изменение нужно делать условным.
+    """
+    header = request.headers.get("if-match")
+    if header is None:
+        return False
+    tags = _header_tags(header)
+    if "*" in tags:
+        return False
+    if etag not in tags:
+        raise precondition_failed()
+    return True
+
+def precondition_failed() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Resource has been modified")
@@ -0,0 +1,130 @@
+"""
+Хеширование паролей в отдельном пуле процессов.
+
+pbkdf2 — чистая CPU-нагрузка: в общем threadpool FastAPI она занимает потоки и держит GIL,
+из-за чего всплеск логинов тормозит все остальные эндпоинты. Здесь хеширование выполняется
+в ProcessPoolExecutor с ограниченной очередью: если в работе и в очереди уже PASSWORD_HASH_QUEUE_SIZE
+задач, новая сразу отклоняется исключением HashingUnavailable (в main.py превращается в 503).
+Синхронного API нет: поток, ждущий результат из пула, занимал бы место в threadpool так же, как само хеширование.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+from passlib.hash import pbkdf2_sha256
+
+from . import metrics
+
+# Число процессов-хешировщиков; 0 — хешировать в потоках без отдельных процессов (тесты, отладка)
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Максимум задач в работе и в очереди; сверх него запросы получают 503
+PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get("PASSWORD_HASH_QUEUE_SIZE", "64"))
+# Стоимость pbkdf2_sha256 (число раундов); пусто — значение по умолчанию passlib
+PASSWORD_HASH_ROUNDS = os.environ.get("PASSWORD_HASH_ROUNDS")
+
+
+def _make_context() -> CryptContext:
+    rounds = int(PASSWORD_HASH_ROUNDS) if PASSWORD_HASH_ROUNDS else pbkdf2_sha256.default_rounds
+    # min = max = default: хеш с любой другой стоимостью считается устаревшим
+    # и пересчитывается при следующем успешном входе (verify_and_update)
+    return CryptContext(
+        schemes=["pbkdf2_sha256"],
+        deprecated="auto",
+        pbkdf2_sha256__default_rounds=rounds,
+        pbkdf2_sha256__min_rounds=rounds,
+        pbkdf2_sha256__max_rounds=rounds,
+    )
+
+
+pwd_context = _make_context()
+
+
+class HashingUnavailable(Exception):
+    """Пул хеширования переполнен: запрос нужно повторить позже."""
+
+
+# --- Функции, выполняемые в процессах пула (должны быть на уровне модуля для pickle) ---
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+# --- Пул ---
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_QUEUE_SIZE)
+_in_flight = 0
+
+metrics.register_gauge("hashing.in_flight", lambda: _in_flight)
+metrics.register_gauge("hashing.capacity", lambda: PASSWORD_HASH_QUEUE_SIZE)
+
+
+def _get_executor() -> Optional[Executor]:
+    global _executor
+    if PASSWORD_HASH_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            # spawn: форк процесса с запущенным event loop и потоками может унаследовать захваченные блокировки
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+def _acquire_slot(operation: str) -> None:
+    global _in_flight
+    if not _slots.acquire(blocking=False):
+        metrics.inc(f"hashing.{operation}.rejected")
+        raise HashingUnavailable("Password hashing pool is saturated")
+    with _executor_lock:
+        _in_flight += 1
+
+def _release_slot() -> None:
+    global _in_flight
+    with _executor_lock:
+        _in_flight -= 1
+    _slots.release()
+
+async def _run(operation: str, fn, *args):
+    """Выполнить fn в пуле, не блокируя event loop; время (очередь + вычисление) пишется в метрики."""
+    _acquire_slot(operation)
+    start = time.perf_counter()
+    try:
+        executor = _get_executor()
+        if executor is None:
+            return await asyncio.to_thread(fn, *args)
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    finally:
+        _release_slot()
+        metrics.observe(f"hashing.{operation}.seconds", time.perf_counter() - start)
+
+
+# --- Публичный API ---
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", _hash, password)
+
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Проверить пароль. Возвращает (верен ли пароль, новый хеш или None).
+    Новый хеш возвращается, если сохраненный посчитан с другой стоимостью, — его нужно сохранить.
+    """
+    return await _run("verify", _verify_and_update, plain_password, hashed_password)
+
+def shutdown() -> None:
+    """Остановить процессы пула (при завершении приложения)."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
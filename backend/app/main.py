@@ -1,10 +1,13 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
-from .db.base import engine, get_db
-from . import models
+from .db.base import get_db, get_async_db
+from . import models, metrics, hashing, ws_manager
+from .dependencies import remember_write
 # Импортируем все роутеры
 from .routers import auth, users, lists, items, public, reservations, interactions, friends
 # (Новое) Импортируем роутер уведомлений
@@ -17,8 +20,7 @@ from .routers import goals
 # (Этап 19) Импортируем роутер настроек
 from .routers import settings
 
-# Создаем все таблицы в БД, которые унаследованы от Base
-models.Base.metadata.create_all(bind=engine)
+# Схема БД создается и обновляется миграциями до старта приложения: python -m app.db.migrate
 
 
 app = FastAPI(title="Plotix Blog Backend")
@@ -36,8 +38,40 @@ app.add_middleware(
     allow_credentials=True,      
     allow_methods=["*"],         
     allow_headers=["*"],         
+    expose_headers=["ETag"],     # условные запросы (If-None-Match / If-Match)
 )
 
+# После успешной записи клиент какое-то время читает с primary, а не с реплик
+@app.middleware("http")
+async def pin_writers_to_primary(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        remember_write(response)
+    return response
+
+# Пул хеширования паролей переполнен: отказываем сразу, а не копим очередь
+@app.exception_handler(hashing.HashingUnavailable)
+async def hashing_unavailable_handler(request: Request, exc: hashing.HashingUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy, please retry later"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.on_event("shutdown")
+def shutdown_hashing_pool():
+    hashing.shutdown()
+
+# Сообщения WebSocket доходят до сокетов в любом воркере (Postgres LISTEN/NOTIFY)
+@app.on_event("startup")
+async def start_ws_fanout():
+    if ws_manager.WS_FANOUT == "postgres":
+        await ws_manager.fanout.start()
+
+@app.on_event("shutdown")
+async def stop_ws_fanout():
+    await ws_manager.fanout.stop()
+
 # Подключаем роутеры
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(users.router, prefix="/users", tags=["users"])
@@ -69,4 +103,18 @@ def health_check(db: Session = Depends(get_db)):
         db.execute(text("SELECT 1"))
         return {"status": "ok", "db_connection": "successful"}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database connection failed: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {e}")
+
+# Тот же запрос через асинхронный движок: позволяет сравнить sync- и async-пути под нагрузкой
+@app.get("/health/async")
+async def health_check_async(db: AsyncSession = Depends(get_async_db)):
+    try:
+        await db.execute(text("SELECT 1"))
+        return {"status": "ok", "db_connection": "successful"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database connection failed: {e}")
+
+# Метрики процесса: пулы соединений с БД, кэши и т.д.
+@app.get("/metrics")
+def read_metrics():
+    return metrics.snapshot()
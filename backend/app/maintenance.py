@@ -0,0 +1,206 @@
+"""
+Обслуживание БД (запускается по расписанию, не из воркеров приложения):
+
+    python -m app.maintenance                  # сверка счетчиков
+    python -m app.maintenance notifications    # партиции и очистка уведомлений
+    python -m app.maintenance tokens           # очистка refresh-токенов
+
+Счетчики users сверяются с исходными таблицами:
+- unread_notifications_count — число непрочитанных уведомлений (notifications);
+- friends_count — число дружб ACCEPTED (friendships).
+Они меняются в транзакциях crud, но могут разойтись после ручных правок БД
+или удалений мимо crud. Команда пересчитывает их и исправляет только разошедшиеся строки.
+
+Уведомления: создаются партиции на месяцы вперед, прочитанные уведомления старше
+NOTIFICATION_RETENTION_DAYS удаляются (или переносятся в notifications_archive) пачками —
+каждая пачка в своей короткой транзакции; опустевшие старые партиции отсоединяются и удаляются.
+Непрочитанные не удаляются никогда: на них опирается счетчик непрочитанных.
+
+Refresh-токены: удаляются истекшие и отозванные раньше REFRESH_TOKEN_REVOKED_RETENTION_DAYS.
+Недавно отозванные остаются: по ним повторное предъявление токена распознается как утечка.
+"""
+import argparse
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple
+
+from sqlalchemy import delete, func, or_, select, text, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from . import models
+from .db import partitions
+
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get("NOTIFICATION_RETENTION_DAYS", "90"))
+NOTIFICATION_RETENTION_BATCH = int(os.environ.get("NOTIFICATION_RETENTION_BATCH", "5000"))
+# Отсоединение партиции ждет блокировку не дольше этого; не дождалась — попытка в следующий запуск
+PARTITION_DROP_LOCK_TIMEOUT = os.environ.get("PARTITION_DROP_LOCK_TIMEOUT", "2s")
+REFRESH_TOKEN_REVOKED_RETENTION_DAYS = int(os.environ.get("REFRESH_TOKEN_REVOKED_RETENTION_DAYS", "7"))
+REFRESH_TOKEN_PURGE_BATCH = int(os.environ.get("REFRESH_TOKEN_PURGE_BATCH", "5000"))
+
+
+def _actual_unread_notifications():
+    return (
+        select(func.count(models.Notification.id))
+        .where(models.Notification.recipient_id == models.User.id, models.Notification.is_read == False)
+        .correlate(models.User)
+        .scalar_subquery()
+    )
+
+def _actual_friends_count():
+    return (
+        select(func.count(models.Friendship.id))
+        .where(
+            or_(models.Friendship.user_low_id == models.User.id, models.Friendship.user_high_id == models.User.id),
+            models.Friendship.status == models.FriendshipStatus.ACCEPTED,
+        )
+        .correlate(models.User)
+        .scalar_subquery()
+    )
+
+COUNTERS = {
+    "unread_notifications_count": _actual_unread_notifications,
+    "friends_count": _actual_friends_count,
+}
+
+
+def repair_counters(db: Session) -> Dict[str, int]:
+    """Пересчитать счетчики. Возвращает число исправленных пользователей по каждому счетчику."""
+    repaired = {}
+    for name, actual in COUNTERS.items():
+        column = getattr(models.User, name)
+        result = db.execute(
+            update(models.User)
+            .where(column != actual())
+            .values({name: actual()})
+            .execution_options(synchronize_session=False)
+        )
+        repaired[name] = result.rowcount
+    db.commit()
+    return repaired
+
+
+class RetentionReport(NamedTuple):
+    removed: int
+    archived: bool
+    created_partitions: List[str]
+    dropped_partitions: List[str]
+
+
+# Одна пачка: ключи выбираются по партициям старше cutoff (отсечение по created_at) частичным индексом
+# ix_notifications_read_created_at, удаляются по первичному ключу
+_READ_BATCH = """
+    WITH batch AS (
+        SELECT id, created_at FROM notifications
+        WHERE is_read AND created_at < :cutoff
+        LIMIT :batch_size
+    )
+    DELETE FROM notifications AS n USING batch
+    WHERE n.id = batch.id AND n.created_at = batch.created_at
+    RETURNING n.*
+"""
+
+def _purge_batch(db: Session, cutoff: datetime, batch_size: int, archive: bool) -> int:
+    params = {"cutoff": cutoff, "batch_size": batch_size}
+    if archive:
+        stmt = f"WITH moved AS ({_READ_BATCH}) INSERT INTO notifications_archive SELECT * FROM moved"
+    else:
+        stmt = f"WITH moved AS ({_READ_BATCH}) SELECT count(*) FROM moved"
+    result = db.execute(text(stmt), params)
+    removed = result.rowcount if archive else result.scalar_one()
+    db.commit()
+    return removed
+
+def _drop_empty_partitions(db: Session, cutoff: datetime) -> List[str]:
+    dropped = []
+    for name, month in sorted(partitions.monthly_partitions(db.connection()).items()):
+        # Только месяцы целиком старше cutoff, в которых не осталось строк (непрочитанные держат партицию)
+        if partitions.add_months(month, 1) > cutoff or db.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})")).scalar():
+            continue
+        try:
+            db.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_DROP_LOCK_TIMEOUT}'"))
+            db.execute(text(f"ALTER TABLE {partitions.PARENT} DETACH PARTITION {name}"))
+            db.execute(text(f"DROP TABLE {name}"))
+            db.commit()
+            dropped.append(name)
+        except OperationalError:
+            db.rollback()
+    db.commit()
+    return dropped
+
+def purge_read_notifications(
+    db: Session,
+    older_than: timedelta = timedelta(days=NOTIFICATION_RETENTION_DAYS),
+    batch_size: int = NOTIFICATION_RETENTION_BATCH,
+    archive: bool = False,
+) -> RetentionReport:
+    """Создать будущие партиции и удалить (или архивировать) прочитанные уведомления старше older_than."""
+    created = partitions.ensure_notification_partitions(db.connection())
+    db.commit()
+    cutoff = datetime.now(timezone.utc) - older_than
+    removed = 0
+    while True:
+        batch = _purge_batch(db, cutoff, batch_size, archive)
+        removed += batch
+        if batch < batch_size:
+            break
+    return RetentionReport(removed, archive, created, _drop_empty_partitions(db, cutoff))
+
+
+def _purge_refresh_tokens_stmt(now: datetime, revoked_before: datetime, batch_size: int):
+    # Ключи пачки выбираются по индексам expires_at и revoked_at (BitmapOr)
+    batch = (
+        select(models.RefreshToken.id)
+        .where(or_(models.RefreshToken.expires_at < now, models.RefreshToken.revoked_at < revoked_before))
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    return delete(models.RefreshToken).where(models.RefreshToken.id.in_(batch))
+
+def purge_refresh_tokens(
+    db: Session,
+    revoked_older_than: timedelta = timedelta(days=REFRESH_TOKEN_REVOKED_RETENTION_DAYS),
+    batch_size: int = REFRESH_TOKEN_PURGE_BATCH,
+) -> int:
+    """Удалить истекшие refresh-токены и отозванные раньше revoked_older_than. Возвращает число удаленных."""
+    now = datetime.now(timezone.utc)
+    removed = 0
+    while True:
+        batch = db.execute(_purge_refresh_tokens_stmt(now, now - revoked_older_than, batch_size)).rowcount
+        db.commit()
+        removed += batch
+        if batch < batch_size:
+            break
+    return removed
+
+
+def main() -> None:
+    from .db.base import SessionLocal
+
+    parser = argparse.ArgumentParser(prog="python -m app.maintenance")
+    parser.add_argument("command", nargs="?", default="counters", choices=["counters", "notifications", "tokens"])
+    parser.add_argument("--archive", action="store_true", help="переносить удаляемые уведомления в notifications_archive")
+    parser.add_argument("--older-than-days", type=int, default=NOTIFICATION_RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=NOTIFICATION_RETENTION_BATCH)
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if args.command == "counters":
+            for name, count in repair_counters(db).items():
+                print(f"{name}: repaired {count}")
+            return
+        if args.command == "tokens":
+            print(f"refresh_tokens: removed {purge_refresh_tokens(db)}")
+            return
+        report = purge_read_notifications(
+            db, timedelta(days=args.older_than_days), args.batch_size, args.archive
+        )
+        for name in report.created_partitions:
+            print(f"created partition {name}")
+        print(f"notifications: {'archived' if report.archived else 'removed'} {report.removed}")
+        for name in report.dropped_partitions:
+            print(f"dropped partition {name}")
+
+
+if __name__ == "__main__":
+    main()
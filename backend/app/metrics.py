@@ -0,0 +1,73 @@
+"""
+Простейший внутрипроцессный реестр метрик: счетчики, гистограммы задержек и gauge-функции.
+Снимок отдается эндпоинтом GET /metrics. Метрики считаются в рамках одного процесса (воркера).
+"""
+import threading
+from typing import Callable, Dict
+
+# Границы корзин гистограмм задержек (в секундах)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_histograms: Dict[str, dict] = {}
+_gauges: Dict[str, Callable[[], float]] = {}
+
+
+def inc(name: str, value: float = 1) -> None:
+    """Увеличить счетчик."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name: str, value: float) -> None:
+    """Записать значение (обычно длительность в секундах) в гистограмму."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS) + 1)}
+            _histograms[name] = histogram
+        histogram["count"] += 1
+        histogram["sum"] += value
+        histogram["max"] = max(histogram["max"], value)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][index] += 1
+                break
+        else:
+            histogram["buckets"][-1] += 1
+
+
+def register_gauge(name: str, fn: Callable[[], float]) -> None:
+    """Зарегистрировать gauge: функция вызывается при каждом снятии снимка."""
+    with _lock:
+        _gauges[name] = fn
+
+
+def snapshot() -> dict:
+    """Текущие значения всех метрик процесса."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {
+            name: {
+                "count": h["count"],
+                "sum": h["sum"],
+                "avg": h["sum"] / h["count"] if h["count"] else 0.0,
+                "max": h["max"],
+                "buckets": {
+                    **{f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS, h["buckets"])},
+                    "le_inf": h["buckets"][-1],
+                },
+            }
+            for name, h in _histograms.items()
+        }
+        gauges = dict(_gauges)
+
+    gauge_values = {}
+    for name, fn in gauges.items():
+        try:
+            gauge_values[name] = fn()
+        except Exception:
+            gauge_values[name] = None
+
+    return {"counters": counters, "gauges": gauge_values, "histograms": histograms}
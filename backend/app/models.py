@@ -1,8 +1,8 @@
 import uuid
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Enum, DateTime, Text, UniqueConstraint, Float
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Enum, DateTime, Text, UniqueConstraint, Float, Index, CheckConstraint
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
-from sqlalchemy.dialects.postgresql import UUID # Импортируем тип UUID
+from sqlalchemy.sql import func, text
+from sqlalchemy.dialects.postgresql import ARRAY, UUID # Импортируем тип UUID
 import enum
 from .db.base import Base
 
@@ -28,6 +28,15 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
+    # Версия токенов: увеличивается при смене пароля, токены со старой версией перестают приниматься
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
+    # Число друзей (ACCEPTED); по нему выбирается способ доставки ленты (см. FeedEntry).
+    # Индекс: лента выбирает немногих друзей с friends_count выше порога fan-out
+    friends_count = Column(Integer, default=0, server_default="0", nullable=False, index=True)
+    # Число непрочитанных уведомлений: меняется вместе с уведомлениями (crud), сверяется app.maintenance
+    unread_notifications_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Последний номер события уведомлений пользователя (notifications.event_seq)
+    notification_seq = Column(Integer, default=0, server_default="0", nullable=False)
     
     lists = relationship("List", back_populates="owner", cascade="all, delete-orphan")
     reservations = relationship("Reservation", back_populates="reserver", cascade="all, delete-orphan")
@@ -52,6 +61,8 @@ class User(Base):
     # (Новое) Связь для полученных уведомлений
     notifications = relationship("Notification", foreign_keys="[Notification.recipient_id]", back_populates="recipient", cascade="all, delete-orphan")
 
+    refresh_tokens = relationship("RefreshToken", back_populates="user", cascade="all, delete-orphan")
+
 
 class ListType(str, enum.Enum):
     WISHLIST = "wishlist"
@@ -98,11 +109,21 @@ class List(Base):
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Версия содержимого: увеличивается при любом изменении того, что показывает список
+    # (сам список, элементы, лайки, комментарии, брони). Ключ кэша публичных ответов
+    version = Column(Integer, default=0, server_default="0", nullable=False)
     
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     owner = relationship("User", back_populates="lists")
     
-    items = relationship("Item", back_populates="list", cascade="all, delete-orphan")
+    items = relationship("Item", back_populates="list", cascade="all, delete-orphan", order_by="[Item.created_at, Item.id]")
+
+    __table_args__ = (
+        # Лента друзей: списки владельца по (created_at, id)
+        Index("ix_lists_owner_id_created_at_id", "owner_id", "created_at", "id"),
+        # Видимые зрителю списки владельца (get_visible_lists_by_user, лента авторов с большим числом друзей)
+        Index("ix_lists_owner_id_privacy_level_created_at", "owner_id", "privacy_level", "created_at"),
+    )
 
 
 class Item(Base):
@@ -139,6 +160,11 @@ class Item(Base):
     # (Этап 13) Новая обратная связь с GoalTracker
     goal_tracker = relationship("GoalTracker", back_populates="item", uselist=False, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Курсорная пагинация элементов списка по (created_at, id)
+        Index("ix_items_list_id_created_at_id", "list_id", "created_at", "id"),
+    )
+
 
 # Новая модель для бронирования
 class Reservation(Base):
@@ -150,7 +176,7 @@ class Reservation(Base):
     id = Column(Integer, primary_key=True, index=True)
     
     item_id = Column(Integer, ForeignKey("items.id"), unique=True, nullable=False) # Элемент может быть забронирован только один раз
-    reserver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    reserver_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -187,6 +213,11 @@ class Comment(Base):
     item = relationship("Item", back_populates="comments")
     owner = relationship("User", back_populates="comments")
 
+    __table_args__ = (
+        # Последние комментарии элемента и курсорная пагинация по (created_at, id)
+        Index("ix_comments_item_id_created_at_id", "item_id", "created_at", "id"),
+    )
+
 # (Задача 2.4) Новая модель Friendship
 class Friendship(Base):
     """
@@ -198,22 +229,35 @@ class Friendship(Base):
     requester_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     addressee_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     status = Column(Enum(FriendshipStatus), default=FriendshipStatus.PENDING, nullable=False)
+    # Каноническое ребро: пара пользователей в порядке (меньший id, больший id).
+    # requester/addressee хранят направление заявки, поиск связи идет по паре
+    user_low_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_high_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
     requester = relationship("User", foreign_keys=[requester_id], back_populates="sent_friend_requests")
     addressee = relationship("User", foreign_keys=[addressee_id], back_populates="received_friend_requests")
 
     __table_args__ = (
-        UniqueConstraint('requester_id', 'addressee_id', name='unique_friendship_request'),
+        CheckConstraint('user_low_id < user_high_id', name='ck_friendships_canonical_pair'),
+        # Одна связь на пару в любом направлении; status в индексе — проверки дружбы без чтения таблицы
+        Index('ux_friendships_user_low_id_user_high_id', 'user_low_id', 'user_high_id',
+              unique=True, postgresql_include=['status']),
+        Index('ix_friendships_user_high_id_user_low_id', 'user_high_id', 'user_low_id',
+              postgresql_include=['status']),
     )
 
 # (Новая) Модель для уведомлений
 class Notification(Base):
     __tablename__ = "notifications"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Таблица разбита на помесячные партиции по created_at (app/db/partitions.py),
+    # поэтому created_at входит в первичный ключ и после вставки не меняется
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     is_read = Column(Boolean, default=False, nullable=False)
     type = Column(Enum(NotificationType), nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    # Время последнего действия (схлопнутые уведомления дополняются); по нему сортируется список
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
     # Кому предназначено уведомление
     recipient_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -227,6 +271,40 @@ class Notification(Base):
     related_item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), nullable=True)
     related_item = relationship("Item")
 
+    # Схлопывание («Алиса и еще 24»): лайки и комментарии к одному элементу за одно окно времени
+    # копятся в одной непрочитанной строке. sender — последний участник, created_at — начало окна.
+    actor_count = Column(Integer, default=1, server_default="1", nullable=False)
+    recent_actor_ids = Column(ARRAY(Integer), default=list, server_default="{}", nullable=False)
+    # Номер окна (время // NOTIFICATION_COALESCE_WINDOW); NULL — уведомление не схлопывается
+    coalesce_bucket = Column(Integer, nullable=True)
+    # Номер последнего события уведомления у получателя (создание или дополнение схлопнутого):
+    # по нему клиент после переподключения получает пропущенное (last_event_id). NULL — до появления номеров
+    event_seq = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        # Пропущенные события: диапазон event_seq получателя
+        Index("ix_notifications_recipient_id_event_seq", "recipient_id", "event_seq"),
+        # Последние уведомления пользователя: порядок (updated_at, id) целиком из индекса,
+        # по партициям — Merge Append с LIMIT без сортировки
+        Index("ix_notifications_recipient_id_updated_at", "recipient_id", "updated_at", "id"),
+        # Счетчик непрочитанных
+        Index("ix_notifications_recipient_id_is_read_created_at", "recipient_id", "is_read", "created_at"),
+        # Очистка старых прочитанных (app.maintenance): пачка — диапазон по индексу, без чтения партиции целиком
+        Index("ix_notifications_read_created_at", "created_at", postgresql_where=text("is_read")),
+        # Не больше одной открытой (непрочитанной) строки на элемент и окно — цель INSERT ... ON CONFLICT.
+        # Уникальный индекс партиционированной таблицы обязан содержать created_at (начало окна)
+        Index(
+            "ux_notifications_coalesce",
+            "recipient_id", "type", "related_item_id", "coalesce_bucket", "created_at",
+            unique=True,
+            postgresql_where=text("NOT is_read AND coalesce_bucket IS NOT NULL"),
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    # Серверные значения (created_at, updated_at) возвращаются RETURNING при вставке:
+    # сообщение WebSocket собирается до commit без повторного чтения строки
+    __mapper_args__ = {"eager_defaults": True}
+
 
 # (Этап 13) Новая модель для отслеживания целей
 class GoalTracker(Base):
@@ -259,4 +337,47 @@ class GoalLog(Base):
     value_added = Column(Float, nullable=False)
     logged_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    tracker = relationship("GoalTracker", back_populates="logs")
\ No newline at end of file
+    tracker = relationship("GoalTracker", back_populates="logs")
+
+
+# Refresh-токены: в БД хранится только sha256 от токена.
+# Токены одной цепочки обменов (от одного входа) объединены family_id
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    family_id = Column(UUID(as_uuid=True), index=True, nullable=False, default=uuid.uuid4)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Индексы по срокам — для очистки в app.maintenance (истекшие и давно отозванные токены)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    # Заполняется при обмене на новый токен или при отзыве; такой токен больше не принимается
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+
+    user = relationship("User", back_populates="refresh_tokens")
+
+    __table_args__ = (
+        Index("ix_refresh_tokens_revoked_at", "revoked_at", postgresql_where=text("revoked_at IS NOT NULL")),
+    )
+
+
+# Материализованная лента друзей (fan-out on write): строка на пару (читатель, список).
+# Заполняется при создании списка, смене приватности и принятии дружбы; лента читается
+# одним диапазоном по индексу (user_id, created_at, list_id).
+# Списки авторов с очень большим числом друзей сюда не раскладываются, а читаются на лету.
+class FeedEntry(Base):
+    __tablename__ = "feed_entries"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    list_id = Column(Integer, ForeignKey("lists.id", ondelete="CASCADE"), primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Копия lists.created_at: порядок и курсор ленты
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_feed_entries_user_id_created_at_list_id", "user_id", "created_at", "list_id"),
+        Index("ix_feed_entries_user_id_owner_id", "user_id", "owner_id"),
+        # Каскадное удаление записей при удалении списка
+        Index("ix_feed_entries_list_id", "list_id"),
+    )
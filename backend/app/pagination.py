@@ -0,0 +1,55 @@
+"""
+Курсорная (keyset) пагинация по паре (created_at, id).
+
+Курсор — непрозрачная для клиента строка: base64 от JSON с ключом последней отданной записи.
+Следующая страница выбирается условием (created_at, id) > (курсор), поэтому она стабильна
+при вставках и не требует OFFSET.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    payload = json.dumps({"c": created_at.isoformat(), "i": id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Разобрать курсор; некорректный курсор — ошибка 400."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(payload["c"]), int(payload["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def after_cursor(stmt, created_at_column, id_column, cursor: Optional[str], descending: bool = False):
+    """Добавить к запросу условие «после курсора» и сортировку по (created_at, id)."""
+    if cursor:
+        key = tuple_(*decode_cursor(cursor))
+        columns = tuple_(created_at_column, id_column)
+        stmt = stmt.where(columns < key if descending else columns > key)
+    if descending:
+        return stmt.order_by(created_at_column.desc(), id_column.desc())
+    return stmt.order_by(created_at_column, id_column)
+
+def split_page(
+    rows: Sequence[Any], limit: int, key: Optional[Callable[[Any], Any]] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Запрос выбирает limit + 1 строк: лишняя строка означает, что есть следующая страница.
+    Возвращает (строки страницы, курсор следующей страницы или None).
+    key достает из строки объект с created_at и id, если строка — кортеж.
+    """
+    page = list(rows[:limit])
+    if len(rows) > limit:
+        last = key(page[-1]) if key else page[-1]
+        return page, encode_cursor(last.created_at, last.id)
+    return page, None
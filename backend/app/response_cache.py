@@ -0,0 +1,77 @@
+"""
+Кэш готовых ответов (байты JSON) с ключом по версии.
+
+Запись хранит версию, для которой собран ответ; при изменении данных версия растет
+(например, lists.version), и старая запись просто перестает совпадать — TTL не нужен.
+
+Два уровня:
+- внутрипроцессный LRU (TTLCache без срока жизни);
+- необязательный общий уровень для всех воркеров — любой объект с методами get(key) -> Optional[bytes]
+  и set(key, value) в атрибуте shared. LocalSharedBackend — локальная замена
+  (тесты, один процесс); в рабочем окружении сюда подключается внешнее хранилище.
+Ошибки общего уровня не ломают запрос: ответ просто собирается заново.
+"""
+import logging
+from typing import Optional, Protocol
+
+from . import metrics
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class SharedBackend(Protocol):
+    def get(self, key: str) -> Optional[bytes]: ...
+    def set(self, key: str, value: bytes) -> None: ...
+
+
+class LocalSharedBackend:
+    """Общий уровень в памяти процесса."""
+
+    def __init__(self, maxsize: int = 10000):
+        self._data = TTLCache(maxsize=maxsize, ttl=None)
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._data.get(key)
+
+    def set(self, key: str, value: bytes) -> None:
+        self._data.set(key, value)
+
+
+class VersionedResponseCache:
+    def __init__(self, name: str, maxsize: int, shared: Optional[SharedBackend] = None):
+        self.name = name
+        self.shared = shared
+        # (key, version) -> body; записи старых версий вытесняются по LRU
+        self._local = TTLCache(maxsize=maxsize, ttl=None, name=name)
+
+    def _shared_key(self, key: str, version) -> str:
+        return f"{self.name}:{key}:{version}"
+
+    def get(self, key: str, version) -> Optional[bytes]:
+        body = self._local.get((key, version))
+        if body is not None or self.shared is None:
+            return body
+        try:
+            body = self.shared.get(self._shared_key(key, version))
+        except Exception:
+            logger.exception("Shared response cache get failed")
+            metrics.inc(f"cache.{self.name}.shared_errors")
+            return None
+        metrics.inc(f"cache.{self.name}.shared_{'hits' if body is not None else 'misses'}")
+        if body is not None:
+            self._local.set((key, version), body)
+        return body
+
+    def set(self, key: str, version, body: bytes) -> None:
+        self._local.set((key, version), body)
+        if self.shared is None:
+            return
+        try:
+            self.shared.set(self._shared_key(key, version), body)
+        except Exception:
+            logger.exception("Shared response cache set failed")
+            metrics.inc(f"cache.{self.name}.shared_errors")
+
+    def clear(self) -> None:
+        self._local.clear()
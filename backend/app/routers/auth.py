@@ -1,40 +1,58 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .. import crud, schemas, security
-from ..db.base import get_db
+from .. import async_crud, crud, hashing, schemas, security
+from ..db.base import get_async_db
 
 router = APIRouter()
 
+# Эндпоинты асинхронные: хеширование пароля выполняется в пуле процессов (hashing.py)
+# и не занимает потоки общего threadpool
+
+
+async def issue_token_pair(db: AsyncSession, user) -> dict:
+    """Access-токен и refresh-токен нового семейства (вход, смена пароля)."""
+    refresh_token, token_hash, expires_at = security.create_refresh_token()
+    await db.run_sync(lambda s: crud.create_refresh_token(db=s, user_id=user.id, token_hash=token_hash, expires_at=expires_at))
+    return {
+        "access_token": security.create_user_access_token(user),
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+    }
+
 
 @router.post("/register", response_model=schemas.UserRead, status_code=status.HTTP_201_CREATED)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     # --- ДОБАВИТЬ ПРОВЕРКУ НА УНИКАЛЬНОСТЬ ИМЕНИ ---
-    db_user_by_email = crud.get_user_by_email(db, email=user.email)
+    db_user_by_email = await async_crud.get_user_by_email(db, email=user.email)
     if db_user_by_email:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered",
         )
     # Проверяем имя
-    db_user_by_name = db.query(crud.models.User).filter(crud.models.User.name == user.name).first()
+    db_user_by_name = await async_crud.get_user_by_name(db, name=user.name)
     if db_user_by_name:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Name is already taken",
         )
-    return crud.create_user(db=db, user=user)
+    hashed_password = await hashing.hash_password(user.password)
+    return await db.run_sync(lambda s: crud.create_user(db=s, user=user, hashed_password=hashed_password))
 
 
 # --- ИЗМЕНИТЬ ЭТУ ФУНКЦИЮ ---
 @router.post("/token")
-def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)
 ):
     # Используем новую функцию для поиска по email или имени
-    user = crud.get_user_by_email_or_name(db, login_identifier=form_data.username)
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    user = await async_crud.get_user_by_email_or_name(db, login_identifier=form_data.username)
+    verified, new_hash = (False, None)
+    if user:
+        verified, new_hash = await hashing.verify_password(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             # Обновляем сообщение об ошибке
@@ -42,8 +60,42 @@ def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = security.create_access_token(
-        data={"sub": user.email} # В токен по-прежнему кладем email, это стандарт
-    )
+    # Стоимость хеширования изменилась — пересохраняем хеш, пока знаем пароль
+    if new_hash:
+        await db.run_sync(lambda s: crud.update_user_password_hash(db=s, db_user=user, hashed_password=new_hash))
+
+    # В токен по-прежнему кладем email (sub), а также id и версию токенов
+    return await issue_token_pair(db, user)
+
+
+@router.post("/refresh")
+async def refresh_access_token(data: schemas.RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    """
+    Обмен refresh-токена на новую пару токенов без проверки пароля.
+    Предъявленный токен становится недействительным; его повторное использование отзывает все семейство.
+    """
+    new_refresh_token, new_hash, expires_at = security.create_refresh_token()
+    user = await db.run_sync(lambda s: crud.rotate_refresh_token(
+        db=s,
+        token_hash=security.hash_refresh_token(data.refresh_token),
+        new_token_hash=new_hash,
+        expires_at=expires_at,
+    ))
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {
+        "access_token": security.create_user_access_token(user),
+        "refresh_token": new_refresh_token,
+        "token_type": "bearer",
+    }
+
 
-    return {"access_token": access_token, "token_type": "bearer"}
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(data: schemas.RefreshRequest, db: AsyncSession = Depends(get_async_db)):
+    """Отзыв refresh-токена (и всего его семейства)."""
+    token_hash = security.hash_refresh_token(data.refresh_token)
+    await db.run_sync(lambda s: crud.revoke_refresh_token(db=s, token_hash=token_hash))
@@ -1,29 +1,40 @@
 # backend/app/routers/feed.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 
-from .. import crud, schemas, models
-from ..dependencies import get_current_active_user
-from ..db.base import get_db
+from .. import async_crud, crud, etags, schemas, models, pagination
+from ..dependencies import get_current_active_read_user_async, get_async_read_db
 
 router = APIRouter()
 
-@router.get("/friends-lists", response_model=List[schemas.ListForFeedRead])
-def get_friends_feed(
-    skip: int = 0,
-    limit: int = 10,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+@router.get("/friends-lists", response_model=schemas.FeedPage)
+async def get_friends_feed(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(crud.FEED_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(get_current_active_read_user_async)
 ):
     """
-    Получает ленту списков от друзей пользователя с пагинацией.
+    Получает ленту списков от друзей пользователя с курсорной пагинацией
+    (следующая страница — с cursor=next_cursor из предыдущего ответа).
+    ETag — по (id, version) списков страницы: считается из строк той же выборки,
+    при совпадении If-None-Match ответ не собирается.
     """
-    db_lists = crud.get_friends_feed_lists(db, user_id=current_user.id, skip=skip, limit=limit)
-    
+    rows, next_cursor = await async_crud.get_friends_feed_lists(db, user_id=current_user.id, cursor=cursor, limit=limit)
+    # Версия списка меняется и при изменении элементов (items_count) и владельца
+    versions = [(db_list.id, db_list.version) for db_list, _ in rows]
+    etag = etags.make_etag("feed", current_user.id, cursor, limit, versions, next_cursor)
+    not_modified = etags.not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    etags.set_etag(response, etag)
+
     # Вручную конструируем ответ, чтобы включить items_count
     response_lists = []
-    for db_list in db_lists:
+    for db_list, items_count in rows:
         list_data = schemas.ListForFeedRead(
             id=db_list.id,
             public_url_key=db_list.public_url_key, # <--- ДОБАВЛЕНО ПОЛЕ
@@ -34,8 +45,8 @@ def get_friends_feed(
             theme_name=db_list.theme_name,
             owner=db_list.owner,
             created_at=db_list.created_at,
-            items_count=len(db_list.items)
+            items_count=items_count
         )
         response_lists.append(list_data)
 
-    return response_lists
\ No newline at end of file
+    return schemas.FeedPage(items=response_lists, next_cursor=next_cursor)
@@ -5,7 +5,7 @@ from typing import List
 from fastapi import BackgroundTasks
 from ..ws_manager import send_notification_ws
 
-from .. import crud, schemas, models
+from .. import crud, schemas, models, social_graph
 from ..dependencies import get_current_active_user
 from ..db.base import get_db
 
@@ -64,14 +64,15 @@ def send_friend_request(
     if existing_friendship:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A friendship or request already exists between you and this user.")
         
-    # ИЗМЕНЕНИЕ: create_friend_request теперь возвращает объект уведомления
-    friendship_request = crud.create_friend_request(db, requester_id=current_user.id, addressee_id=addressee_id)
-    
-    # Находим связанное уведомление
-    notification = friendship_request.addressee.notifications[-1] # Последнее уведомление получателя
+    # Заявка и уведомление получателю пишутся одной транзакцией
+    created = crud.create_friend_request(db, requester_id=current_user.id, addressee_id=addressee_id, requester=current_user)
+    if created is None:
+        # Встречная заявка успела появиться между проверкой и вставкой
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A friendship or request already exists between you and this user.")
+    _, event = created
 
-    # Добавляем задачу в фон
-    background_tasks.add_task(send_notification_ws, notification)
+    # Добавляем задачу в фон: сообщение уже собрано в транзакции заявки
+    background_tasks.add_task(send_notification_ws, event.message)
     
     return {"message": "Friend request sent."}
 
@@ -91,6 +92,7 @@ def accept_friend_request(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You can only accept requests addressed to you.")
         
     crud.update_friendship_status(db, db_friendship=db_request, status=models.FriendshipStatus.ACCEPTED)
+    social_graph.invalidate(db_request.requester_id, db_request.addressee_id)
     return {"message": "Friend request accepted."}
     
 @router.post("/decline/{request_id}", status_code=status.HTTP_200_OK)
@@ -108,7 +110,9 @@ def decline_friend_request(
     if db_request.addressee_id != current_user.id and db_request.requester_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You cannot decline this request.")
         
+    user_ids = (db_request.requester_id, db_request.addressee_id)
     crud.delete_friendship(db, db_friendship=db_request)
+    social_graph.invalidate(*user_ids)
     return {"message": "Friend request declined."}
 
 @router.delete("/{friendship_id}", status_code=status.HTTP_200_OK)
@@ -126,5 +130,7 @@ def remove_friend(
     if db_friendship.requester_id != current_user.id and db_friendship.addressee_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="You are not part of this friendship.")
         
+    user_ids = (db_friendship.requester_id, db_friendship.addressee_id)
     crud.delete_friendship(db, db_friendship=db_friendship)
+    social_graph.invalidate(*user_ids)
     return {"message": "Friend removed successfully."}
\ No newline at end of file
@@ -52,35 +52,4 @@ def log_goal_progress(
     if db_tracker.item.list.owner_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions to log progress for this goal")
 
-    # 3. Создать новую запись в таблице GoalLog
-    db_log = models.GoalLog(
-        tracker_id=db_tracker.id,
-        value_added=log_data.value
-    )
-    db.add(db_log)
-
-    # 4. Обновить поле current_value в трекере
-    db_tracker.current_value += log_data.value
-    
-    # (ИЗМЕНЕНИЕ) Добавляем защиту от отрицательного прогресса
-    if db_tracker.current_value < 0:
-        db_tracker.current_value = 0
-
-    # 5 & 6. Проверить, выполнена ли цель и обновить связанный Item
-    is_completed = False
-    if db_tracker.goal_type == models.GoalType.CUMULATIVE:
-        if db_tracker.target_value is not None and db_tracker.current_value >= db_tracker.target_value:
-            is_completed = True
-    elif db_tracker.goal_type == models.GoalType.CHECK_IN:
-        if db_tracker.target_count is not None and db_tracker.current_value >= db_tracker.target_count:
-            is_completed = True
-    
-    if is_completed and not db_tracker.item.is_completed:
-        db_tracker.item.is_completed = True
-
-    # 7. Сохранить все изменения в базе
-    db.commit()
-    db.refresh(db_tracker)
-
-    # 8. Вернуть обновленный трекер
-    return db_tracker
\ No newline at end of file
+    return crud.log_goal_progress(db=db, db_tracker=db_tracker, value=log_data.value)
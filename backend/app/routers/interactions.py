@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 # --- ДОБАВИТЬ ИМПОРТЫ ---
 from fastapi import BackgroundTasks
 from ..ws_manager import send_notification_ws
 
-from .. import crud, schemas, models
-from ..dependencies import get_current_active_user
+from .. import crud, async_crud, pagination, schemas, models
+from ..dependencies import get_current_active_user, get_optional_read_user_async, get_async_read_db
 from ..db.base import get_db
 
 router = APIRouter(
@@ -30,12 +32,10 @@ def like_item(
     if existing_like:
         raise HTTPException(status_code=409, detail="Вы уже лайкнули этот элемент")
 
-    # ИЗМЕНЕНИЕ: add_like теперь возвращает объект
-    db_like = crud.add_like(db=db, item=db_item, user=current_user)
-    if db_like.item.list.owner_id != current_user.id:
-        # Находим уведомление
-        notification = db_like.item.list.owner.notifications[-1]
-        background_tasks.add_task(send_notification_ws, notification)
+    # Лайк и уведомление владельцу пишутся одной транзакцией; сообщение WebSocket собрано в ней же
+    _, event = crud.add_like(db=db, item=db_item, user=current_user)
+    if event is not None:
+        background_tasks.add_task(send_notification_ws, event.message)
     return
 
 @router.delete("/items/{item_id}/like", status_code=status.HTTP_204_NO_CONTENT)
@@ -71,14 +71,48 @@ def create_comment_for_item(
     if not db_item:
         raise HTTPException(status_code=404, detail="Элемент не найден")
 
-    # ИЗМЕНЕНИЕ: create_comment теперь возвращает объект
-    db_comment = crud.create_comment(db=db, comment_data=comment_data, item_id=item_id, user_id=current_user.id)
-    if db_comment.item.list.owner_id != current_user.id:
-        notification = db_comment.item.list.owner.notifications[-1]
-        background_tasks.add_task(send_notification_ws, notification)
+    db_comment, event = crud.create_comment(
+        db=db, comment_data=comment_data, item=db_item, user_id=current_user.id, user=current_user
+    )
+    if event is not None:
+        background_tasks.add_task(send_notification_ws, event.message)
     return db_comment
 
 
+@router.get("/items/{item_id}/comments", response_model=schemas.CommentsPage)
+async def read_item_comments(
+    item_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: Optional[schemas.UserPrincipal] = Depends(get_optional_read_user_async)
+):
+    """
+    Комментарии элемента постранично, от новых к старым.
+    В ответах со списками приходят только последние комментарии и их общее число.
+    """
+    db_item = await async_crud.get_item(db, item_id=item_id)
+    if not db_item:
+        raise HTTPException(status_code=404, detail="Элемент не найден")
+
+    # Комментарии видны тем же, кому виден список (как в /lists/{id} и /public/lists/{key})
+    db_list = db_item.list
+    is_owner = current_user is not None and current_user.id == db_list.owner_id
+    if not is_owner and db_list.privacy_level != models.PrivacyLevel.PUBLIC:
+        if current_user is None:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        if db_list.privacy_level == models.PrivacyLevel.PRIVATE or not await async_crud.are_users_friends(
+            db, user1_id=current_user.id, user2_id=db_list.owner_id
+        ):
+            raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    comments, next_cursor = await async_crud.get_item_comments_page(db, item_id=item_id, cursor=cursor, limit=limit)
+    return schemas.CommentsPage(
+        items=[schemas.CommentRead.from_orm(c) for c in comments],
+        next_cursor=next_cursor,
+    )
+
+
 @router.delete("/comments/{comment_id}", response_model=schemas.CommentRead)
 def delete_comment(
     comment_id: int,
@@ -110,7 +144,7 @@ def copy_item_to_own_list(
     if not source_item:
         raise HTTPException(status_code=404, detail="Source item not found")
 
-    target_list = crud.get_list(db, list_id=copy_data.target_list_id)
+    target_list = crud.get_list_header(db, list_id=copy_data.target_list_id)
     if not target_list:
         raise HTTPException(status_code=404, detail="Target list not found")
     if target_list.owner_id != current_user.id:
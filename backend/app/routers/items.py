@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, File, UploadFile
+from fastapi import APIRouter, Depends, HTTPException, Request, status, File, UploadFile
 from sqlalchemy.orm import Session
 from typing import List
 import os
 from PIL import Image
 
-from .. import crud, schemas, models
+from .. import crud, etags, schemas, models
 from ..dependencies import get_current_active_user
 from ..db.base import get_db
 
@@ -18,7 +18,7 @@ def create_item_for_list(
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Создание нового элемента в конкретном списке."""
-    db_list = crud.get_list(db, list_id=list_id)
+    db_list = crud.get_list_header(db, list_id=list_id)
     if not db_list:
         raise HTTPException(status_code=404, detail="Список не найден")
     if db_list.owner_id != current_user.id:
@@ -34,14 +34,21 @@ def create_item_for_list(
     
     return crud.create_list_item(db=db, item_data=item_data, list_id=list_id)
 
+def _expected_list_version(request: Request, db_list: models.List, current_user_id: int):
+    """Версия списка, которую ждет клиент (If-Match), или None, если условия нет."""
+    if etags.if_match(request, etags.list_etag(db_list.id, db_list.version, current_user_id)):
+        return db_list.version
+    return None
+
 @router.put("/items/{item_id}", response_model=schemas.ItemRead)
 def update_item(
     item_id: int,
     item_data: schemas.ItemUpdate,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Обновление элемента по его ID."""
+    """Обновление элемента по его ID. If-Match — ETag списка из GET /lists/{list_id} (иначе 412)."""
     db_item = crud.get_item(db, item_id=item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Элемент не найден")
@@ -49,16 +56,23 @@ def update_item(
     # Проверяем, что пользователь является владельцем списка, к которому относится элемент
     if db_item.list.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
-        
-    return crud.update_item(db=db, db_item=db_item, item_data=item_data)
+
+    updated_item = crud.update_item(
+        db=db, db_item=db_item, item_data=item_data,
+        expected_version=_expected_list_version(request, db_item.list, current_user.id),
+    )
+    if updated_item is None:
+        raise etags.precondition_failed()
+    return updated_item
 
 @router.delete("/items/{item_id}", response_model=schemas.ItemRead)
 def delete_item(
     item_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Удаление элемента по его ID."""
+    """Удаление элемента по его ID. If-Match — ETag списка из GET /lists/{list_id} (иначе 412)."""
     db_item = crud.get_item(db, item_id=item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Элемент не найден")
@@ -66,8 +80,14 @@ def delete_item(
     # Проверяем, что пользователь является владельцем списка
     if db_item.list.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Недостаточно прав")
-        
-    return crud.delete_item(db=db, db_item=db_item)
+
+    deleted_item = crud.delete_item(
+        db=db, db_item=db_item,
+        expected_version=_expected_list_version(request, db_item.list, current_user.id),
+    )
+    if deleted_item is None:
+        raise etags.precondition_failed()
+    return deleted_item
 
 @router.post("/items/{item_id}/upload-image", response_model=schemas.ItemRead)
 def upload_item_image(
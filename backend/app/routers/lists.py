@@ -1,38 +1,52 @@
 # backend/app/routers/lists.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional
 
-from .. import crud, schemas, models
-from ..dependencies import get_current_active_user
-from ..db.base import get_db
+from .. import crud, async_crud, etags, pagination, schemas, models
+from ..dependencies import get_current_active_user_async, get_current_active_read_user_async, get_async_read_db
+from ..db.base import get_async_db
 
 router = APIRouter()
 
-# Вспомогательная функция для сборки ответа
-def assemble_list_response(db_list: models.List, current_user_id: int) -> schemas.ListRead:
-    items_response = []
-    for item in db_list.items:
-        likes_count = len(item.likes)
-        is_liked = any(like.user_id == current_user_id for like in item.likes)
-        
-        item_data = schemas.ItemRead(
-            id=item.id,
-            list_id=item.list_id,
-            title=item.title,
-            description=item.description,
-            image_url=item.image_url, # <-- ДОБАВЛЕНО НА ВСЯКИЙ СЛУЧАЙ, ЕСЛИ ПРОПУСТИЛИ
-            thumbnail_url=item.thumbnail_url, # <-- ДОБАВЛЕНО НА ВСЯКИЙ СЛУЧАЙ, ЕСЛИ ПРОПУСТИЛИ
-            is_completed=item.is_completed, # <--- ВОТ ИСПРАВЛЕНИЕ!
-            created_at=item.created_at,
-            updated_at=item.updated_at,
-            likes_count=likes_count,
-            is_liked_by_current_user=is_liked,
-            comments=[schemas.CommentRead.from_orm(c) for c in item.comments],
-            goal_tracker=item.goal_tracker # <-- ДОБАВЛЕНО ДЛЯ ПОЛНОТЫ
-        )
-        items_response.append(item_data)
+# Вспомогательные функции для сборки ответа.
+# Лайки и комментарии передаются готовыми агрегатами (async_crud.get_item_like_stats,
+# async_crud.get_comment_previews): строки Like и полные ветки комментариев не загружаются
+def assemble_item_response(
+    item: models.Item,
+    like_stats: Dict[int, crud.LikeStats],
+    comment_previews: Dict[int, crud.CommentPreview],
+) -> schemas.ItemRead:
+    stats = like_stats.get(item.id, crud.LikeStats())
+    preview = comment_previews.get(item.id, crud.CommentPreview())
+    return schemas.ItemRead(
+        id=item.id,
+        list_id=item.list_id,
+        title=item.title,
+        description=item.description,
+        image_url=item.image_url, # <-- ДОБАВЛЕНО НА ВСЯКИЙ СЛУЧАЙ, ЕСЛИ ПРОПУСТИЛИ
+        thumbnail_url=item.thumbnail_url, # <-- ДОБАВЛЕНО НА ВСЯКИЙ СЛУЧАЙ, ЕСЛИ ПРОПУСТИЛИ
+        is_completed=item.is_completed, # <--- ВОТ ИСПРАВЛЕНИЕ!
+        created_at=item.created_at,
+        updated_at=item.updated_at,
+        likes_count=stats.likes_count,
+        is_liked_by_current_user=stats.is_liked,
+        comments_count=preview.comments_count,
+        comments=[schemas.CommentRead.from_orm(c) for c in preview.comments],
+        goal_tracker=item.goal_tracker # <-- ДОБАВЛЕНО ДЛЯ ПОЛНОТЫ
+    )
+
+def assemble_list_response(
+    db_list: models.List,
+    like_stats: Dict[int, crud.LikeStats],
+    comment_previews: Dict[int, crud.CommentPreview],
+    items: Optional[List[models.Item]] = None,
+    next_cursor: Optional[str] = None,
+) -> schemas.ListRead:
+    # items — страница элементов; если не передана, берутся загруженные db_list.items
+    items = db_list.items if items is None else items
+    items_response = [assemble_item_response(item, like_stats, comment_previews) for item in items]
     
     return schemas.ListRead(
         id=db_list.id,
@@ -45,95 +59,151 @@ def assemble_list_response(db_list: models.List, current_user_id: int) -> schema
         theme_name=db_list.theme_name,
         created_at=db_list.created_at,
         updated_at=db_list.updated_at,
-        items=items_response
+        items=items_response,
+        next_cursor=next_cursor
     )
 
+async def _list_response(db: AsyncSession, db_list: models.List, current_user_id: int) -> schemas.ListRead:
+    """Заголовок списка и первая страница элементов."""
+    items, next_cursor = await async_crud.get_list_items_page(db, list_id=db_list.id)
+    item_ids = [item.id for item in items]
+    like_stats = await async_crud.get_item_like_stats(db, item_ids, current_user_id)
+    comment_previews = await async_crud.get_comment_previews(db, item_ids)
+    return assemble_list_response(db_list, like_stats, comment_previews, items, next_cursor)
+
+async def _get_readable_list(db: AsyncSession, list_id: int, current_user: schemas.UserPrincipal) -> models.List:
+    """Заголовок списка, если текущий пользователь может его просматривать; иначе 404/403."""
+    db_list = await async_crud.get_list_header(db, list_id=list_id)
+    if db_list is None:
+        raise HTTPException(status_code=404, detail="List not found")
+    
+    # --- (Задача 6.1) Новая логика проверки доступа ---
+    is_owner = db_list.owner_id == current_user.id
+    
+    if is_owner:
+        return db_list
+
+    if db_list.privacy_level == models.PrivacyLevel.PRIVATE:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    if db_list.privacy_level == models.PrivacyLevel.FRIENDS_ONLY:
+        are_friends = await async_crud.are_users_friends(db, user1_id=current_user.id, user2_id=db_list.owner_id)
+        if not are_friends:
+            raise HTTPException(status_code=403, detail="This list is only available to friends.")
+
+    # Если дошли сюда, значит список публичный или для друзей (и мы друг)
+    return db_list
+
+async def _get_owned_list(db: AsyncSession, list_id: int, current_user: schemas.UserPrincipal) -> models.List:
+    db_list = await async_crud.get_list_header(db, list_id=list_id)
+    if db_list is None:
+        raise HTTPException(status_code=404, detail="List not found")
+    if db_list.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return db_list
+
 @router.post("/", response_model=schemas.ListRead, status_code=status.HTTP_201_CREATED)
-def create_list(
+async def create_list(
     list_data: schemas.ListCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_active_user_async)
 ):
     """Создание нового списка для текущего пользователя."""
-    db_list = crud.create_user_list(db=db, list_data=list_data, user_id=current_user.id)
+    db_list = await db.run_sync(lambda s: crud.create_user_list(db=s, list_data=list_data, user_id=current_user.id))
     # Возвращаем через assemble_list_response, чтобы сразу были все поля
-    return assemble_list_response(db_list, current_user.id)
+    return await _list_response(db, db_list, current_user.id)
 
 
 @router.get("/", response_model=List[schemas.ListRead])
-def read_user_lists(
+async def read_user_lists(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(get_current_active_read_user_async)
 ):
     """Получение всех списков текущего пользователя."""
-    lists = crud.get_lists_by_user(db, user_id=current_user.id, skip=skip, limit=limit)
+    lists = await async_crud.get_lists_by_user(db, user_id=current_user.id, skip=skip, limit=limit)
+    # Лайки и комментарии всех элементов всех списков — по одному агрегирующему запросу
+    item_ids = [item.id for l in lists for item in l.items]
+    like_stats = await async_crud.get_item_like_stats(db, item_ids, current_user.id)
+    comment_previews = await async_crud.get_comment_previews(db, item_ids)
     # Прогоняем каждый список через сборщик, чтобы обеспечить консистентность данных
-    return [assemble_list_response(l, current_user.id) for l in lists]
+    return [assemble_list_response(l, like_stats, comment_previews) for l in lists]
 
 
 @router.get("/{list_id}", response_model=schemas.ListRead)
-def read_list(
+async def read_list(
     list_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(get_current_active_read_user_async)
 ):
-    """Получение одного списка по ID."""
-    db_list = crud.get_list(db, list_id=list_id)
-    if db_list is None:
-        raise HTTPException(status_code=404, detail="List not found")
-    
-    # --- (Задача 6.1) Новая логика проверки доступа ---
-    is_owner = db_list.owner_id == current_user.id
-    
-    if is_owner:
-        return assemble_list_response(db_list, current_user.id)
-
-    if db_list.privacy_level == models.PrivacyLevel.PRIVATE:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-
-    if db_list.privacy_level == models.PrivacyLevel.FRIENDS_ONLY:
-        are_friends = crud.are_users_friends(db, user1_id=current_user.id, user2_id=db_list.owner_id)
-        if not are_friends:
-            raise HTTPException(status_code=403, detail="This list is only available to friends.")
-
-    # Если дошли сюда, значит список публичный или для друзей (и мы друг)
-    return assemble_list_response(db_list, current_user.id)
+    """Получение одного списка по ID: заголовок и первая страница элементов (с ETag)."""
+    db_list = await _get_readable_list(db, list_id, current_user)
+    etag = etags.list_etag(db_list.id, db_list.version, current_user.id)
+    # Версия уже в заголовке списка: элементы, лайки и комментарии не читаются
+    not_modified = etags.not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    etags.set_etag(response, etag)
+    return await _list_response(db, db_list, current_user.id)
+
+
+@router.get("/{list_id}/items", response_model=schemas.ItemsPage)
+async def read_list_items(
+    list_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: models.User = Depends(get_current_active_read_user_async)
+):
+    """Следующие страницы элементов списка (курсор из next_cursor предыдущего ответа)."""
+    await _get_readable_list(db, list_id, current_user)
+    items, next_cursor = await async_crud.get_list_items_page(db, list_id=list_id, cursor=cursor, limit=limit)
+    item_ids = [item.id for item in items]
+    like_stats = await async_crud.get_item_like_stats(db, item_ids, current_user.id)
+    comment_previews = await async_crud.get_comment_previews(db, item_ids)
+    return schemas.ItemsPage(
+        items=[assemble_item_response(item, like_stats, comment_previews) for item in items],
+        next_cursor=next_cursor,
+    )
 
 
 @router.put("/{list_id}", response_model=schemas.ListRead)
-def update_list(
+async def update_list(
     list_id: int,
     list_data: schemas.ListUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_active_user_async)
 ):
-    """Обновление списка."""
-    db_list = crud.get_list(db, list_id=list_id)
-    if db_list is None:
-        raise HTTPException(status_code=404, detail="List not found")
-    if db_list.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-    
-    updated_list = crud.update_list(db=db, db_list=db_list, list_data=list_data)
+    """Обновление списка. С If-Match — только если список не изменился с момента чтения (иначе 412)."""
+    db_list = await _get_owned_list(db, list_id, current_user)
+    expected_version = None
+    if etags.if_match(request, etags.list_etag(db_list.id, db_list.version, current_user.id)):
+        expected_version = db_list.version
+
+    updated_list = await db.run_sync(
+        lambda s: crud.update_list(db=s, db_list=db_list, list_data=list_data, expected_version=expected_version)
+    )
+    if updated_list is None:
+        raise etags.precondition_failed()
+    etags.set_etag(response, etags.list_etag(updated_list.id, updated_list.version, current_user.id))
     # Возвращаем обновленные данные с лайками и комментами
-    return assemble_list_response(updated_list, current_user.id)
+    return await _list_response(db, updated_list, current_user.id)
 
 
 @router.delete("/{list_id}", response_model=schemas.ListRead)
-def delete_list(
+async def delete_list(
     list_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_active_user_async)
 ):
     """Удаление списка."""
-    db_list = crud.get_list(db, list_id=list_id)
-    if db_list is None:
-        raise HTTPException(status_code=404, detail="List not found")
-    if db_list.owner_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not enough permissions")
-    
-    response_data = assemble_list_response(db_list, current_user.id)
-    crud.delete_list(db=db, db_list=db_list)
+    db_list = await _get_owned_list(db, list_id, current_user)
+
+    response_data = await _list_response(db, db_list, current_user.id)
+    await db.run_sync(lambda s: crud.delete_list(db=s, db_list=db_list))
     return response_data
\ No newline at end of file
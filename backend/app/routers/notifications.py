@@ -1,16 +1,17 @@
 # backend/app/routers/notifications.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List # <--- Убедитесь, что List импортирован
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional # <--- Убедитесь, что List импортирован
 
-from .. import crud, schemas, models
-from ..dependencies import get_current_active_user
-from ..db.base import get_db
+from .. import crud, async_crud, etags, schemas, models
+from ..dependencies import get_current_active_user_async, get_websocket_user
+from ..db.base import get_async_db, get_async_session_factory
 # --- ДОБАВИТЬ ИМПОРТЫ ---
 from fastapi import WebSocket, WebSocketDisconnect
-from ..ws_manager import manager # Импортируем наш менеджер
-from ..security import decode_token # Для декодирования токена из query
+from ..ws_manager import (  # Импортируем наш менеджер
+    RESYNC, ClientConnection, encode_notification, manager, send_unread_count_ws
+)
 
 router = APIRouter(
     prefix="/notifications",
@@ -18,13 +19,23 @@ router = APIRouter(
 )
 
 @router.get("/", response_model=schemas.NotificationsResponse)
-def get_my_notifications(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+async def get_my_notifications(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_active_user_async)
 ):
-    """Получить уведомления текущего пользователя и количество непрочитанных."""
-    db_notifications = crud.get_notifications_for_user(db, user_id=current_user.id)
-    unread_count = crud.count_unread_notifications(db, user_id=current_user.id)
+    """Получить уведомления текущего пользователя и количество непрочитанных (с ETag)."""
+    # Счетчик непрочитанных хранится в users и приходит вместе с версией — COUNT не нужен
+    version = await async_crud.get_notifications_version(db, user_id=current_user.id)
+    etag = etags.make_etag("notifications", current_user.id, version)
+    not_modified = etags.not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    etags.set_etag(response, etag)
+
+    db_notifications = await async_crud.get_notifications_for_user(db, user_id=current_user.id)
+    unread_count = version[-1]
     
     # --- НАЧАЛО ИЗМЕНЕНИЙ ---
     # Вручную создаем список ответов, чтобы добавить вложенные данные
@@ -41,53 +52,96 @@ def get_my_notifications(
                 is_read=notification.is_read,
                 type=notification.type,
                 created_at=notification.created_at,
+                updated_at=notification.updated_at,
                 sender=notification.sender,
                 related_item_id=notification.related_item_id,
-                related_list_id=list_id # <--- Передаем ID списка
+                related_list_id=list_id, # <--- Передаем ID списка
+                actor_count=notification.actor_count,
+                event_id=notification.event_seq,
             )
         )
     # --- КОНЕЦ ИЗМЕНЕНИЙ ---
 
     return {"unread_count": unread_count, "notifications": response_notifications}
 
+@router.post("/read-all", response_model=schemas.UnreadCount)
+async def mark_all_as_read(
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_active_user_async)
+):
+    """Пометить все уведомления прочитанными."""
+    unread_count = await async_crud.mark_all_notifications_as_read(db, user_id=current_user.id)
+    background_tasks.add_task(send_unread_count_ws, current_user.id, unread_count)
+    return {"unread_count": unread_count}
+
 @router.post("/{notification_id}/read", response_model=schemas.NotificationRead)
-def mark_as_read(
+async def mark_as_read(
     notification_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: models.User = Depends(get_current_active_user_async)
 ):
     """Пометить конкретное уведомление как прочитанное."""
-    updated_notification = crud.mark_notification_as_read(db, notification_id=notification_id, user_id=current_user.id)
-    if not updated_notification:
+    marked = await async_crud.mark_notification_as_read(db, notification_id=notification_id, user_id=current_user.id)
+    if not marked:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Notification not found or already read")
+    updated_notification, unread_count = marked
+    # Остальные вкладки и устройства пользователя обновляют значок без опроса
+    background_tasks.add_task(send_unread_count_ws, current_user.id, unread_count)
     return updated_notification
 
+async def _replay_missed_events(connection: ClientConnection, user_id: int, last_event_id: int, session_factory) -> None:
+    """
+    Повторить события после last_event_id одним кадром (одно чтение диапазона по индексу).
+    Соединение уже зарегистрировано, поэтому новые события не теряются; повторы клиент отбрасывает по event_id.
+    """
+    limit = crud.NOTIFICATION_REPLAY_LIMIT
+    async with session_factory() as db:
+        notifications = await async_crud.get_notification_events_since(db, user_id, last_event_id, limit + 1)
+        if len(notifications) > limit:
+            connection.enqueue(RESYNC)
+            return
+        messages = [
+            encode_notification(
+                notification,
+                notification.sender,
+                notification.related_item.list_id if notification.related_item else None,
+                replayed=True,
+            ).payload
+            for notification in notifications
+        ]
+    if messages:
+        connection.enqueue(f"[{','.join(messages)}]")
+
 # --- НОВЫЙ WEBSOCKET ЭНДПОИНТ ---
 @router.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
     token: str, # Получаем токен как query-параметр
-    db: Session = Depends(get_db)
+    last_event_id: Optional[int] = None, # Последнее полученное событие: после переподключения повторяются более новые
+    session_factory=Depends(get_async_session_factory)
 ):
     """
     Эндпоинт для WebSocket соединений.
     Аутентификация происходит по токену, переданному в query-параметрах.
+    Сессия БД нужна только на проверку токена и повтор пропущенного: соединение живет часами
+    и не должно держать соединение из пула.
     """
-    payload = decode_token(token)
-    if not payload or not payload.get("sub"):
-        await websocket.close(code=1008)
-        return
-    
-    user = crud.get_user_by_email(db, email=payload.get("sub"))
-    if not user:
+    user = await get_websocket_user(token, session_factory)
+    if user is None:
         await websocket.close(code=1008)
         return
 
-    await manager.connect(websocket, user.id)
+    connection = await manager.connect(websocket, user.id)
+    if connection is None:
+        # Лимит соединений воркера исчерпан: сокет уже закрыт с 1013
+        return
     try:
-        while True:
-            # Просто держим соединение открытым, слушая клиента
-            # В будущем здесь можно обрабатывать входящие сообщения от клиента
-            await websocket.receive_text()
+        if last_event_id is not None:
+            await _replay_missed_events(connection, user.id, last_event_id, session_factory)
+        await manager.listen(connection)
     except WebSocketDisconnect:
-        manager.disconnect(user.id)
\ No newline at end of file
+        pass
+    finally:
+        manager.disconnect(connection)
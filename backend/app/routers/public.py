@@ -1,29 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 from typing import List, Optional
+import os
 
-from .. import crud, schemas, models
-from ..db.base import get_db
-from ..dependencies import get_optional_current_user
+from .. import async_crud, crud, schemas, models
+from ..dependencies import get_optional_read_user_async, get_async_read_db
+from ..response_cache import LocalSharedBackend, VersionedResponseCache
 
 # --- ИЗМЕНЕНИЕ ЗДЕСЬ: Убираем prefix="/public" ---
 router = APIRouter(
     tags=["public"]
 )
 
+# Кэш ответов для публичных списков: ответ не зависит от зрителя, ключ — (public_key, lists.version).
+# PUBLIC_LIST_CACHE_SHARED=local включает локальную замену общего уровня
+PUBLIC_LIST_CACHE_SIZE = int(os.environ.get("PUBLIC_LIST_CACHE_SIZE", "1000"))
+public_list_cache = VersionedResponseCache("public_lists", maxsize=PUBLIC_LIST_CACHE_SIZE)
+if os.environ.get("PUBLIC_LIST_CACHE_SHARED") == "local":
+    public_list_cache.shared = LocalSharedBackend()
+
+def _json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
 # --- ИЗМЕНЕНИЕ: Вся функция была обновлена для возврата структурированных ошибок ---
 @router.get("/lists/{public_key}", response_model=schemas.ListPublicRead)
-def read_public_list(
+async def read_public_list(
     public_key: UUID, 
-    db: Session = Depends(get_db),
-    current_user: Optional[models.User] = Depends(get_optional_current_user)
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: Optional[models.User] = Depends(get_optional_read_user_async)
 ):
     """
     Получение публичного списка или списка для друзей по его уникальному ключу.
     Аутентификация опциональна.
     """
-    db_list = crud.get_list_by_public_key(db, public_key=public_key)
+    # Сначала только версия списка: готовый ответ отдается без загрузки и сериализации
+    head = await async_crud.get_list_version_by_public_key(db, public_key=public_key)
+    if head is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="List not found")
+    is_cacheable = head.privacy_level == models.PrivacyLevel.PUBLIC
+    if is_cacheable:
+        body = public_list_cache.get(str(public_key), head.version)
+        if body is not None:
+            return _json_response(body)
+
+    db_list = await async_crud.get_list_by_public_key(db, public_key=public_key)
     
     if db_list is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="List not found")
@@ -51,7 +72,7 @@ def read_public_list(
         is_owner = current_user.id == db_list.owner_id
         # Проверяем дружбу только если текущий пользователь НЕ является владельцем
         if not is_owner:
-            are_friends = crud.are_users_friends(db, user1_id=current_user.id, user2_id=db_list.owner_id)
+            are_friends = await async_crud.are_users_friends(db, user1_id=current_user.id, user2_id=db_list.owner_id)
             if not are_friends:
                 # Если они не друзья - ошибка 403 с данными владельца
                 raise HTTPException(
@@ -70,16 +91,22 @@ def read_public_list(
         
     # Создаем ответ вручную, чтобы добавить поле is_reserved
     items_with_extra_data = []
+    item_ids = [item.id for item in db_list.items]
+    like_stats = await async_crud.get_item_like_stats(db, item_ids)
+    comment_previews = await async_crud.get_comment_previews(db, item_ids)
+    # Брони всех элементов — одним запросом, а не по запросу на элемент
+    reserved_item_ids = await async_crud.get_reserved_item_ids(db, item_ids)
     for item in db_list.items:
-        reservation = crud.get_reservation_by_item_id(db, item_id=item.id)
+        preview = comment_previews.get(item.id, crud.CommentPreview())
         
         item_data = schemas.ItemPublicRead(
             id=item.id,
             title=item.title,
             description=item.description,
-            is_reserved=reservation is not None,
-            likes_count=len(item.likes),
-            comments=[schemas.CommentRead.from_orm(c) for c in item.comments]
+            is_reserved=item.id in reserved_item_ids,
+            likes_count=like_stats.get(item.id, crud.LikeStats()).likes_count,
+            comments_count=preview.comments_count,
+            comments=[schemas.CommentRead.from_orm(c) for c in preview.comments]
         )
         items_with_extra_data.append(item_data)
         
@@ -94,5 +121,10 @@ def read_public_list(
         theme_name=db_list.theme_name,
         items=items_with_extra_data
     )
-        
-    return public_list_data
\ No newline at end of file
+
+    if not is_cacheable:
+        return public_list_data
+    # Версия взята до чтения данных, поэтому ответ не старше ее
+    body = public_list_data.model_dump_json().encode()
+    public_list_cache.set(str(public_key), head.version, body)
+    return _json_response(body)
\ No newline at end of file
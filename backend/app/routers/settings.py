@@ -1,68 +1,96 @@
 # backend/app/routers/settings.py
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .. import crud, models, schemas, security
-from ..dependencies import get_current_active_user
-from ..db.base import get_db
+from .. import async_crud, crud, hashing, models, schemas
+from ..dependencies import get_current_active_user_async, invalidate_principal
+from ..db.base import get_async_db
+from .auth import issue_token_pair
 
 router = APIRouter(
     prefix="/settings",
     tags=["settings"]
 )
 
-@router.put("/password", status_code=status.HTTP_204_NO_CONTENT)
-def change_user_password(
+# Эндпоинты асинхронные: проверка и хеширование паролей выполняются в пуле процессов (hashing.py)
+
+async def _load_user(db: AsyncSession, current_user: schemas.UserPrincipal) -> models.User:
+    # Зависимость отдает закэшированный снимок пользователя; для проверки пароля и изменений нужна строка из БД
+    db_user = await async_crud.get_user(db, user_id=current_user.id)
+    if db_user is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    return db_user
+
+
+@router.put("/password")
+async def change_user_password(
     password_data: schemas.PasswordUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.UserPrincipal = Depends(get_current_active_user_async)
 ):
-    """Изменение пароля текущего пользователя."""
+    """
+    Изменение пароля текущего пользователя.
+    Все ранее выданные токены (в том числе refresh) отзываются, поэтому в ответе возвращается новая пара.
+    """
+    db_user = await _load_user(db, current_user)
+
     # 1. Проверить, что текущий пароль верный
-    if not security.verify_password(password_data.current_password, current_user.hashed_password):
+    verified, _ = await hashing.verify_password(password_data.current_password, db_user.hashed_password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Неверный текущий пароль")
 
     # 2. Обновить пароль
-    crud.update_user_password(db=db, db_user=current_user, new_password=password_data.new_password)
-    return
+    hashed_password = await hashing.hash_password(password_data.new_password)
+    await db.run_sync(lambda s: crud.update_user_password(db=s, db_user=db_user, hashed_password=hashed_password))
+    invalidate_principal(db_user.id)
+    return await issue_token_pair(db, db_user)
 
 
 @router.put("/email", response_model=schemas.UserRead)
-def change_user_email(
+async def change_user_email(
     email_data: schemas.EmailUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.UserPrincipal = Depends(get_current_active_user_async)
 ):
     """Изменение email текущего пользователя."""
+    db_user = await _load_user(db, current_user)
+
     # 1. Проверить пароль
-    if not security.verify_password(email_data.current_password, current_user.hashed_password):
+    verified, _ = await hashing.verify_password(email_data.current_password, db_user.hashed_password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Неверный пароль")
 
     # 2. Проверить, не занят ли новый email
-    existing_user = crud.get_user_by_email(db, email=email_data.new_email)
+    existing_user = await async_crud.get_user_by_email(db, email=email_data.new_email)
     if existing_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Этот email уже используется")
 
     # 3. Обновить email
-    return crud.update_user_email(db=db, db_user=current_user, new_email=email_data.new_email)
+    updated_user = await db.run_sync(lambda s: crud.update_user_email(db=s, db_user=db_user, new_email=email_data.new_email))
+    invalidate_principal(updated_user.id)
+    return updated_user
 
 
 @router.delete("/account", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user_account(
+async def delete_user_account(
     password_container: dict, # Просто получаем пароль в теле запроса
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: schemas.UserPrincipal = Depends(get_current_active_user_async)
 ):
     """Удаление аккаунта текущего пользователя."""
+    db_user = await _load_user(db, current_user)
+
     password = password_container.get("password")
     if not password:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Пароль не предоставлен")
          
     # 1. Проверить пароль для подтверждения
-    if not security.verify_password(password, current_user.hashed_password):
+    verified, _ = await hashing.verify_password(password, db_user.hashed_password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Неверный пароль")
     
-    # 2. Удалить пользователя
-    crud.delete_user(db=db, db_user=current_user)
+    # 2. Удалить пользователя (crud сбрасывает и его id из множеств друзей в кэше графа)
+    await db.run_sync(lambda s: crud.delete_user(db=s, db_user=db_user))
+    invalidate_principal(db_user.id)
     return
\ No newline at end of file
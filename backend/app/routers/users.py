@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import List, Optional
 from sqlalchemy.orm import Session
 
-from .. import schemas, models, crud
-from ..dependencies import get_current_active_user
+from .. import schemas, models, crud, etags
+from ..dependencies import get_current_active_user, get_current_active_read_user, get_read_db
 from ..db.base import get_db
 
 router = APIRouter()
@@ -30,14 +30,31 @@ def search_users(
 @router.get("/{user_id}/profile", response_model=schemas.UserProfileResponse)
 def get_user_profile(
     user_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_active_read_user)
 ):
-    """Получить публичный профиль пользователя."""
+    """Получить публичный профиль пользователя (с ETag)."""
     profile_user = crud.get_user(db, user_id=user_id)
     if not profile_user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    friendship = None
+    if user_id != current_user.id:
+        friendship = crud.get_existing_friendship(db, user1_id=current_user.id, user2_id=user_id)
+
+    # ETag: данные пользователя, дружба и (id, version) видимых списков — сами списки не загружаются
+    etag = etags.make_etag(
+        "profile", current_user.id, profile_user.id, profile_user.name, profile_user.email,
+        friendship and (friendship.id, friendship.status.name, friendship.requester_id),
+        crud.get_visible_list_versions(db, profile_owner_id=user_id, viewer_id=current_user.id),
+    )
+    not_modified = etags.not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    etags.set_etag(response, etag)
+
     # ---- ИЗМЕНЕНИЕ ЗДЕСЬ ----
     # Вызываем новую, более умную функцию вместо get_public_lists_by_user
     visible_lists = crud.get_visible_lists_by_user(
@@ -50,7 +67,6 @@ def get_user_profile(
     friendship_id = None
     
     if user_id != current_user.id:
-        friendship = crud.get_existing_friendship(db, user1_id=current_user.id, user2_id=user_id)
         if friendship:
             friendship_id = friendship.id
             if friendship.status == models.FriendshipStatus.ACCEPTED:
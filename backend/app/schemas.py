@@ -27,6 +27,19 @@ class UserRead(UserBase):
     class Config:
         from_attributes = True
 
+# Аутентифицированный пользователь, как его видят зависимости get_current_user*.
+# Неизменяемый снимок без привязки к сессии БД, поэтому его можно кэшировать между запросами.
+class UserPrincipal(BaseModel):
+    id: int
+    name: str
+    email: EmailStr
+    is_active: bool
+    token_version: int = 0
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
 # --- (Задача 3.1) Новые схемы для системы друзей ---
 
 class FriendshipBase(BaseModel):
@@ -60,9 +73,15 @@ class NotificationRead(BaseModel):
     is_read: bool
     type: NotificationType
     created_at: datetime
+    # Время последнего действия (у схлопнутых уведомлений позже created_at)
+    updated_at: Optional[datetime] = None
     sender: UserInComment # Информация о том, кто совершил действие
     related_item_id: Optional[int] = None
     related_list_id: Optional[int] = None # <--- ДОБАВЛЕНО ЭТО ПОЛЕ
+    # Схлопнутые уведомления: sender — последний участник, всего участников actor_count
+    actor_count: int = 1
+    # Номер последнего события уведомления у получателя (last_event_id при переподключении WebSocket)
+    event_id: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -71,6 +90,9 @@ class NotificationsResponse(BaseModel):
     unread_count: int
     notifications: List[NotificationRead]
 
+class UnreadCount(BaseModel):
+    unread_count: int
+
 # (Задача 2.1) Новые схемы для страницы профиля
 class PublicListForProfile(BaseModel):
     """Упрощенная схема списка для отображения в профиле."""
@@ -108,6 +130,11 @@ class CommentRead(CommentBase):
     class Config:
         from_attributes = True
 
+# Страница комментариев элемента, от новых к старым
+class CommentsPage(BaseModel):
+    items: List[CommentRead] = []
+    next_cursor: Optional[str] = None
+
 # --- (Этап 13) Новые схемы для Целей ---
 
 class GoalTrackerBase(BaseModel):
@@ -171,6 +198,8 @@ class ItemRead(ItemBase):
     # Новые поля для лайков и комментов
     likes_count: int = 0
     is_liked_by_current_user: bool = False
+    # Только последние комментарии (по возрастанию даты); остальные — GET /items/{id}/comments
+    comments_count: int = 0
     comments: List[CommentRead] = []
 
     # (Этап 13) Добавлено поле для данных трекера
@@ -186,6 +215,7 @@ class ItemPublicRead(ItemBase):
     
     # Новые поля для лайков и комментов
     likes_count: int = 0
+    comments_count: int = 0
     comments: List[CommentRead] = []
 
     class Config:
@@ -216,10 +246,17 @@ class ListRead(ListBase):
     public_url_key: UUID
     created_at: datetime
     updated_at: Optional[datetime] = None
+    # Первая страница элементов; остальные — через GET /lists/{id}/items?cursor=next_cursor
     items: List[ItemRead] = []
+    next_cursor: Optional[str] = None
     class Config:
         from_attributes = True
 
+# Страница элементов списка (курсорная пагинация)
+class ItemsPage(BaseModel):
+    items: List[ItemRead] = []
+    next_cursor: Optional[str] = None
+
 # Новая схема для публичного отображения списка с публичными элементами
 class ListPublicRead(ListBase):
     id: int
@@ -239,6 +276,11 @@ class ListForFeedRead(ListBase):
     class Config:
         from_attributes = True
 
+# Страница ленты (курсорная пагинация, новые сверху)
+class FeedPage(BaseModel):
+    items: List[ListForFeedRead] = []
+    next_cursor: Optional[str] = None
+
 # --- Схемы для бронирования ---
 
 # Схема для отображения бронирования в списке пользователя
@@ -251,6 +293,11 @@ class ReservationRead(BaseModel):
     class Config:
         from_attributes = True
 
+# --- Схемы для токенов ---
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 # --- Схемы для настроек пользователя ---
 
 class PasswordUpdate(BaseModel):
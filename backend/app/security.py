@@ -1,14 +1,19 @@
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
+import hashlib
 import os
-from passlib.context import CryptContext
+import secrets
 from jose import JWTError, jwt
 
+from . import hashing
+
 # --- Настройки безопасности ---
 
 # 1. Контекст для хеширования паролей
-# Используем pbkdf2_sha256 — не требует нативных bcrypt-зависимостей и хорошо подходит для тестов/MVP
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Используем pbkdf2_sha256 — не требует нативных bcrypt-зависимостей и хорошо подходит для тестов/MVP.
+# Сам контекст и пул процессов, в котором считаются хеши, живут в hashing.py;
+# пароли хешируются и проверяются только через async hashing.hash_password/verify_password
+pwd_context = hashing.pwd_context
 
 # 2. Настройки JWT
 SECRET_KEY = os.environ.get("SECRET_KEY")
@@ -17,15 +22,8 @@ if not SECRET_KEY:
 
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-
-# --- Утилиты для паролей ---
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+# Refresh-токен живет долго и меняется при каждом обмене на новый access-токен
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
 
 # --- Утилиты для JWT ---
@@ -40,6 +38,24 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_user_access_token(user) -> str:
+    """Токен доступа пользователя: email в sub, а также id и версия токенов для кэша в dependencies."""
+    return create_access_token(
+        data={"sub": user.email, "uid": user.id, "ver": user.token_version}
+    )
+
+# --- Утилиты для refresh-токенов ---
+
+def hash_refresh_token(token: str) -> str:
+    # Токен случайный и длинный, поэтому медленный хеш не нужен: sha256 позволяет искать по индексу
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def create_refresh_token() -> Tuple[str, str, datetime]:
+    """Новый непрозрачный refresh-токен: (токен для клиента, хеш для БД, срок действия)."""
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    return token, hash_refresh_token(token), expires_at
+
 def decode_token(token: str) -> Optional[dict]:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -0,0 +1,83 @@
+"""
+Внутрипроцессный кэш социального графа: множество id друзей для каждого пользователя.
+
+Проверка «друзья ли A и B» (доступ к спискам friends_only, копирование элементов)
+сводится к поиску в закэшированном frozenset вместо запроса к friendships.
+Множества загружаются лениво одним запросом и вытесняются по LRU/TTL.
+При принятии, отклонении и удалении дружбы роутер друзей сбрасывает записи обоих пользователей
+(при удалении аккаунта — crud.delete_user, у него и всех его друзей);
+TTL ограничивает устаревание в остальных воркерах. Метрики: cache.social_graph.{hits,misses,size}.
+"""
+import os
+import threading
+from typing import FrozenSet
+
+from sqlalchemy import select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .cache import TTLCache
+
+SOCIAL_GRAPH_CACHE_TTL = float(os.environ.get("SOCIAL_GRAPH_CACHE_TTL", "60"))
+SOCIAL_GRAPH_CACHE_SIZE = int(os.environ.get("SOCIAL_GRAPH_CACHE_SIZE", "50000"))
+
+_friend_sets = TTLCache(maxsize=SOCIAL_GRAPH_CACHE_SIZE, ttl=SOCIAL_GRAPH_CACHE_TTL, name="social_graph")
+# Счетчик сбросов: множество, загруженное до сброса, не должно попасть в кэш после него
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def friend_ids_stmt(user_id: int):
+    """id друзей пользователя (ACCEPTED в обе стороны)."""
+    # UNION ALL вместо OR: каждая половина — index-only диапазон по своему индексу ребер
+    accepted = models.Friendship.status == models.FriendshipStatus.ACCEPTED
+    return union_all(
+        select(models.Friendship.user_high_id).where(models.Friendship.user_low_id == user_id, accepted),
+        select(models.Friendship.user_low_id).where(models.Friendship.user_high_id == user_id, accepted),
+    )
+
+def _store(user_id: int, generation: int, ids) -> FrozenSet[int]:
+    friend_ids = frozenset(ids)
+    with _generation_lock:
+        if generation == _generation:
+            _friend_sets.set(user_id, friend_ids)
+    return friend_ids
+
+
+def friend_ids(db: Session, user_id: int) -> FrozenSet[int]:
+    """Множество id друзей пользователя (из кэша или одним запросом)."""
+    cached = _friend_sets.get(user_id)
+    if cached is not None:
+        return cached
+    generation = _generation
+    return _store(user_id, generation, db.execute(friend_ids_stmt(user_id)).scalars().all())
+
+async def friend_ids_async(db: AsyncSession, user_id: int) -> FrozenSet[int]:
+    cached = _friend_sets.get(user_id)
+    if cached is not None:
+        return cached
+    generation = _generation
+    result = await db.execute(friend_ids_stmt(user_id))
+    return _store(user_id, generation, result.scalars().all())
+
+def are_friends(db: Session, user1_id: int, user2_id: int) -> bool:
+    return user2_id in friend_ids(db, user1_id)
+
+async def are_friends_async(db: AsyncSession, user1_id: int, user2_id: int) -> bool:
+    return user2_id in await friend_ids_async(db, user1_id)
+
+
+def invalidate(*user_ids: int) -> None:
+    """Сбросить множества друзей пользователей (после изменения их дружб)."""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        for user_id in user_ids:
+            _friend_sets.pop(user_id)
+
+def clear() -> None:
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        _friend_sets.clear()
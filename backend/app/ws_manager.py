@@ -1,49 +1,387 @@
 # backend/app/ws_manager.py
-from typing import Dict, List
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple, Union
 from fastapi import WebSocket
+import asyncio
 import json
+import logging
+import os
+import time
+
+import asyncpg
+
 from . import schemas # <-- Добавить импорт
 from . import models # <-- Добавить импорт
+from . import metrics
+from .cache import TTLCache
+from .db.base import LISTEN_DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Очередь исходящих сообщений на одно соединение
+WS_SEND_QUEUE_SIZE = int(os.environ.get("WS_SEND_QUEUE_SIZE", "100"))
+# Сколько накопившихся сообщений отправляется одним кадром (JSON-массивом)
+WS_SEND_BATCH_SIZE = int(os.environ.get("WS_SEND_BATCH_SIZE", "20"))
+# Очередь медленного клиента переполнена: drop_oldest — выбросить самое старое, disconnect — закрыть соединение
+WS_SLOW_CONSUMER_POLICY = os.environ.get("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+# Код закрытия для отключенного медленного клиента и для отказа сверх лимита (1013 Try Again Later)
+WS_SLOW_CONSUMER_CLOSE_CODE = 1013
+WS_OVERLOADED_CLOSE_CODE = 1013
+# Не больше стольких соединений на один воркер (общий предел — число воркеров, умноженное на это значение):
+# новые сверх лимита отклоняются
+WS_MAX_CONNECTIONS_PER_WORKER = int(os.environ.get("WS_MAX_CONNECTIONS_PER_WORKER", "1000"))
+# Раз в столько секунд тишины сервер шлет {"event": "ping"} (клиент отвечает любым сообщением);
+# клиент, молчащий дольше WS_IDLE_TIMEOUT, отключается
+WS_PING_INTERVAL = float(os.environ.get("WS_PING_INTERVAL", "30"))
+WS_IDLE_TIMEOUT = float(os.environ.get("WS_IDLE_TIMEOUT", "75"))
+WS_IDLE_CLOSE_CODE = 1001
+
+
+# Сообщение WebSocket — готовый JSON (str): сериализуется один раз и без изменений проходит через
+# прореживание, рассылку между воркерами и очереди всех сокетов получателя. dict кодируется на входе
+Message = Union[str, dict]
+
+def encode_message(message: Message) -> str:
+    return message if isinstance(message, str) else json.dumps(message)
+
+PING = encode_message({"event": "ping"})
+# Пропущено больше, чем повторяется: клиент перечитывает список уведомлений (GET /notifications/)
+RESYNC = encode_message({"event": "resync"})
+
+
+class ClientConnection:
+    """
+    Одно соединение (вкладка, устройство): ограниченная очередь исходящих сообщений и своя задача-писатель.
+    Отправители только кладут сообщение в очередь и не ждут медленного клиента.
+    """
+
+    # Задачи закрытия сокетов: ссылка держится до завершения, иначе задачу может собрать GC
+    _close_tasks: Set[asyncio.Task] = set()
+
+    def __init__(self, websocket: WebSocket, user_id: int, queue_size: int, batch_size: int, policy: str):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.policy = policy
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+        # Время последнего сообщения от клиента (для отключения молчащих)
+        self.last_seen = time.monotonic()
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._write())
+
+    def enqueue(self, message: str) -> None:
+        if self.closed:
+            return
+        if self.queue.full():
+            metrics.inc(f"ws.slow_consumer.{self.policy}")
+            if self.policy == "disconnect":
+                self.close(WS_SLOW_CONSUMER_CLOSE_CODE)
+                return
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    def close(self, code: Optional[int] = None) -> None:
+        """Остановить писателя; с code — закрыть и сам сокет (по инициативе сервера)."""
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer is not None:
+            self._writer.cancel()
+        if code is not None:
+            task = asyncio.create_task(self._close_socket(code))
+            self._close_tasks.add(task)
+            task.add_done_callback(self._close_tasks.discard)
+
+    async def _close_socket(self, code: int) -> None:
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _write(self) -> None:
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                # Одно сообщение уходит как есть, накопившиеся — одним кадром-массивом (склейка готовых JSON)
+                await self.websocket.send_text(batch[0] if len(batch) == 1 else f"[{','.join(batch)}]")
+                metrics.inc("ws.sent", len(batch))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Клиент ушел: соединение убирает обработчик сокета (disconnect)
+            self.closed = True
+
 
 class ConnectionManager:
-    def __init__(self):
-        # Словарь для хранения активных соединений: {user_id: WebSocket}
-        self.active_connections: Dict[int, WebSocket] = {}
-
-    async def connect(self, websocket: WebSocket, user_id: int):
-        """Принимает новое WebSocket соединение."""
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-
-    def disconnect(self, user_id: int):
-        """Отключает пользователя."""
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-
-    async def send_personal_message(self, message: dict, user_id: int):
-        """Отправляет личное сообщение конкретному пользователю."""
-        if user_id in self.active_connections:
-            websocket = self.active_connections[user_id]
-            await websocket.send_text(json.dumps(message))
+    def __init__(
+        self,
+        queue_size: int = WS_SEND_QUEUE_SIZE,
+        batch_size: int = WS_SEND_BATCH_SIZE,
+        policy: str = WS_SLOW_CONSUMER_POLICY,
+    ):
+        # Активные соединения: {user_id: {соединение, ...}} — у пользователя может быть несколько вкладок
+        self.active_connections: Dict[int, Set[ClientConnection]] = {}
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.policy = policy
+        # Рукопожатия, ожидающие accept: уже занимают место в лимите
+        self._handshakes = 0
+
+    async def connect(self, websocket: WebSocket, user_id: int) -> Optional[ClientConnection]:
+        """
+        Принимает новое WebSocket соединение.
+        None — лимит воркера исчерпан, сокет закрыт с WS_OVERLOADED_CLOSE_CODE.
+        """
+        # Место занимается до await accept: параллельные рукопожатия не проскочат лимит
+        if self.connection_count() + self._handshakes >= WS_MAX_CONNECTIONS_PER_WORKER:
+            metrics.inc("ws.rejected")
+            await websocket.close(code=WS_OVERLOADED_CLOSE_CODE)
+            return None
+        self._handshakes += 1
+        try:
+            await websocket.accept()
+        finally:
+            self._handshakes -= 1
+        connection = ClientConnection(websocket, user_id, self.queue_size, self.batch_size, self.policy)
+        connection.start()
+        self.active_connections.setdefault(user_id, set()).add(connection)
+        return connection
+
+    def disconnect(self, connection: ClientConnection):
+        """Убирает соединение (остальные вкладки пользователя остаются)."""
+        connection.close()
+        connections = self.active_connections.get(connection.user_id)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del self.active_connections[connection.user_id]
+
+    async def send_personal_message(self, message: Message, user_id: int):
+        """Ставит сообщение в очереди всех соединений пользователя (не дожидаясь отправки)."""
+        message = encode_message(message)
+        for connection in list(self.active_connections.get(user_id, ())):
+            connection.enqueue(message)
+
+    async def listen(self, connection: ClientConnection) -> None:
+        """
+        Читать сообщения клиента до отключения: в тишине слать ping, молчащего дольше WS_IDLE_TIMEOUT закрыть.
+        Пока клиент жив, сам обработчик не держит ничего, кроме сокета.
+        """
+        websocket = connection.websocket
+        while not connection.closed:
+            try:
+                await asyncio.wait_for(websocket.receive_text(), timeout=WS_PING_INTERVAL)
+            except asyncio.TimeoutError:
+                if time.monotonic() - connection.last_seen >= WS_IDLE_TIMEOUT:
+                    metrics.inc("ws.idle_closed")
+                    connection.close(WS_IDLE_CLOSE_CODE)
+                    return
+                connection.enqueue(PING)
+                continue
+            connection.last_seen = time.monotonic()
+
+    def queue_depth(self) -> int:
+        return sum(c.queue.qsize() for connections in self.active_connections.values() for c in connections)
+
+    def max_queue_depth(self) -> int:
+        return max((c.queue.qsize() for connections in self.active_connections.values() for c in connections), default=0)
+
+    def connection_count(self) -> int:
+        return sum(len(connections) for connections in self.active_connections.values())
 
 # Создаем глобальный экземпляр менеджера
 manager = ConnectionManager()
+metrics.register_gauge("ws.connections", manager.connection_count)
+metrics.register_gauge("ws.queue_depth", manager.queue_depth)
+metrics.register_gauge("ws.queue_depth_max", manager.max_queue_depth)
+
+
+# Доставка между воркерами: postgres — через LISTEN/NOTIFY, local — только сокеты этого процесса (один воркер, тесты)
+WS_FANOUT = os.environ.get("WS_FANOUT", "postgres")
+WS_FANOUT_CHANNEL = "ws_messages"
+WS_FANOUT_RECONNECT_DELAY = float(os.environ.get("WS_FANOUT_RECONNECT_DELAY", "1"))
+# Postgres принимает payload NOTIFY короче 8000 байт
+NOTIFY_PAYLOAD_LIMIT = 7999
+
+
+class PostgresFanout:
+    """
+    Рассылка сообщений WebSocket по всем воркерам и подам через Postgres LISTEN/NOTIFY.
+    Каждый воркер держит одно соединение, слушающее канал; publish делает pg_notify,
+    и каждый воркер (включая отправителя) доставляет сообщение своим сокетам получателя.
+    Пока соединения нет (старт, обрыв), сообщения доставляются только локально.
+    """
+
+    def __init__(self, connections: ConnectionManager, dsn: str, channel: str = WS_FANOUT_CHANNEL):
+        self.connections = connections
+        self.dsn = dsn
+        self.channel = channel
+        self._connection: Optional[asyncpg.Connection] = None
+        # Соединение asyncpg не выполняет запросы параллельно
+        self._lock = asyncio.Lock()
+        self._tasks = set()
+        self._closing = False
+
+    @property
+    def listening(self) -> bool:
+        return self._connection is not None and not self._connection.is_closed()
+
+    async def start(self) -> None:
+        self._closing = False
+        connection = await asyncpg.connect(self.dsn)
+        await connection.add_listener(self.channel, self._on_notify)
+        connection.add_termination_listener(self._on_terminated)
+        self._connection = connection
+
+    async def stop(self) -> None:
+        self._closing = True
+        connection, self._connection = self._connection, None
+        if connection is not None and not connection.is_closed():
+            await connection.close()
+
+    async def publish(self, user_id: int, message: Message) -> None:
+        message = encode_message(message)
+        # "<user_id>:<JSON сообщения>" — сообщение не пересериализуется ни здесь, ни у получателей
+        payload = f"{user_id}:{message}"
+        if not self.listening or len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT:
+            metrics.inc("ws.fanout.local")
+            await self.connections.send_personal_message(message, user_id)
+            return
+        async with self._lock:
+            await self._connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+        metrics.inc("ws.fanout.published")
+
+    def _spawn(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        user_id, _, message = payload.partition(":")
+        metrics.inc("ws.fanout.received")
+        self._spawn(self.connections.send_personal_message(message, int(user_id)))
+
+    def _on_terminated(self, connection) -> None:
+        if self._closing:
+            return
+        logger.warning("WebSocket fan-out connection lost, reconnecting")
+        self._connection = None
+        self._spawn(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        while not self._closing:
+            await asyncio.sleep(WS_FANOUT_RECONNECT_DELAY)
+            try:
+                await self.start()
+                return
+            except (OSError, asyncpg.PostgresError):
+                logger.warning("WebSocket fan-out reconnect failed")
+
+fanout = PostgresFanout(manager, LISTEN_DATABASE_URL)
+
+async def publish(user_id: int, message: Message) -> None:
+    """Отправить сообщение пользователю на все его сокеты, в каком бы воркере они ни были."""
+    await fanout.publish(user_id, message)
+
+
+# Не чаще одного сообщения за столько секунд на одно (схлопнутое) уведомление
+NOTIFICATION_PUSH_INTERVAL = float(os.environ.get("NOTIFICATION_PUSH_INTERVAL", "5"))
+
+
+class NotificationPushThrottle:
+    """
+    Прореживание сообщений об одном уведомлении: первое уходит сразу, последующие в течение interval
+    сливаются — по окончании интервала отправляется только последнее состояние («Алиса и еще 24»).
+    Состояние внутрипроцессное: каждый воркер прореживает свои отправки (доставка — через fanout).
+    """
+
+    def __init__(self, interval: float, maxsize: int = 100000):
+        self.interval = interval
+        # id уведомления -> время последней отправки; записи старше интервала не нужны
+        self._sent_at = TTLCache(maxsize=maxsize, ttl=interval or None)
+        # id уведомления -> (получатель, последнее неотправленное сообщение)
+        self._pending: Dict[int, Tuple[int, Message]] = {}
+        self._tasks = set()
+
+    async def push(self, recipient_id: int, notification_id: int, message: Message) -> None:
+        now = time.monotonic()
+        sent_at = self._sent_at.get(notification_id)
+        if not self.interval or sent_at is None or now - sent_at >= self.interval:
+            self._sent_at.set(notification_id, now)
+            await publish(recipient_id, message)
+            return
+        if notification_id not in self._pending:
+            task = asyncio.create_task(self._flush_later(notification_id, sent_at + self.interval - now))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        self._pending[notification_id] = (recipient_id, message)
+
+    def clear(self) -> None:
+        self._sent_at.clear()
+        self._pending.clear()
+
+    async def _flush_later(self, notification_id: int, delay: float) -> None:
+        await asyncio.sleep(delay)
+        pending = self._pending.pop(notification_id, None)
+        if pending is None:
+            return
+        recipient_id, message = pending
+        self._sent_at.set(notification_id, time.monotonic())
+        await publish(recipient_id, message)
+
+notification_pushes = NotificationPushThrottle(NOTIFICATION_PUSH_INTERVAL)
 
 
 # --- НОВАЯ АСИНХРОННАЯ ФУНКЦИЯ ДЛЯ ФОНОВЫХ ЗАДАЧ ---
-async def send_notification_ws(notification: models.Notification):
+class NotificationMessage(NamedTuple):
+    recipient_id: int
+    notification_id: int
+    # Готовый JSON уведомления
+    payload: str
+
+def encode_notification(
+    notification: models.Notification,
+    sender,
+    related_list_id: Optional[int] = None,
+    merged: bool = False,
+    replayed: bool = False,
+) -> NotificationMessage:
+    """
+    Сообщение WebSocket об уведомлении. Собирается crud в транзакции записи (после flush/RETURNING,
+    до commit) из уже известных отправителя и списка: отправке не нужны ни сессия, ни ORM, ни валидация.
+    merged — действие добавлено к уже существующему уведомлению (клиент заменяет его, счетчик не растет).
+    replayed — повтор пропущенного события при переподключении: клиент сам сверяет его со своим списком.
+    """
+    notification_data = schemas.NotificationRead(
+        id=notification.id,
+        is_read=notification.is_read,
+        type=notification.type,
+        created_at=notification.created_at,
+        updated_at=notification.updated_at,
+        sender=schemas.UserInComment.model_validate(sender),
+        related_item_id=notification.related_item_id,
+        related_list_id=related_list_id,
+        actor_count=notification.actor_count,
+        event_id=notification.event_seq,
+    ).model_dump(mode="json")
+    notification_data['merged'] = merged
+    notification_data['replayed'] = replayed
+    return NotificationMessage(notification.recipient_id, notification.id, json.dumps(notification_data))
+
+async def send_notification_ws(message: NotificationMessage):
     """
-    Подготавливает и отправляет данные уведомления через WebSocket.
+    Отправляет готовое сообщение об уведомлении через WebSocket (с прореживанием по id уведомления).
     Предназначена для вызова через BackgroundTasks.
     """
-    recipient_id = notification.recipient_id
-    
-    # Собираем данные для отправки через WS
-    list_id = notification.related_item.list_id if notification.related_item else None
-    
-    notification_data = schemas.NotificationRead.from_orm(notification).dict()
-    notification_data['related_list_id'] = list_id
-    notification_data['sender'] = schemas.UserInComment.from_orm(notification.sender).dict()
-    notification_data['created_at'] = notification.created_at.isoformat()
-
-    await manager.send_personal_message(notification_data, recipient_id)
\ No newline at end of file
+    await notification_pushes.push(message.recipient_id, message.notification_id, message.payload)
+
+async def send_unread_count_ws(user_id: int, unread_count: int):
+    """
+    Отправляет новое значение счетчика непрочитанных (прочтение на другой вкладке или устройстве).
+    Новые уведомления счетчик не отправляют: клиент увеличивает его сам.
+    """
+    await publish(user_id, {"event": "unread_count", "unread_count": unread_count})
@@ -1,15 +1,25 @@
 import os
 import pytest
+from contextlib import contextmanager
 from typing import Generator
 
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+# Сообщения WebSocket в тестах доставляются в этом же процессе сразу;
+# рассылка через Postgres LISTEN/NOTIFY проверяется отдельно (test_ws.py)
+os.environ.setdefault("WS_FANOUT", "local")
 
 # Импортируем наше приложение FastAPI и базовый класс для моделей
 from app.main import app
-from app.db.base import Base, get_db
+from app.db.base import Base, get_db, get_async_db, get_async_session_factory
+from app.db import migrate
+from app import dependencies, social_graph, ws_manager
+from app.routers import public
 
 # --- НАСТРОЙКА ТЕСТОВОЙ БАЗЫ ДАННЫХ ---
 
@@ -26,6 +36,8 @@ DB_NAME_TEST = f"{DB_NAME_MAIN}_test"
 SQLALCHEMY_MAIN_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME_MAIN}"
 # URL для подключения к ТЕСТОВОЙ базе данных
 SQLALCHEMY_TEST_DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME_TEST}"
+# URL тестовой БД для асинхронного драйвера (async-эндпоинты)
+SQLALCHEMY_TEST_ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME_TEST}"
 
 
 # --- ФИКСТУРЫ PYTEST ---
@@ -52,12 +64,14 @@ def db_engine() -> Generator:
     # Теперь, когда тестовая БД создана, создаем движок для нее
     test_engine = create_engine(SQLALCHEMY_TEST_DATABASE_URL)
     
-    # Создаем все таблицы
-    Base.metadata.create_all(bind=test_engine)
+    # Схема создается так же, как в рабочем окружении: create_all + миграции
+    migrate.run(test_engine)
     
     yield test_engine # Возвращаем созданный движок для использования в других фикстурах
     
     # После завершения всех тестов удаляем все таблицы и саму тестовую БД
+    with test_engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS notifications_archive"))
     Base.metadata.drop_all(bind=test_engine)
     test_engine.dispose() # Закрываем все соединения
     
@@ -72,26 +86,38 @@ def db_session(db_engine) -> Generator:
     Фикстура для предоставления тестовой сессии БД каждому тесту.
     Зависит от фикстуры db_engine.
     """
-    connection = db_engine.connect()
-    # Начинаем транзакцию
-    transaction = connection.begin()
-    # Создаем сессию
-    Session = sessionmaker(autocommit=False, autoflush=False, bind=connection)
+    # Данные коммитятся по-настоящему: async-эндпоинты работают через отдельное
+    # соединение asyncpg и не увидели бы незакоммиченную внешнюю транзакцию
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
     session = Session()
 
     yield session  # Здесь выполняется сам тест
     
-    # После завершения теста откатываем транзакцию, чтобы очистить данные
+    # После завершения теста очищаем все таблицы
     session.close()
-    transaction.rollback()
-    connection.close()
+    # notifications_archive создается миграцией 007 и в метаданных моделей ее нет
+    table_names = ", ".join([table.name for table in Base.metadata.sorted_tables] + ["notifications_archive"])
+    with db_engine.begin() as connection:
+        connection.execute(text(f"TRUNCATE {table_names} RESTART IDENTITY CASCADE"))
+
+
+@pytest.fixture(scope="session")
+def async_session_factory(db_engine):
+    """
+    Фабрика асинхронных сессий для тестовой БД.
+    NullPool: TestClient может запускать приложение в разных event loop'ах,
+    а соединения asyncpg привязаны к своему циклу.
+    """
+    async_engine = create_async_engine(SQLALCHEMY_TEST_ASYNC_DATABASE_URL, poolclass=NullPool)
+    yield async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+    async_engine.sync_engine.dispose()
 
 
 @pytest.fixture(scope="function")
-def client(db_session) -> Generator:
+def client(db_session, async_session_factory) -> Generator:
     """
     Фикстура для создания тестового клиента API.
-    Она переопределяет зависимость `get_db`, чтобы использовать тестовую сессию.
+    Она переопределяет зависимости `get_db` и `get_async_db`, чтобы использовать тестовую БД.
     """
     def override_get_db():
         try:
@@ -99,7 +125,83 @@ def client(db_session) -> Generator:
         finally:
             db_session.close()
 
+    async def override_get_async_db():
+        async with async_session_factory() as session:
+            yield session
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_session_factory] = lambda: async_session_factory
+    # Таблицы очищаются с RESTART IDENTITY, поэтому id пользователей повторяются между тестами
+    dependencies._principal_cache.clear()
+    social_graph.clear()
+    public.public_list_cache.clear()
+    ws_manager.notification_pushes.clear()
     
     with TestClient(app) as c:
-        yield c
\ No newline at end of file
+        yield c
+
+@pytest.fixture
+def login(client):
+    """
+    Регистрация и вход пользователя (email name@example.com, пароль password1), возвращает ответ /auth/token:
+
+        tokens = login("alice")
+    """
+    def login_user(name: str) -> dict:
+        client.post(
+            "/auth/register",
+            json={"email": f"{name}@example.com", "name": name, "password": "password1"},
+        )
+        response = client.post("/auth/token", data={"username": f"{name}@example.com", "password": "password1"})
+        assert response.status_code == 200
+        return response.json()
+
+    return login_user
+
+@pytest.fixture
+def auth_headers(login):
+    """Заголовки нового пользователя: headers = auth_headers("alice")."""
+    def headers(name: str) -> dict:
+        return {"Authorization": f"Bearer {login(name)['access_token']}"}
+
+    return headers
+
+@pytest.fixture
+def make_friends(client):
+    """Заявка от requester и ее принятие addressee: make_friends(requester_headers, addressee_headers)."""
+    def befriend(requester: dict, addressee: dict) -> None:
+        addressee_id = client.get("/users/me", headers=addressee).json()["id"]
+        client.post(f"/friends/request/{addressee_id}", headers=requester)
+        request_id = client.get("/friends/", headers=addressee).json()["incoming_requests"][0]["id"]
+        assert client.post(f"/friends/accept/{request_id}", headers=addressee).status_code == 200
+
+    return befriend
+
+@pytest.fixture
+def count_queries(db_engine, async_session_factory):
+    """
+    Счетчик SQL-запросов к тестовой БД (синхронные и async-эндпоинты):
+
+        with count_queries() as statements:
+            client.get(...)
+        assert len(statements) <= N
+    """
+    engines = [db_engine, async_session_factory.kw["bind"].sync_engine]
+
+    @contextmanager
+    def counter():
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            for engine in engines:
+                event.remove(engine, "before_cursor_execute", record)
+
+    return counter
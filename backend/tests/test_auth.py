@@ -1,6 +1,11 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
 from fastapi.testclient import TestClient
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
-from app import crud
+
+from app import crud, hashing, maintenance, models, security
 
 def test_register_user_success(client: TestClient, db_session: Session):
     response = client.post(
@@ -79,3 +84,151 @@ def test_read_me_no_token(client: TestClient):
     response = client.get("/users/me")
     assert response.status_code == 401
     assert response.json() == {"detail": "Not authenticated"}
+
+
+def test_password_change_revokes_old_tokens(client: TestClient):
+    client.post(
+        "/auth/register",
+        json={"email": "rotate@example.com", "name": "rotate", "password": "password1"},
+    )
+    login_response = client.post(
+        "/auth/token",
+        data={"username": "rotate@example.com", "password": "password1"},
+    )
+    old_headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+    # Первый запрос кладет пользователя в кэш
+    assert client.get("/users/me", headers=old_headers).status_code == 200
+
+    response = client.put(
+        "/settings/password",
+        headers=old_headers,
+        json={"current_password": "password1", "new_password": "password2"},
+    )
+    assert response.status_code == 200
+
+    # Закэшированный пользователь сброшен, старый токен больше не принимается
+    assert client.get("/users/me", headers=old_headers).status_code == 401
+    new_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    assert client.get("/users/me", headers=new_headers).status_code == 200
+
+
+def test_password_change_on_another_worker_is_seen_through_cache(client: TestClient, db_session: Session, login):
+    tokens = login("elsewhere")
+    old_headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    # Пользователь в кэше этого воркера
+    assert client.get("/users/me", headers=old_headers).status_code == 200
+
+    # Пароль сменили через другой воркер: здешний кэш не сброшен
+    db_session.execute(
+        update(models.User).where(models.User.email == "elsewhere@example.com")
+        .values(token_version=models.User.token_version + 1)
+    )
+    db_session.commit()
+    user = crud.get_user_by_email(db_session, "elsewhere@example.com")
+    new_headers = {"Authorization": f"Bearer {security.create_user_access_token(user)}"}
+
+    assert client.get("/users/me", headers=new_headers).status_code == 200
+    assert client.get("/users/me", headers=old_headers).status_code == 401
+    assert client.get("/notifications/", headers=old_headers).status_code == 401
+    assert client.get("/notifications/", headers=new_headers).status_code == 200
+
+
+def test_login_returns_503_when_hashing_pool_is_saturated(client: TestClient, monkeypatch):
+    client.post(
+        "/auth/register",
+        json={"email": "busy@example.com", "name": "busy", "password": "password1"},
+    )
+    # Все слоты пула хеширования заняты
+    saturated = threading.BoundedSemaphore(1)
+    saturated.acquire()
+    monkeypatch.setattr(hashing, "_slots", saturated)
+
+    response = client.post(
+        "/auth/token",
+        data={"username": "busy@example.com", "password": "password1"},
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_hash_is_upgraded_when_cost_changes(client: TestClient, db_session: Session):
+    client.post(
+        "/auth/register",
+        json={"email": "rehash@example.com", "name": "rehash", "password": "password1"},
+    )
+    # Хеш, посчитанный со стоимостью, отличной от настроенной
+    user = crud.get_user_by_email(db_session, "rehash@example.com")
+    old_hash = hashing.pwd_context.handler().using(rounds=1000).hash("password1")
+    user.hashed_password = old_hash
+    db_session.commit()
+
+    response = client.post(
+        "/auth/token",
+        data={"username": "rehash@example.com", "password": "password1"},
+    )
+    assert response.status_code == 200
+    db_session.expire_all()
+    new_hash = crud.get_user_by_email(db_session, "rehash@example.com").hashed_password
+    assert new_hash != old_hash
+    assert hashing.pwd_context.verify("password1", new_hash)
+
+
+def test_refresh_rotates_tokens(client: TestClient, login):
+    tokens = login("refresh")
+    assert "refresh_token" in tokens
+
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    new_tokens = response.json()
+    assert new_tokens["refresh_token"] != tokens["refresh_token"]
+
+    me = client.get("/users/me", headers={"Authorization": f"Bearer {new_tokens['access_token']}"})
+    assert me.status_code == 200
+    assert me.json()["email"] == "refresh@example.com"
+
+
+def test_refresh_token_reuse_revokes_family(client: TestClient, login):
+    tokens = login("reuse")
+    rotated = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    # Повторное использование уже обмененного токена
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+    # Вместе с ним отозван и выданный взамен токен
+    response = client.post("/auth/refresh", json={"refresh_token": rotated["refresh_token"]})
+    assert response.status_code == 401
+
+
+def test_logout_revokes_refresh_token(client: TestClient, login):
+    tokens = login("logout")
+    response = client.post("/auth/logout", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 204
+
+    response = client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+
+
+def test_expired_and_long_revoked_refresh_tokens_are_purged(client: TestClient, db_session: Session, login):
+    login("purge")
+    user = crud.get_user_by_email(db_session, "purge@example.com")
+    now = datetime.now(timezone.utc)
+    tokens = {
+        "expired": dict(expires_at=now - timedelta(days=1)),
+        "revoked_long_ago": dict(expires_at=now + timedelta(days=10), revoked_at=now - timedelta(days=30)),
+        # Недавно отозванный нужен для распознавания повторного предъявления
+        "revoked_recently": dict(expires_at=now + timedelta(days=10), revoked_at=now - timedelta(hours=1)),
+        "active": dict(expires_at=now + timedelta(days=10)),
+    }
+    for token_hash, values in tokens.items():
+        db_session.add(models.RefreshToken(user_id=user.id, token_hash=token_hash, **values))
+    db_session.commit()
+
+    assert maintenance.purge_refresh_tokens(db_session, timedelta(days=7), batch_size=1) == 2
+
+    left = db_session.scalars(
+        select(models.RefreshToken.token_hash).where(models.RefreshToken.user_id == user.id)
+    ).all()
+    # Остались недавно отозванный, действующий и выданный при входе
+    assert len(left) == 3
+    assert {"revoked_recently", "active"} <= set(left)
@@ -0,0 +1,107 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app import crud, models
+
+
+def test_feed_is_keyset_paginated_with_items_count(client: TestClient, auth_headers, make_friends):
+    reader = auth_headers("feed_reader")
+    friend = auth_headers("feed_friend")
+    stranger = auth_headers("feed_stranger")
+    make_friends(reader, friend)
+
+    for i in range(3):
+        created = client.post(
+            "/lists/", headers=friend, json={"title": f"Friend list {i}", "privacy_level": "friends_only"}
+        ).json()
+        for _ in range(i):
+            client.post(f"/lists/{created['id']}/items", headers=friend, json={"title": "Item"})
+    client.post("/lists/", headers=friend, json={"title": "Private", "privacy_level": "private"})
+    client.post("/lists/", headers=stranger, json={"title": "Stranger", "privacy_level": "public"})
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/feed/friends-lists", headers=reader, params=params)
+        assert response.status_code == 200
+        page = response.json()
+        seen += [(entry["title"], entry["items_count"]) for entry in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    # Новые сверху, без чужих и приватных списков
+    assert seen == [("Friend list 2", 2), ("Friend list 1", 1), ("Friend list 0", 0)]
+
+
+def feed_titles(client: TestClient, headers: dict) -> list:
+    response = client.get("/feed/friends-lists", headers=headers)
+    assert response.status_code == 200
+    return [entry["title"] for entry in response.json()["items"]]
+
+
+def test_feed_follows_privacy_and_friendship_changes(client: TestClient, auth_headers, make_friends):
+    reader = auth_headers("timeline_reader")
+    author = auth_headers("timeline_author")
+    # Список, созданный до дружбы, попадает в ленту при принятии заявки
+    early = client.post("/lists/", headers=author, json={"title": "Early", "privacy_level": "public"}).json()
+    make_friends(reader, author)
+    assert feed_titles(client, reader) == ["Early"]
+
+    hidden = client.post("/lists/", headers=author, json={"title": "Hidden", "privacy_level": "private"}).json()
+    assert feed_titles(client, reader) == ["Early"]
+    client.put(f"/lists/{hidden['id']}", headers=author, json={"privacy_level": "friends_only"})
+    assert feed_titles(client, reader) == ["Hidden", "Early"]
+    client.put(f"/lists/{early['id']}", headers=author, json={"privacy_level": "private"})
+    assert feed_titles(client, reader) == ["Hidden"]
+
+    friendship_id = client.get("/friends/", headers=reader).json()["friends"][0]["friendship_id"]
+    client.delete(f"/friends/{friendship_id}", headers=reader)
+    assert feed_titles(client, reader) == []
+
+
+def test_feed_reads_heavy_authors_on_the_fly(client: TestClient, db_session: Session, monkeypatch, auth_headers, make_friends):
+    # Порог 0: у любого автора с друзьями списки не раскладываются по лентам
+    monkeypatch.setattr(crud, "FEED_FANOUT_MAX_FRIENDS", 0)
+    reader = auth_headers("heavy_reader")
+    author = auth_headers("heavy_author")
+    make_friends(reader, author)
+    client.post("/lists/", headers=author, json={"title": "Pulled", "privacy_level": "public"})
+
+    assert db_session.query(models.FeedEntry).count() == 0
+    assert feed_titles(client, reader) == ["Pulled"]
+
+
+def test_feed_profile_and_notifications_answer_not_modified(client: TestClient, auth_headers, make_friends):
+    reader = auth_headers("etag_reader")
+    friend = auth_headers("etag_friend")
+    make_friends(reader, friend)
+    friend_id = client.get("/users/me", headers=friend).json()["id"]
+    client.post("/lists/", headers=friend, json={"title": "Wishes", "privacy_level": "public"})
+
+    urls = ["/feed/friends-lists", f"/users/{friend_id}/profile", "/notifications/"]
+    etags = {url: client.get(url, headers=reader).headers["ETag"] for url in urls}
+    for url, etag in etags.items():
+        assert client.get(url, headers={**reader, "If-None-Match": etag}).status_code == 304
+
+    # Новый список меняет ленту и профиль; уведомления читателя прежние
+    client.post("/lists/", headers=friend, json={"title": "More wishes", "privacy_level": "public"})
+    assert client.get(urls[0], headers={**reader, "If-None-Match": etags[urls[0]]}).status_code == 200
+    assert client.get(urls[1], headers={**reader, "If-None-Match": etags[urls[1]]}).status_code == 200
+    assert client.get(urls[2], headers={**reader, "If-None-Match": etags[urls[2]]}).status_code == 304
+
+
+def test_feed_etag_comes_from_the_single_page_query(client: TestClient, auth_headers, make_friends, count_queries):
+    reader = auth_headers("single_reader")
+    friend = auth_headers("single_friend")
+    make_friends(reader, friend)
+    client.post("/lists/", headers=friend, json={"title": "Once", "privacy_level": "public"})
+
+    with count_queries() as statements:
+        etag = client.get("/feed/friends-lists", headers=reader).headers["ETag"]
+        assert client.get("/feed/friends-lists", headers={**reader, "If-None-Match": etag}).status_code == 304
+    # Страница ленты читается один раз на запрос, и при 200, и при 304
+    assert sum("feed_entries" in statement for statement in statements) == 2
@@ -0,0 +1,68 @@
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app import crud, maintenance, models
+
+
+def test_friends_only_access_follows_cached_social_graph(client: TestClient, auth_headers, make_friends):
+    owner = auth_headers("graph_owner")
+    viewer = auth_headers("graph_viewer")
+    list_id = client.post(
+        "/lists/", headers=owner, json={"title": "Friends only", "privacy_level": "friends_only"}
+    ).json()["id"]
+
+    # Первый отказ кэширует пустое множество друзей зрителя
+    assert client.get(f"/lists/{list_id}", headers=viewer).status_code == 403
+    make_friends(viewer, owner)
+    assert client.get(f"/lists/{list_id}", headers=viewer).status_code == 200
+
+    friendship_id = client.get("/friends/", headers=viewer).json()["friends"][0]["friendship_id"]
+    assert client.delete(f"/friends/{friendship_id}", headers=owner).status_code == 200
+    assert client.get(f"/lists/{list_id}", headers=viewer).status_code == 403
+
+
+def test_friendship_edge_is_canonical_in_both_directions(client: TestClient, db_session: Session, auth_headers):
+    first = auth_headers("edge_first")
+    second = auth_headers("edge_second")
+    first_id = client.get("/users/me", headers=first).json()["id"]
+    second_id = client.get("/users/me", headers=second).json()["id"]
+
+    assert client.post(f"/friends/request/{first_id}", headers=second).status_code == 201
+    assert client.post(f"/friends/request/{second_id}", headers=first).status_code == 409
+    # Встречная вставка в обход проверки упирается в уникальный индекс пары
+    assert crud.create_friend_request(db_session, requester_id=first_id, addressee_id=second_id) is None
+
+    edge = crud.get_existing_friendship(db_session, user1_id=first_id, user2_id=second_id)
+    assert (edge.user_low_id, edge.user_high_id) == (first_id, second_id)
+    # Направление заявки сохраняется: входящая у адресата, исходящая у отправителя
+    assert client.get("/friends/", headers=first).json()["incoming_requests"][0]["id"] == edge.id
+    assert client.get("/friends/", headers=second).json()["outgoing_requests"][0]["id"] == edge.id
+
+
+def test_deleting_account_updates_friends_counters_and_feeds(client: TestClient, db_session: Session, monkeypatch, auth_headers, make_friends):
+    # Порог 1: автор с двумя друзьями читается на лету, с одним — раскладывается по лентам
+    monkeypatch.setattr(crud, "FEED_FANOUT_MAX_FRIENDS", 1)
+    leaving = auth_headers("leaving")
+    hub = auth_headers("hub")
+    reader = auth_headers("hub_reader")
+    make_friends(leaving, hub)
+    make_friends(reader, hub)
+    client.post("/lists/", headers=leaving, json={"title": "Farewell", "privacy_level": "public"})
+    client.post("/lists/", headers=hub, json={"title": "Hub list", "privacy_level": "public"})
+    hub_id = client.get("/users/me", headers=hub).json()["id"]
+    reader_id = client.get("/users/me", headers=reader).json()["id"]
+    assert db_session.query(models.FeedEntry).filter_by(user_id=reader_id).count() == 0
+
+    response = client.request("DELETE", "/settings/account", headers=leaving, json={"password": "password1"})
+    assert response.status_code == 204
+
+    db_session.expire_all()
+    assert crud.get_user(db_session, hub_id).friends_count == 1
+    assert crud.get_user(db_session, reader_id).friends_count == 1
+    # Хаб опустился до порога: его списки разложены по лентам друзей
+    entries = db_session.query(models.FeedEntry).filter_by(user_id=reader_id).all()
+    assert [entry.owner_id for entry in entries] == [hub_id]
+    assert db_session.query(models.FeedEntry).filter_by(user_id=hub_id).count() == 0
+    assert len(client.get("/friends/", headers=hub).json()["friends"]) == 1
+    # Счетчики сходятся с таблицами, в том числе после удаления отправленных им заявок
+    assert maintenance.repair_counters(db_session) == {"unread_notifications_count": 0, "friends_count": 0}
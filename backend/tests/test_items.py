@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
 
+
 # Вспомогательная функция для получения заголовков аутентификации
 def get_user_auth_headers(client: TestClient, email="itemuser@example.com", password="itempassword") -> dict:
     client.post(
@@ -13,6 +14,7 @@ def get_user_auth_headers(client: TestClient, email="itemuser@example.com", pass
     token = login_response.json()["access_token"]
     return {"Authorization": f"Bearer {token}"}
 
+
 # Вспомогательная функция для создания списка
 def create_list_for_user(client: TestClient, headers: dict) -> int:
     response = client.post(
@@ -23,6 +25,7 @@ def create_list_for_user(client: TestClient, headers: dict) -> int:
     assert response.status_code == 201
     return response.json()["id"]
 
+
 def test_create_item_in_list(client: TestClient):
     headers = get_user_auth_headers(client)
     list_id = create_list_for_user(client, headers)
@@ -38,6 +41,7 @@ def test_create_item_in_list(client: TestClient):
     assert data["list_id"] == list_id
     assert "id" in data
 
+
 def test_read_items_in_list(client: TestClient):
     headers = get_user_auth_headers(client)
     list_id = create_list_for_user(client, headers)
@@ -55,6 +59,7 @@ def test_read_items_in_list(client: TestClient):
     assert data["items"][0]["title"] == "Item 1"
     assert data["items"][1]["title"] == "Item 2"
 
+
 def test_update_item(client: TestClient):
     headers = get_user_auth_headers(client)
     list_id = create_list_for_user(client, headers)
@@ -74,6 +79,7 @@ def test_update_item(client: TestClient):
     assert data["description"] == "Updated description text"
     assert data["id"] == item_id
 
+
 def test_delete_item(client: TestClient):
     headers = get_user_auth_headers(client)
     list_id = create_list_for_user(client, headers)
@@ -87,6 +93,7 @@ def test_delete_item(client: TestClient):
     list_response = client.get(f"/lists/{list_id}", headers=headers)
     assert len(list_response.json()["items"]) == 0
 
+
 def test_update_item_not_owner(client: TestClient):
     # Пользователь 1 создает список и элемент
     headers1 = get_user_auth_headers(client, "user1@example.com", "pass1")
@@ -97,4 +104,237 @@ def test_update_item_not_owner(client: TestClient):
     # Пользователь 2 пытается обновить этот элемент
     headers2 = get_user_auth_headers(client, "user2@example.com", "pass2")
     update_response = client.put(f"/items/{item_id}", headers=headers2, json={"title": "Attempted update"})
-    assert update_response.status_code == 403
\ No newline at end of file
+    assert update_response.status_code == 403
+
+
+def test_likes_are_aggregated_in_list_response(client: TestClient):
+    headers = {}
+    for name in ("liker_owner", "liker_friend"):
+        client.post(
+            "/auth/register",
+            json={"email": f"{name}@example.com", "name": name, "password": "password1"},
+        )
+        token = client.post(
+            "/auth/token",
+            data={"username": f"{name}@example.com", "password": "password1"},
+        ).json()["access_token"]
+        headers[name] = {"Authorization": f"Bearer {token}"}
+
+    response = client.post(
+        "/lists/", headers=headers["liker_owner"], json={"title": "Liked", "privacy_level": "public"}
+    )
+    list_id = response.json()["id"]
+    public_key = response.json()["public_url_key"]
+    liked = client.post(f"/lists/{list_id}/items", headers=headers["liker_owner"], json={"title": "Liked"}).json()
+    client.post(f"/lists/{list_id}/items", headers=headers["liker_owner"], json={"title": "Not liked"})
+
+    for user_headers in headers.values():
+        assert client.post(f"/items/{liked['id']}/like", headers=user_headers).status_code == 204
+    client.delete(f"/items/{liked['id']}/like", headers=headers["liker_owner"])
+
+    items = client.get(f"/lists/{list_id}", headers=headers["liker_owner"]).json()["items"]
+    assert [(i["likes_count"], i["is_liked_by_current_user"]) for i in items] == [(1, False), (0, False)]
+
+    items = client.get(f"/lists/{list_id}", headers=headers["liker_friend"]).json()["items"]
+    assert [(i["likes_count"], i["is_liked_by_current_user"]) for i in items] == [(1, True), (0, False)]
+
+    items = client.get(f"/public/lists/{public_key}").json()["items"]
+    assert [i["likes_count"] for i in items] == [1, 0]
+
+
+def test_list_items_are_keyset_paginated(client: TestClient):
+    client.post(
+        "/auth/register",
+        json={"email": "pager@example.com", "name": "pager", "password": "password1"},
+    )
+    token = client.post(
+        "/auth/token", data={"username": "pager@example.com", "password": "password1"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    list_id = create_list_for_user(client, headers)
+    for i in range(5):
+        client.post(f"/lists/{list_id}/items", headers=headers, json={"title": f"Item {i}"})
+
+    titles = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(f"/lists/{list_id}/items", headers=headers, params=params)
+        assert response.status_code == 200
+        page = response.json()
+        titles += [item["title"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert titles == [f"Item {i}" for i in range(5)]
+
+    # Заголовок списка отдает первую страницу и курсор продолжения
+    data = client.get(f"/lists/{list_id}", headers=headers).json()
+    assert len(data["items"]) == 5
+    assert data["next_cursor"] is None
+
+    response = client.get(f"/lists/{list_id}/items", headers=headers, params={"cursor": "garbage"})
+    assert response.status_code == 400
+
+
+def test_list_response_carries_comment_previews(client: TestClient):
+    client.post(
+        "/auth/register",
+        json={"email": "commenter@example.com", "name": "commenter", "password": "password1"},
+    )
+    token = client.post(
+        "/auth/token", data={"username": "commenter@example.com", "password": "password1"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    list_id = create_list_for_user(client, headers)
+    item = client.post(f"/lists/{list_id}/items", headers=headers, json={"title": "Busy item"}).json()
+    for i in range(5):
+        client.post(f"/items/{item['id']}/comments", headers=headers, json={"text": f"Comment {i}"})
+
+    # В ответе списка — общее число и последние комментарии по возрастанию даты
+    data = client.get(f"/lists/{list_id}", headers=headers).json()["items"][0]
+    assert data["comments_count"] == 5
+    assert [c["text"] for c in data["comments"]] == ["Comment 2", "Comment 3", "Comment 4"]
+
+    # Полный список — постранично, от новых к старым
+    texts = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get(f"/items/{item['id']}/comments", headers=headers, params=params).json()
+        texts += [c["text"] for c in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert texts == [f"Comment {i}" for i in reversed(range(5))]
+
+    # Приватный список: без авторизации комментарии недоступны
+    assert client.get(f"/items/{item['id']}/comments").status_code == 401
+
+
+def test_public_list_query_count_does_not_grow_with_items(client: TestClient, count_queries):
+    owner = {}
+    for name in ("wish_owner", "wish_guest"):
+        client.post("/auth/register", json={"email": f"{name}@example.com", "name": name, "password": "password1"})
+        token = client.post(
+            "/auth/token", data={"username": f"{name}@example.com", "password": "password1"}
+        ).json()["access_token"]
+        owner[name] = {"Authorization": f"Bearer {token}"}
+    created = client.post(
+        "/lists/", headers=owner["wish_owner"], json={"title": "Wishes", "privacy_level": "public"}
+    ).json()
+    public_key = created["public_url_key"]
+
+    def add_items(count):
+        ids = []
+        for i in range(count):
+            ids.append(client.post(
+                f"/lists/{created['id']}/items", headers=owner["wish_owner"], json={"title": f"Wish {i}"}
+            ).json()["id"])
+        return ids
+
+    item_ids = add_items(2)
+    assert client.post(f"/items/{item_ids[0]}/reserve", headers=owner["wish_guest"]).status_code == 201
+    with count_queries() as small:
+        items = client.get(f"/public/lists/{public_key}").json()["items"]
+    assert [i["is_reserved"] for i in items] == [True, False]
+
+    add_items(20)
+    with count_queries() as large:
+        items = client.get(f"/public/lists/{public_key}").json()["items"]
+    assert len(items) == 22 and sum(i["is_reserved"] for i in items) == 1
+    # Версия списка, список с владельцем, элементы, лайки, превью комментариев, брони
+    assert len(large) == len(small) <= 6
+
+
+def test_public_list_response_is_cached_until_list_changes(client: TestClient, count_queries):
+    client.post("/auth/register", json={"email": "cached@example.com", "name": "cached", "password": "password1"})
+    token = client.post(
+        "/auth/token", data={"username": "cached@example.com", "password": "password1"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    created = client.post("/lists/", headers=headers, json={"title": "Shared", "privacy_level": "public"}).json()
+    item = client.post(f"/lists/{created['id']}/items", headers=headers, json={"title": "Gift"}).json()
+    url = f"/public/lists/{created['public_url_key']}"
+
+    first = client.get(url)
+    with count_queries() as statements:
+        second = client.get(url)
+    # Повторный просмотр: только проверка версии, тело отдается из кэша
+    assert len(statements) == 1
+    assert second.json() == first.json()
+
+    assert client.post(f"/items/{item['id']}/like", headers=headers).status_code == 204
+    assert client.get(url).json()["items"][0]["likes_count"] == 1
+    client.post(f"/items/{item['id']}/comments", headers=headers, json={"text": "Nice"})
+    assert client.get(url).json()["items"][0]["comments_count"] == 1
+    # Лайки и комментарии меняют версию списка, но не время его правки
+    assert client.get(f"/lists/{created['id']}", headers=headers).json()["updated_at"] is None
+    client.put(f"/lists/{created['id']}", headers=headers, json={"title": "Renamed"})
+    assert client.get(url).json()["title"] == "Renamed"
+    assert client.get(f"/lists/{created['id']}", headers=headers).json()["updated_at"] is not None
+
+
+def test_list_etag_revalidation_and_if_match(client: TestClient, count_queries):
+    client.post("/auth/register", json={"email": "etag@example.com", "name": "etag", "password": "password1"})
+    token = client.post(
+        "/auth/token", data={"username": "etag@example.com", "password": "password1"}
+    ).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    list_id = client.post("/lists/", headers=headers, json={"title": "Conditional"}).json()["id"]
+    item = client.post(f"/lists/{list_id}/items", headers=headers, json={"title": "Gift"}).json()
+
+    etag = client.get(f"/lists/{list_id}", headers=headers).headers["ETag"]
+    with count_queries() as statements:
+        response = client.get(f"/lists/{list_id}", headers={**headers, "If-None-Match": etag})
+    # Пользователь и заголовок списка — ответ не собирается
+    assert response.status_code == 304 and response.headers["ETag"] == etag
+    assert len(statements) <= 2
+
+    # Изменение с актуальным If-Match проходит и меняет ETag; повтор со старым — 412
+    updated = client.put(f"/items/{item['id']}", headers={**headers, "If-Match": etag}, json={"title": "Bike"})
+    assert updated.status_code == 200
+    stale = client.put(f"/items/{item['id']}", headers={**headers, "If-Match": etag}, json={"title": "Car"})
+    assert stale.status_code == 412
+    assert client.delete(f"/items/{item['id']}", headers={**headers, "If-Match": etag}).status_code == 412
+
+    response = client.get(f"/lists/{list_id}", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200 and response.json()["items"][0]["title"] == "Bike"
+    fresh = response.headers["ETag"]
+    renamed = client.put(f"/lists/{list_id}", headers={**headers, "If-Match": fresh}, json={"title": "Renamed"})
+    assert renamed.status_code == 200 and renamed.headers["ETag"] != fresh
+    assert client.put(f"/lists/{list_id}", headers={**headers, "If-Match": fresh}, json={"title": "Lost"}).status_code == 412
+    assert client.get(f"/lists/{list_id}", headers=headers).json()["title"] == "Renamed"
+
+
+def test_goal_progress_changes_list_etag_and_public_response(client: TestClient, auth_headers, count_queries):
+    headers = auth_headers("goal_owner")
+    created = client.post(
+        "/lists/", headers=headers, json={"title": "Habits", "list_type": "todo", "privacy_level": "public"}
+    ).json()
+    client.post(
+        f"/lists/{created['id']}/items",
+        headers=headers,
+        json={"title": "Run", "goal_settings": {"goal_type": "cumulative", "target_value": 10}},
+    )
+    listed = client.get(f"/lists/{created['id']}", headers=headers)
+    tracker_id = listed.json()["items"][0]["goal_tracker"]["id"]
+    url = f"/public/lists/{created['public_url_key']}"
+    client.get(url)
+
+    response = client.post(f"/goals/{tracker_id}/log", headers=headers, json={"value": 10})
+    assert response.status_code == 200
+
+    # Прогресс меняет версию списка: старый ETag не подходит, публичный ответ собирается заново
+    etag = listed.headers["ETag"]
+    relisted = client.get(f"/lists/{created['id']}", headers={**headers, "If-None-Match": etag})
+    assert relisted.status_code == 200 and relisted.headers["ETag"] != etag
+    item = relisted.json()["items"][0]
+    assert item["goal_tracker"]["current_value"] == 10 and item["is_completed"]
+    with count_queries() as statements:
+        client.get(url)
+    assert len(statements) > 1
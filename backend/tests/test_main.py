@@ -1,6 +1,10 @@
+from fastapi import Depends, FastAPI
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from starlette.requests import Request
+
+from app import dependencies
 
 # Тест 1: Проверка основного эндпоинта ("/")
 def test_read_root(client: TestClient):
@@ -54,4 +58,58 @@ def test_user_model_in_db(db_session: Session):
     # Дополнительная проверка: пытаемся найти этого пользователя в БД
     user_from_db = db_session.query(User).filter(User.email == "test@example.com").first()
     assert user_from_db is not None
-    assert user_from_db.id == test_user.id
\ No newline at end of file
+    assert user_from_db.id == test_user.id
+
+def test_writes_pin_the_client_to_primary_via_cookie(client: TestClient):
+    def read_request(cookie: str = "") -> Request:
+        headers = [(b"cookie", cookie.encode())] if cookie else []
+        return Request({"type": "http", "method": "GET", "headers": headers})
+
+    client.post("/auth/register", json={"email": "pinned@example.com", "name": "pinned", "password": "password1"})
+    token = client.post("/auth/token", data={"username": "pinned@example.com", "password": "password1"}).json()["access_token"]
+    response = client.post("/lists/", headers={"Authorization": f"Bearer {token}"}, json={"title": "Fresh"})
+    assert response.status_code == 201
+
+    # Метка записи у клиента: любой воркер отправит его чтение на primary, даже с новым токеном
+    written_at = response.cookies[dependencies.READ_AFTER_WRITE_COOKIE]
+    assert not dependencies._can_read_from_replica(read_request(f"{dependencies.READ_AFTER_WRITE_COOKIE}={written_at}"))
+    assert dependencies._can_read_from_replica(read_request())
+    stale = float(written_at) - dependencies.DB_READ_AFTER_WRITE_SECONDS
+    assert dependencies._can_read_from_replica(read_request(f"{dependencies.READ_AFTER_WRITE_COOKIE}={stale}"))
+
+def test_read_endpoints_look_up_the_user_through_the_read_session(client: TestClient, auth_headers, monkeypatch):
+    headers = auth_headers("reader")
+    user_id = client.get("/users/me", headers=headers).json()["id"]
+    client.post("/lists/", headers=headers, json={"title": "Read"})
+    client.cookies.clear()
+
+    # Флаг read_only сессии в момент поиска пользователя
+    flags = []
+    resolve, resolve_async = dependencies._resolve_principal, dependencies._resolve_principal_async
+    def record(payload, db):
+        flags.append(db.info.get("read_only"))
+        return resolve(payload, db)
+    async def record_async(payload, db):
+        flags.append(db.info.get("read_only"))
+        return await resolve_async(payload, db)
+    monkeypatch.setattr(dependencies, "_resolve_principal", record)
+    monkeypatch.setattr(dependencies, "_resolve_principal_async", record_async)
+
+    for url in ("/lists/", "/feed/friends-lists", f"/users/{user_id}/profile"):
+        assert client.get(url, headers=headers).status_code == 200
+
+    # Порядок параметров не важен: пользователь объявлен раньше сессии
+    probe = FastAPI()
+    probe.dependency_overrides = client.app.dependency_overrides
+    @probe.get("/sync")
+    def sync_probe(user=Depends(dependencies.get_current_active_read_user), db=Depends(dependencies.get_read_db)):
+        return {}
+    @probe.get("/async")
+    async def async_probe(
+        user=Depends(dependencies.get_current_active_read_user_async), db=Depends(dependencies.get_async_read_db)
+    ):
+        return {}
+    with TestClient(probe) as probe_client:
+        for url in ("/sync", "/async"):
+            assert probe_client.get(url, headers=headers).status_code == 200
+    assert flags == [True] * 5
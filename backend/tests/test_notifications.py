@@ -0,0 +1,213 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+from sqlalchemy import false, func, select, text, update
+from sqlalchemy.orm import Session
+
+from app import crud, maintenance, models, ws_manager
+from app.db import partitions
+
+
+def test_like_notification_is_returned_without_loading_history(client: TestClient, count_queries, monkeypatch, auth_headers):
+    owner = auth_headers("notified_owner")
+    fan = auth_headers("notified_fan")
+    list_id = client.post("/lists/", headers=owner, json={"title": "Popular", "privacy_level": "public"}).json()["id"]
+    items = [client.post(f"/lists/{list_id}/items", headers=owner, json={"title": f"Gift {i}"}).json() for i in range(3)]
+
+    sent = []
+    async def capture(message, user_id):
+        # Сообщение приходит готовым JSON, собранным в транзакции лайка
+        sent.append((user_id, json.loads(message)))
+    monkeypatch.setattr(ws_manager.manager, "send_personal_message", capture)
+
+    client.post(f"/items/{items[0]['id']}/like", headers=fan)
+    client.post(f"/items/{items[1]['id']}/comments", headers=fan, json={"text": "Nice"})
+    with count_queries() as statements:
+        assert client.post(f"/items/{items[2]['id']}/like", headers=fan).status_code == 204
+    # Ни история уведомлений, ни созданная строка не перечитываются: все нужное вернул RETURNING
+    assert not [s for s in statements if "FROM notifications" in s]
+
+    notifications = client.get("/notifications/", headers=owner).json()["notifications"]
+    owner_id = client.get("/users/me", headers=owner).json()["id"]
+    assert [(user_id, m["id"], m["type"], m["related_item_id"], m["related_list_id"]) for user_id, m in sent] == [
+        (owner_id, n["id"], n["type"], n["related_item_id"], list_id) for n in reversed(notifications)
+    ]
+    assert sent[0][1]["sender"]["name"] == "notified_fan"
+
+
+def test_unread_counter_follows_notifications_and_is_repairable(client: TestClient, db_session: Session, monkeypatch, auth_headers):
+    owner = auth_headers("counter_owner")
+    fan = auth_headers("counter_fan")
+    owner_id = client.get("/users/me", headers=owner).json()["id"]
+    list_id = client.post("/lists/", headers=owner, json={"title": "Counted", "privacy_level": "public"}).json()["id"]
+    items = [client.post(f"/lists/{list_id}/items", headers=owner, json={"title": f"Gift {i}"}).json() for i in range(3)]
+    for item in items:
+        client.post(f"/items/{item['id']}/like", headers=fan)
+
+    def unread_count():
+        return client.get("/notifications/", headers=owner).json()["unread_count"]
+    assert unread_count() == 3
+
+    sent = []
+    async def capture(message, user_id):
+        sent.append((user_id, json.loads(message)))
+    monkeypatch.setattr(ws_manager.manager, "send_personal_message", capture)
+
+    notification_id = client.get("/notifications/", headers=owner).json()["notifications"][0]["id"]
+    assert client.post(f"/notifications/{notification_id}/read", headers=owner).status_code == 200
+    assert client.post(f"/notifications/{notification_id}/read", headers=owner).status_code == 404
+    assert unread_count() == 2
+    # Удаление элемента удаляет и его непрочитанное уведомление
+    client.delete(f"/items/{items[0]['id']}", headers=owner)
+    assert unread_count() == 1
+    assert client.post("/notifications/read-all", headers=owner).json() == {"unread_count": 0}
+    assert sent == [
+        (owner_id, {"event": "unread_count", "unread_count": 2}),
+        (owner_id, {"event": "unread_count", "unread_count": 0}),
+    ]
+
+    db_session.execute(
+        update(models.User).where(models.User.id == owner_id).values(unread_notifications_count=7, friends_count=3)
+    )
+    db_session.commit()
+    assert maintenance.repair_counters(db_session) == {"unread_notifications_count": 1, "friends_count": 1}
+    assert unread_count() == 0
+    assert maintenance.repair_counters(db_session) == {"unread_notifications_count": 0, "friends_count": 0}
+
+
+def test_likes_and_comments_on_one_item_coalesce_into_one_notification(client: TestClient, monkeypatch, auth_headers):
+    owner = auth_headers("viral_owner")
+    fans = [auth_headers(f"viral_fan{i}") for i in range(3)]
+    list_id = client.post("/lists/", headers=owner, json={"title": "Viral", "privacy_level": "public"}).json()["id"]
+    item_id = client.post(f"/lists/{list_id}/items", headers=owner, json={"title": "Gift"}).json()["id"]
+
+    sent = []
+    async def capture(message, user_id):
+        sent.append(json.loads(message))
+    monkeypatch.setattr(ws_manager.manager, "send_personal_message", capture)
+
+    for fan in fans:
+        client.post(f"/items/{item_id}/like", headers=fan)
+    client.post(f"/items/{item_id}/comments", headers=fans[0], json={"text": "Nice"})
+    client.post(f"/items/{item_id}/comments", headers=fans[0], json={"text": "Really nice"})
+
+    data = client.get("/notifications/", headers=owner).json()
+    by_type = {n["type"]: n for n in data["notifications"]}
+    assert len(data["notifications"]) == 2 and data["unread_count"] == 2
+    assert by_type["like"]["actor_count"] == 3 and by_type["like"]["sender"]["name"] == "viral_fan2"
+    # Повторный комментарий того же участника не увеличивает число участников
+    assert by_type["comment"]["actor_count"] == 1
+    # Первое сообщение о каждом уведомлении уходит сразу, остальные в пределах интервала сливаются
+    assert [(m["type"], m["merged"]) for m in sent] == [("like", False), ("comment", False)]
+
+    # Прочитанное уведомление не дополняется: следующий лайк открывает новое
+    client.post(f"/notifications/{by_type['like']['id']}/read", headers=owner)
+    client.delete(f"/items/{item_id}/like", headers=fans[0])
+    client.post(f"/items/{item_id}/like", headers=fans[0])
+    data = client.get("/notifications/", headers=owner).json()
+    assert len(data["notifications"]) == 3 and data["unread_count"] == 2
+
+
+def test_coalescing_retries_when_the_open_row_is_read_between_steps(client: TestClient, db_engine, db_session: Session, monkeypatch, auth_headers):
+    owner = auth_headers("race_owner")
+    fans = [auth_headers(f"race_fan{i}") for i in range(3)]
+    list_id = client.post("/lists/", headers=owner, json={"title": "Race", "privacy_level": "public"}).json()["id"]
+    item_id = client.post(f"/lists/{list_id}/items", headers=owner, json={"title": "Gift"}).json()["id"]
+    client.post(f"/items/{item_id}/like", headers=fans[0])
+
+    merge = crud._merge_coalesced_notification_stmt
+    calls = []
+    def read_before_merge(*args):
+        # Вставка наткнулась на открытую строку, а до дополнения получатель ее прочитал
+        calls.append(args)
+        with db_engine.begin() as connection:
+            connection.execute(update(models.Notification).where(models.Notification.related_item_id == item_id).values(is_read=True))
+        return merge(*args)
+    monkeypatch.setattr(crud, "_merge_coalesced_notification_stmt", read_before_merge)
+    client.post(f"/items/{item_id}/like", headers=fans[1])
+    # Вторая попытка вставила новую строку окна
+    assert len(calls) == 1
+
+    # Дополнение не удается ни разу: после NOTIFICATION_COALESCE_ATTEMPTS попыток — отдельное уведомление
+    calls.clear()
+    def never_merge(*args):
+        calls.append(args)
+        return merge(*args).where(false())
+    monkeypatch.setattr(crud, "_merge_coalesced_notification_stmt", never_merge)
+    client.post(f"/items/{item_id}/like", headers=fans[2])
+    assert len(calls) == crud.NOTIFICATION_COALESCE_ATTEMPTS
+
+    rows = db_session.execute(
+        select(models.Notification.is_read, models.Notification.actor_count, models.Notification.coalesce_bucket.is_(None))
+        .where(models.Notification.related_item_id == item_id)
+        .order_by(models.Notification.id)
+    ).all()
+    assert rows == [(True, 1, False), (False, 1, False), (False, 1, True)]
+
+
+def test_old_read_notifications_are_purged_in_batches_by_partition(client: TestClient, db_session: Session, auth_headers):
+    owner = auth_headers("retention_owner")
+    fan = auth_headers("retention_fan")
+    owner_id = client.get("/users/me", headers=owner).json()["id"]
+    fan_id = client.get("/users/me", headers=fan).json()["id"]
+    list_id = client.post("/lists/", headers=owner, json={"title": "Old", "privacy_level": "public"}).json()["id"]
+    item_id = client.post(f"/lists/{list_id}/items", headers=owner, json={"title": "Gift"}).json()["id"]
+    client.post(f"/items/{item_id}/like", headers=fan)
+
+    old_month = partitions.add_months(partitions.month_start(datetime.now(timezone.utc)), -6)
+    partitions.ensure_notification_partitions(db_session.connection(), first_month=old_month)
+    db_session.add_all(
+        models.Notification(
+            recipient_id=owner_id, sender_id=fan_id, type=models.NotificationType.FRIEND_REQUEST,
+            is_read=i < 5, created_at=old_month + timedelta(days=i),
+        )
+        for i in range(6)
+    )
+    db_session.commit()
+
+    def rows(table):
+        return db_session.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+    old_partition = partitions.partition_name(old_month)
+    assert rows(old_partition) == 6
+
+    report = maintenance.purge_read_notifications(db_session, timedelta(days=90), batch_size=2, archive=True)
+    assert report.removed == 5
+    assert rows("notifications_archive") == 5
+    # Непрочитанное старое и свежее уведомление о лайке остаются, партиция с непрочитанным не удаляется
+    assert rows(old_partition) == 1
+    assert rows("notifications") == 2
+    assert old_partition not in report.dropped_partitions
+
+    client.post("/notifications/read-all", headers=owner)
+    report = maintenance.purge_read_notifications(db_session, timedelta(days=90))
+    assert report.removed == 1
+    assert old_partition in report.dropped_partitions
+    assert old_partition not in partitions.monthly_partitions(db_session.connection())
+    # Свежее уведомление прочитано, но моложе срока хранения
+    assert db_session.scalar(select(func.count()).select_from(models.Notification)) == 1
+
+
+def test_list_row_is_locked_before_user_counters(client: TestClient, count_queries, auth_headers):
+    owner = auth_headers("locks_owner")
+    fan = auth_headers("locks_fan")
+    list_id = client.post("/lists/", headers=owner, json={"title": "Locks", "privacy_level": "public"}).json()["id"]
+    items = [client.post(f"/lists/{list_id}/items", headers=owner, json={"title": f"Gift {i}"}).json() for i in range(2)]
+
+    def locked_tables(request):
+        # Порядок первых UPDATE lists / users в транзакции запроса
+        with count_queries() as statements:
+            request()
+        tables = []
+        for statement in statements:
+            for table in ("lists", "users"):
+                if statement.startswith(f"UPDATE {table} ") and table not in tables:
+                    tables.append(table)
+        return tables
+
+    assert locked_tables(lambda: client.post(f"/items/{items[0]['id']}/like", headers=fan)) == ["lists", "users"]
+    assert locked_tables(
+        lambda: client.post(f"/items/{items[1]['id']}/comments", headers=fan, json={"text": "Nice"})
+    ) == ["lists", "users"]
+    assert locked_tables(lambda: client.delete(f"/items/{items[0]['id']}", headers=owner)) == ["lists", "users"]
+    assert locked_tables(lambda: client.delete(f"/lists/{list_id}", headers=owner)) == ["lists", "users"]
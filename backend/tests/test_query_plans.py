@@ -0,0 +1,139 @@
+"""
+Планы горячих запросов crud.py на заполненных таблицах: ни один не должен читать большую таблицу целиком.
+Индексы создаются миграциями (app/db/migrations), поэтому тест проверяет и их.
+"""
+import re
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import crud, pagination, social_graph
+from app.db.base import Base
+
+USERS = 5000
+LISTS = 20000
+ITEMS = 100000
+
+SEED_SQL = f"""
+INSERT INTO users (name, email, hashed_password, is_active)
+SELECT 'user' || g, 'user' || g || '@example.com', 'x', true FROM generate_series(1, {USERS}) g;
+
+INSERT INTO lists (title, owner_id, privacy_level, theme_name, list_type, public_url_key, created_at)
+SELECT 'list ' || g, 1 + g % {USERS},
+       (ARRAY['PUBLIC', 'FRIENDS_ONLY', 'PRIVATE'])[1 + g % 3]::privacylevel,
+       'DEFAULT', 'WISHLIST', md5(g::text)::uuid, now() - g * interval '1 minute'
+FROM generate_series(1, {LISTS}) g;
+
+INSERT INTO items (title, is_completed, list_id, created_at)
+SELECT 'item ' || g, false, 1 + g % {LISTS}, now() - g * interval '1 second'
+FROM generate_series(1, {ITEMS}) g;
+
+INSERT INTO likes (item_id, user_id)
+SELECT 1 + g % {ITEMS}, 1 + g % {USERS} FROM generate_series(1, {ITEMS}) g
+ON CONFLICT DO NOTHING;
+
+INSERT INTO comments (text, item_id, owner_id, created_at)
+SELECT 'comment', 1 + g % {ITEMS // 2}, 1 + g % {USERS}, now() - g * interval '1 second'
+FROM generate_series(1, {ITEMS}) g;
+
+INSERT INTO reservations (item_id, reserver_id)
+SELECT g, 1 + g % {USERS} FROM generate_series(1, {ITEMS // 4}) g;
+
+INSERT INTO notifications (is_read, type, recipient_id, sender_id, created_at, event_seq)
+SELECT g % 3 = 0, 'LIKE', 1 + g % {USERS}, 1 + (g + 1) % {USERS}, now() - g * interval '1 second', {ITEMS} - g
+FROM generate_series(1, {ITEMS}) g;
+
+INSERT INTO friendships (requester_id, addressee_id, user_low_id, user_high_id, status)
+SELECT u, u + k, u, u + k, 'ACCEPTED'
+FROM generate_series(1, {USERS}) u, generate_series(1, 10) k
+WHERE u + k <= {USERS};
+
+INSERT INTO feed_entries (user_id, list_id, owner_id, created_at)
+SELECT 1 + (l.id * 7 + k * 997) % {USERS}, l.id, l.owner_id, l.created_at
+FROM lists l, generate_series(0, 4) k
+ON CONFLICT DO NOTHING;
+
+INSERT INTO refresh_tokens (user_id, token_hash, family_id, expires_at)
+SELECT 1 + g % {USERS}, md5(g::text) || md5((-g)::text), md5(g::text)::uuid, now() + interval '30 days'
+FROM generate_series(1, {LISTS}) g;
+"""
+
+# Таблицы, которые в рабочей БД растут вместе с числом пользователей
+LARGE_TABLES = {
+    "users", "lists", "items", "likes", "comments", "reservations",
+    "notifications", "friendships", "feed_entries", "refresh_tokens",
+}
+
+
+@pytest.fixture
+def seeded_db(db_session: Session) -> Session:
+    db_session.execute(text(SEED_SQL))
+    db_session.commit()
+    connection = db_session.connection()
+    for table in Base.metadata.sorted_tables:
+        connection.exec_driver_sql(f"ANALYZE {table.name}")
+    db_session.commit()
+    return db_session
+
+
+def _seq_scans(plan: dict, empty_partitions: set) -> set:
+    found = set()
+    relation = plan.get("Relation Name")
+    if plan["Node Type"] == "Seq Scan" and relation not in empty_partitions:
+        # Партиции notifications_YYYY_MM / notifications_default считаются как notifications
+        relation = re.sub(r"^notifications_(\d{4}_\d{2}|default)$", "notifications", relation)
+        if relation in LARGE_TABLES:
+            found.add(relation)
+    for child in plan.get("Plans", []):
+        found |= _seq_scans(child, empty_partitions)
+    return found
+
+def _empty_partitions(db: Session) -> set:
+    # Пустые партиции (будущие месяцы, default) планировщик честно читает Seq Scan — строк там нет
+    return set(db.execute(text("SELECT relname FROM pg_class WHERE relispartition AND reltuples = 0")).scalars())
+
+def _explain(db: Session, stmt) -> dict:
+    compiled = stmt.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})
+    return db.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()[0]["Plan"]
+
+
+def _hot_queries():
+    cursor = pagination.encode_cursor(datetime(2020, 1, 1, tzinfo=timezone.utc), 1000)
+    return {
+        "user": crud._user_stmt(1),
+        "user_by_email": crud._user_by_email_stmt("user1@example.com"),
+        "user_by_name": crud._user_by_name_stmt("user1"),
+        "user_by_email_or_name": crud._user_by_email_or_name_stmt("user1"),
+        "refresh_token_by_hash": crud._refresh_token_by_hash_stmt("0" * 64),
+        "friend_ids": social_graph.friend_ids_stmt(42),
+        "visible_lists": crud._visible_lists_stmt(42, are_friends=True),
+        "visible_list_versions": crud._visible_list_versions_stmt(42, are_friends=True),
+        "list": crud._list_stmt(1),
+        "list_by_public_key": crud._list_by_public_key_stmt(uuid.UUID(int=1)),
+        "lists_by_user": crud._lists_by_user_stmt(42, 0, 100),
+        "list_header": crud._list_header_stmt(1),
+        "list_items_page": crud._list_items_page_stmt(1, None, 50),
+        "list_items_page_cursor": crud._list_items_page_stmt(1, cursor, 50),
+        "item_like_stats": crud._item_like_stats_stmt(range(1, 51), 42),
+        "item": crud._item_stmt(1),
+        "reservation_by_item_id": crud._reservation_by_item_id_stmt(1),
+        "reservations_by_user": crud._reservations_by_user_stmt(42),
+        "comment_previews": crud._comment_previews_stmt(range(1, 51), crud.COMMENT_PREVIEW_SIZE),
+        "item_comments_page": crud._item_comments_page_stmt(1, None, 50),
+        "item_comments_page_cursor": crud._item_comments_page_stmt(1, cursor, 50),
+        "notifications_for_user": crud._notifications_for_user_stmt(42, 20),
+        "count_unread_notifications": crud._count_unread_notifications_stmt(42),
+        "notifications_version": crud._notifications_version_stmt(42),
+        "user_notification": crud._user_notification_stmt(1, 42),
+        "notification_events_since": crud._notification_events_since_stmt(42, 0, crud.NOTIFICATION_REPLAY_LIMIT + 1),
+        "friends_feed": crud._friends_feed_lists_stmt(42, None, crud.FEED_PAGE_SIZE),
+        "friends_feed_cursor": crud._friends_feed_lists_stmt(42, cursor, crud.FEED_PAGE_SIZE),
+    }
+
+def test_hot_queries_use_indexes(seeded_db: Session):
+    empty_partitions = _empty_partitions(seeded_db)
+    seq_scans = {name: _seq_scans(_explain(seeded_db, stmt), empty_partitions) for name, stmt in _hot_queries().items()}
+    assert {name: tables for name, tables in seq_scans.items() if tables} == {}
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app import crud, ws_manager
+from app.db.base import LISTEN_DATABASE_URL, get_async_session_factory
+
+
+class FakeSocket:
+    """Сокет клиента: копит полученные кадры; с release=asyncio.Event() — медленный клиент."""
+
+    def __init__(self, release=None):
+        self.frames = []
+        self.close_code = None
+        self.release = release
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.release is not None:
+            await self.release.wait()
+        self.frames.append(json.loads(text))
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+async def wait_until(predicate):
+    for _ in range(100):
+        if predicate():
+            return
+        await asyncio.sleep(0.02)
+
+
+def test_notification_push_throttle_sends_first_and_last(monkeypatch):
+    sent = []
+    async def capture(message, user_id):
+        sent.append(json.loads(message)["n"])
+    monkeypatch.setattr(ws_manager.manager, "send_personal_message", capture)
+    throttle = ws_manager.NotificationPushThrottle(interval=0.05)
+
+    async def scenario():
+        for n in range(4):
+            await throttle.push(1, 10, {"n": n})
+        await throttle.push(1, 11, {"n": 100})
+        await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert sent == [0, 100, 3]
+
+
+def test_websocket_messages_reach_sockets_held_by_another_worker():
+    async def scenario():
+        # Два воркера: у каждого свой менеджер соединений и свой слушатель канала
+        worker_a, worker_b = ws_manager.ConnectionManager(), ws_manager.ConnectionManager()
+        socket = FakeSocket()
+        await worker_b.connect(socket, 7)
+        fanouts = [ws_manager.PostgresFanout(worker, LISTEN_DATABASE_URL, channel="ws_messages_test") for worker in (worker_a, worker_b)]
+        for fanout in fanouts:
+            await fanout.start()
+        try:
+            await fanouts[0].publish(7, {"event": "unread_count", "unread_count": 3})
+            await wait_until(lambda: socket.frames)
+        finally:
+            for fanout in fanouts:
+                await fanout.stop()
+        # Без слушателя сообщение уходит только локальным сокетам
+        await fanouts[1].publish(7, {"event": "unread_count", "unread_count": 0})
+        await wait_until(lambda: len(socket.frames) == 2)
+        return socket.frames
+
+    assert asyncio.run(scenario()) == [
+        {"event": "unread_count", "unread_count": 3},
+        {"event": "unread_count", "unread_count": 0},
+    ]
+
+
+def test_every_tab_gets_notifications_and_slow_sockets_do_not_block_others(client: TestClient, auth_headers):
+    owner = auth_headers("tabs_owner")
+    fan = auth_headers("tabs_fan")
+    list_id = client.post("/lists/", headers=owner, json={"title": "Tabs", "privacy_level": "public"}).json()["id"]
+    item_id = client.post(f"/lists/{list_id}/items", headers=owner, json={"title": "Gift"}).json()["id"]
+    token = owner["Authorization"].split()[1]
+    with client.websocket_connect(f"/notifications/ws?token={token}") as first, \
+            client.websocket_connect(f"/notifications/ws?token={token}") as second:
+        client.post(f"/items/{item_id}/like", headers=fan)
+        assert first.receive_json()["related_item_id"] == item_id
+        assert second.receive_json()["related_item_id"] == item_id
+
+    def message(n):
+        return {"event": "unread_count", "unread_count": n}
+
+    async def scenario(policy):
+        manager = ws_manager.ConnectionManager(queue_size=2, batch_size=10, policy=policy)
+        release = asyncio.Event()
+        slow, fast = FakeSocket(release), FakeSocket()
+        slow_connection = await manager.connect(slow, 1)
+        await manager.connect(fast, 1)
+        await manager.send_personal_message(message(0), 1)
+        await asyncio.sleep(0)  # писатель медленного сокета забрал первое сообщение и ждет клиента
+        for n in range(1, 5):
+            await manager.send_personal_message(message(n), 1)
+            await asyncio.sleep(0)
+        depth = manager.max_queue_depth()
+        await wait_until(lambda: len(fast.frames) == 5)
+        release.set()
+        await wait_until(lambda: len(slow.frames) == 2 or slow_connection.closed)
+        await asyncio.sleep(0.01)
+        manager.disconnect(slow_connection)
+        return depth, slow, fast
+
+    depth, slow, fast = asyncio.run(scenario("drop_oldest"))
+    assert depth == 2
+    # Быстрый сокет получил все сообщения; медленный — первое и два последних, накопившиеся — одним кадром
+    assert fast.frames == [message(n) for n in range(5)]
+    assert slow.frames == [message(0), [message(3), message(4)]]
+
+    _, slow, fast = asyncio.run(scenario("disconnect"))
+    # Переполнение закрывает медленный сокет, быстрый продолжает получать все
+    assert slow.close_code == ws_manager.WS_SLOW_CONSUMER_CLOSE_CODE
+    assert slow.frames == []
+    assert fast.frames == [message(n) for n in range(5)]
+
+
+def test_websocket_releases_db_session_and_reaps_idle_clients(client: TestClient, monkeypatch, auth_headers):
+    user = auth_headers("socket_user")
+    token = user["Authorization"].split()[1]
+
+    # Сессии, открытые обработчиком сокета, и сколько из них еще не закрыто
+    open_sessions = []
+    factory = client.app.dependency_overrides[get_async_session_factory]()
+    class TrackingSession:
+        def __init__(self):
+            self.session = factory()
+        async def __aenter__(self):
+            open_sessions.append(self)
+            return await self.session.__aenter__()
+        async def __aexit__(self, *exc):
+            open_sessions.remove(self)
+            return await self.session.__aexit__(*exc)
+    client.app.dependency_overrides[get_async_session_factory] = lambda: TrackingSession
+
+    monkeypatch.setattr(ws_manager, "WS_PING_INTERVAL", 0.05)
+    monkeypatch.setattr(ws_manager, "WS_IDLE_TIMEOUT", 0.3)
+    with client.websocket_connect(f"/notifications/ws?token={token}") as socket:
+        assert socket.receive_json() == {"event": "ping"}
+        assert open_sessions == []
+        socket.send_text("pong")
+        # Клиент больше не отвечает: после WS_IDLE_TIMEOUT сервер закрывает соединение
+        started = time.monotonic()
+        with pytest.raises(WebSocketDisconnect) as closed:
+            while True:
+                assert socket.receive_json() == {"event": "ping"}
+        assert closed.value.code == ws_manager.WS_IDLE_CLOSE_CODE
+        assert time.monotonic() - started >= 0.2
+
+    monkeypatch.setattr(ws_manager, "WS_MAX_CONNECTIONS_PER_WORKER", 1)
+    with client.websocket_connect(f"/notifications/ws?token={token}"):
+        with pytest.raises(WebSocketDisconnect) as rejected:
+            with client.websocket_connect(f"/notifications/ws?token={token}"):
+                pass
+        assert rejected.value.code == ws_manager.WS_OVERLOADED_CLOSE_CODE
+    with pytest.raises(WebSocketDisconnect) as rejected:
+        with client.websocket_connect("/notifications/ws?token=invalid"):
+            pass
+    assert rejected.value.code == 1008
+
+
+def test_concurrent_handshakes_do_not_overshoot_the_worker_limit(monkeypatch):
+    monkeypatch.setattr(ws_manager, "WS_MAX_CONNECTIONS_PER_WORKER", 1)
+
+    async def scenario():
+        accepted = asyncio.Event()
+
+        class SlowHandshake(FakeSocket):
+            async def accept(self):
+                await accepted.wait()
+
+        manager = ws_manager.ConnectionManager()
+        first, second = SlowHandshake(), SlowHandshake()
+        # Пока первое рукопожатие ждет accept, его место уже занято
+        pending = asyncio.create_task(manager.connect(first, 1))
+        await asyncio.sleep(0)
+        assert await asyncio.wait_for(manager.connect(second, 2), timeout=1) is None
+        assert second.close_code == ws_manager.WS_OVERLOADED_CLOSE_CODE
+        accepted.set()
+        connection = await pending
+        assert manager.connection_count() == 1
+
+        # Закрытие по инициативе сервера: задача закрытия удерживается до завершения
+        connection.close(ws_manager.WS_IDLE_CLOSE_CODE)
+        assert len(ws_manager.ClientConnection._close_tasks) == 1
+        await wait_until(lambda: not ws_manager.ClientConnection._close_tasks)
+        assert first.close_code == ws_manager.WS_IDLE_CLOSE_CODE
+        manager.disconnect(connection)
+
+    asyncio.run(scenario())
+
+
+def test_reconnected_websocket_replays_only_missed_events(client: TestClient, monkeypatch, auth_headers):
+    owner = auth_headers("replay_owner")
+    fan = auth_headers("replay_fan")
+    token = owner["Authorization"].split()[1]
+    list_id = client.post("/lists/", headers=owner, json={"title": "Replayed", "privacy_level": "public"}).json()["id"]
+    items = [client.post(f"/lists/{list_id}/items", headers=owner, json={"title": f"Gift {i}"}).json() for i in range(3)]
+    for item in items:
+        client.post(f"/items/{item['id']}/like", headers=fan)
+    client.post(f"/items/{items[0]['id']}/comments", headers=fan, json={"text": "Nice"})
+
+    notifications = client.get("/notifications/", headers=owner).json()["notifications"]
+    event_ids = sorted(n["event_id"] for n in notifications)
+    assert event_ids == list(range(event_ids[0], event_ids[0] + 4))
+
+    # Клиент получил первое событие и отвалился: при переподключении приходят остальные одним кадром
+    with client.websocket_connect(f"/notifications/ws?token={token}&last_event_id={event_ids[0]}") as socket:
+        replayed = socket.receive_json()
+    assert [m["event_id"] for m in replayed] == event_ids[1:]
+    assert all(m["replayed"] for m in replayed)
+    assert [(m["type"], m["related_item_id"], m["related_list_id"]) for m in replayed] == [
+        ("like", items[1]["id"], list_id), ("like", items[2]["id"], list_id), ("comment", items[0]["id"], list_id),
+    ]
+    assert replayed[0]["sender"]["name"] == "replay_fan"
+
+    # Пропущено больше, чем повторяется: клиент должен перечитать список
+    monkeypatch.setattr(crud, "NOTIFICATION_REPLAY_LIMIT", 2)
+    with client.websocket_connect(f"/notifications/ws?token={token}&last_event_id=0") as socket:
+        assert socket.receive_json() == {"event": "resync"}
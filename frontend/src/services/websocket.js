@@ -3,9 +3,15 @@
 import { useNotificationStore } from '@/store/notifications';
 
 let ws = null;
+// Переподключение после обрыва (деплой, сеть): пауза растет до RECONNECT_MAX_DELAY
+let reconnectTimer = null;
+let reconnectDelay = 1000;
+const RECONNECT_MAX_DELAY = 30000;
 
 export const websocketService = {
   connect() {
+    clearTimeout(reconnectTimer);
+    reconnectTimer = null;
     // Предотвращаем создание нескольких соединений
     if (ws && ws.readyState === WebSocket.OPEN) {
       console.log('WebSocket is already connected.');
@@ -23,34 +29,64 @@ export const websocketService = {
     // Используем wss:// для HTTPS и ws:// для HTTP
     const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
     const host = 'localhost:8000'; // Убедитесь, что хост и порт верные
-    ws = new WebSocket(`${protocol}://${host}/notifications/ws?token=${token}`);
+    // Сервер повторит события новее последнего полученного, список заново не скачивается
+    const { lastEventId } = useNotificationStore();
+    const replay = lastEventId !== null ? `&last_event_id=${lastEventId}` : '';
+    const socket = new WebSocket(`${protocol}://${host}/notifications/ws?token=${token}${replay}`);
+    ws = socket;
 
-    ws.onopen = () => {
+    socket.onopen = () => {
       console.log('WebSocket connected successfully.');
+      reconnectDelay = 1000;
     };
 
-    ws.onmessage = (event) => {
+    socket.onmessage = (event) => {
       const notificationStore = useNotificationStore();
-      const newNotification = JSON.parse(event.data);
-      // Вызываем экшен в сторе, чтобы обновить состояние
-      notificationStore.handleNewNotification(newNotification);
+      const data = JSON.parse(event.data);
+      // Накопившиеся сообщения сервер присылает одним кадром-массивом
+      for (const message of Array.isArray(data) ? data : [data]) {
+        // Проверка связи: молчащий клиент сервер отключает
+        if (message.event === 'ping') {
+          socket.send('pong');
+          continue;
+        }
+        // Пропущено слишком много: перечитываем список целиком
+        if (message.event === 'resync') {
+          notificationStore.fetchNotifications();
+          continue;
+        }
+        // Изменение счетчика непрочитанных (прочтение на другой вкладке или устройстве)
+        if (message.event === 'unread_count') {
+          notificationStore.setUnreadCount(message.unread_count);
+          continue;
+        }
+        // Вызываем экшен в сторе, чтобы обновить состояние
+        notificationStore.handleNewNotification(message);
+      }
     };
 
-    ws.onclose = () => {
+    socket.onclose = () => {
       console.log('WebSocket disconnected.');
-      ws = null;
+      // Закрытие не по disconnect(): переподключаемся
+      if (ws === socket) {
+        ws = null;
+        reconnectTimer = setTimeout(() => websocketService.connect(), reconnectDelay);
+        reconnectDelay = Math.min(reconnectDelay * 2, RECONNECT_MAX_DELAY);
+      }
     };
 
-    ws.onerror = (error) => {
+    socket.onerror = (error) => {
       console.error('WebSocket error:', error);
-      ws = null;
     };
   },
 
   disconnect() {
+    clearTimeout(reconnectTimer);
+    reconnectTimer = null;
     if (ws) {
-      ws.close();
+      const socket = ws;
       ws = null;
+      socket.close();
     }
   }
 };
\ No newline at end of file
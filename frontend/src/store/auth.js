@@ -8,10 +8,13 @@ const API_URL = 'http://localhost:8000';
 // Создаем и экспортируем экземпляр axios здесь
 export const apiClient = axios.create({
   baseURL: API_URL,
+  // cookie last_write_at: после записи чтения идут на primary, а не на отстающую реплику
+  withCredentials: true,
 });
 
 export const useAuthStore = defineStore('auth', () => {
   const token = ref(localStorage.getItem('user-token') || null);
+  const refreshToken = ref(localStorage.getItem('user-refresh-token') || null);
   const user = ref(null);
   const error = ref(null);
   const successMessage = ref(null); // Для сообщений об успехе
@@ -26,6 +29,32 @@ export const useAuthStore = defineStore('auth', () => {
     return config;
   });
 
+  // Access-токен живет 30 минут. При 401 один раз обмениваем refresh-токен на новую пару
+  // и повторяем запрос; параллельные запросы ждут один общий обмен
+  let refreshPromise = null;
+
+  apiClient.interceptors.response.use(
+    response => response,
+    async e => {
+      const original = e.config;
+      const isAuthCall = original?.url?.startsWith('/auth/');
+      if (e.response?.status !== 401 || !refreshToken.value || isAuthCall || original._retried) {
+        return Promise.reject(e);
+      }
+      original._retried = true;
+      try {
+        if (!refreshPromise) {
+          refreshPromise = refreshTokens().finally(() => { refreshPromise = null; });
+        }
+        await refreshPromise;
+      } catch (refreshError) {
+        logout();
+        return Promise.reject(e);
+      }
+      return apiClient(original);
+    }
+  );
+
   function setToken(newToken) {
     token.value = newToken;
     if (newToken) {
@@ -35,6 +64,25 @@ export const useAuthStore = defineStore('auth', () => {
     }
   }
 
+  function setRefreshToken(newToken) {
+    refreshToken.value = newToken;
+    if (newToken) {
+      localStorage.setItem('user-refresh-token', newToken);
+    } else {
+      localStorage.removeItem('user-refresh-token');
+    }
+  }
+
+  function setTokens(data) {
+    setToken(data.access_token);
+    setRefreshToken(data.refresh_token);
+  }
+
+  async function refreshTokens() {
+    const response = await apiClient.post('/auth/refresh', { refresh_token: refreshToken.value });
+    setTokens(response.data);
+  }
+
   function clearMessages() {
     error.value = null;
     successMessage.value = null;
@@ -59,7 +107,7 @@ export const useAuthStore = defineStore('auth', () => {
 
       const response = await apiClient.post('/auth/token', params);
       
-      setToken(response.data.access_token);
+      setTokens(response.data);
       await fetchUser();
       router.push({ name: 'Home' });
     } catch (e) {
@@ -79,7 +127,12 @@ export const useAuthStore = defineStore('auth', () => {
   }
 
   function logout() {
+    if (refreshToken.value) {
+      // Отзываем refresh-токен на сервере; ошибка не мешает выйти локально
+      apiClient.post('/auth/logout', { refresh_token: refreshToken.value }).catch(() => {});
+    }
     setToken(null);
+    setRefreshToken(null);
     user.value = null;
     router.push({ name: 'Login' });
   }
@@ -88,7 +141,9 @@ export const useAuthStore = defineStore('auth', () => {
   async function updatePassword(passwordData) {
     clearMessages();
     try {
-      await apiClient.put('/settings/password', passwordData);
+      const response = await apiClient.put('/settings/password', passwordData);
+      // Старые токены после смены пароля отзываются, сервер выдает новую пару
+      setTokens(response.data);
       successMessage.value = 'Пароль успешно обновлен!';
     } catch (e) {
       error.value = e.response?.data?.detail || 'Не удалось обновить пароль.';
@@ -123,7 +178,7 @@ export const useAuthStore = defineStore('auth', () => {
   }
 
   return { 
-    token, user, error, successMessage,
+    token, refreshToken, user, error, successMessage,
     register, login, logout, fetchUser, 
     updatePassword, updateEmail, deleteAccount,
     clearMessages,
@@ -6,7 +6,8 @@ const FEED_PAGE_SIZE = 10;
 
 export const useFeedStore = defineStore('feed', () => {
     const friendsFeed = ref([]);
-    const currentPage = ref(0);
+    // Курсор следующей страницы из ответа сервера (null — первая страница)
+    const nextCursor = ref(null);
     const isLoading = ref(false);
     const hasMore = ref(true); // Предполагаем, что данные есть
     const error = ref(null);
@@ -20,16 +21,17 @@ export const useFeedStore = defineStore('feed', () => {
         error.value = null;
 
         try {
-            const skip = currentPage.value * FEED_PAGE_SIZE;
-            const response = await apiClient.get(`/feed/friends-lists?skip=${skip}&limit=${FEED_PAGE_SIZE}`);
-
-            if (response.data.length > 0) {
-                friendsFeed.value.push(...response.data);
-                currentPage.value++;
+            const params = { limit: FEED_PAGE_SIZE };
+            if (nextCursor.value) {
+                params.cursor = nextCursor.value;
             }
+            const response = await apiClient.get('/feed/friends-lists', { params });
+
+            friendsFeed.value.push(...response.data.items);
+            nextCursor.value = response.data.next_cursor;
 
-            // Если пришел пустой массив или массив меньше страницы, значит, это конец
-            if (response.data.length < FEED_PAGE_SIZE) {
+            // Нет курсора — это конец ленты
+            if (!response.data.next_cursor) {
                 hasMore.value = false;
             }
 
@@ -44,7 +46,7 @@ export const useFeedStore = defineStore('feed', () => {
     // Функция для сброса состояния ленты, например, при обновлении страницы
     function resetFeed() {
         friendsFeed.value = [];
-        currentPage.value = 0;
+        nextCursor.value = null;
         hasMore.value = true;
         error.value = null;
     }
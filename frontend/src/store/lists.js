@@ -7,6 +7,7 @@ export const useListsStore = defineStore('lists', () => {
   const currentList = ref(null);
   const userReservations = ref([]);
   const isLoading = ref(false);
+  const isLoadingMore = ref(false);
   const error = ref(null);
   const listAccessErrorDetails = ref(null);
 
@@ -39,6 +40,25 @@ export const useListsStore = defineStore('lists', () => {
     }
   }
   
+  // Элементы списка приходят страницами: GET /lists/{id} отдает первую и next_cursor
+  async function loadMoreItems() {
+    const list = currentList.value;
+    if (!list?.next_cursor || isLoadingMore.value) return;
+    isLoadingMore.value = true;
+    try {
+      const response = await apiClient.get(`/lists/${list.id}/items`, {
+        params: { cursor: list.next_cursor }
+      });
+      list.items.push(...response.data.items);
+      list.next_cursor = response.data.next_cursor;
+    } catch (e) {
+      error.value = 'Не удалось загрузить элементы списка.';
+      console.error(e);
+    } finally {
+      isLoadingMore.value = false;
+    }
+  }
+  
   async function fetchPublicListByKey(publicKey) {
     isLoading.value = true;
     error.value = null;
@@ -129,7 +149,9 @@ export const useListsStore = defineStore('lists', () => {
       if (currentList.value) {
         const index = currentList.value.items.findIndex(i => i.id === itemId);
         if (index !== -1) {
-          currentList.value.items[index] = response.data;
+          // Ответ /items/{id} не содержит превью комментариев — оставляем уже загруженные
+          const { comments, comments_count } = currentList.value.items[index];
+          currentList.value.items[index] = { ...response.data, comments, comments_count };
         }
       }
     } catch (e) {
@@ -147,7 +169,9 @@ export const useListsStore = defineStore('lists', () => {
       if (currentList.value) {
         const index = currentList.value.items.findIndex(i => i.id === itemId);
         if (index !== -1) {
-          currentList.value.items[index] = response.data;
+          // Ответ /items/{id} не содержит превью комментариев — оставляем уже загруженные
+          const { comments, comments_count } = currentList.value.items[index];
+          currentList.value.items[index] = { ...response.data, comments, comments_count };
         }
       }
     } catch (e) {
@@ -211,6 +235,7 @@ export const useListsStore = defineStore('lists', () => {
       const item = currentList.value?.items.find(i => i.id === itemId);
       if(item) {
         item.comments.push(response.data);
+        item.comments_count++;
       }
     } catch (e) {
       error.value = e.response?.data?.detail || 'Не удалось добавить комментарий.';
@@ -225,6 +250,7 @@ export const useListsStore = defineStore('lists', () => {
       const item = currentList.value?.items.find(i => i.id === itemId);
       if(item) {
         item.comments = item.comments.filter(c => c.id !== commentId);
+        item.comments_count--;
       }
     } catch (e) {
       error.value = e.response?.data?.detail || 'Не удалось удалить комментарий.';
@@ -232,6 +258,26 @@ export const useListsStore = defineStore('lists', () => {
     }
   }
 
+  // В ответе списка у элемента только последние комментарии и comments_count.
+  // Остальные догружаются страницами от новых к старым и вливаются в item.comments
+  async function loadMoreComments(itemId) {
+    error.value = null;
+    const item = currentList.value?.items.find(i => i.id === itemId);
+    if (!item || item.comments_cursor === null) return;
+    try {
+      const response = await apiClient.get(`/items/${itemId}/comments`, {
+        params: item.comments_cursor ? { cursor: item.comments_cursor } : {}
+      });
+      const known = new Set(item.comments.map(c => c.id));
+      const older = response.data.items.filter(c => !known.has(c.id)).reverse();
+      item.comments = [...older, ...item.comments];
+      item.comments_cursor = response.data.next_cursor;
+    } catch (e) {
+      error.value = e.response?.data?.detail || 'Не удалось загрузить комментарии.';
+      console.error(e);
+    }
+  }
+
   // --- Новая функция для копирования элемента ---
   async function copyItem(itemId) {
     error.value = null;
@@ -347,10 +393,12 @@ export const useListsStore = defineStore('lists', () => {
     currentList,
     userReservations,
     isLoading, 
+    isLoadingMore,
     error,
     listAccessErrorDetails,
     fetchLists, 
     fetchListById,
+    loadMoreItems,
     fetchPublicListByKey,
     addList, 
     updateList, 
@@ -365,6 +413,7 @@ export const useListsStore = defineStore('lists', () => {
     toggleLike,
     addComment,
     deleteComment,
+    loadMoreComments,
     copyItem,
     logGoalProgress,
     updateGoalSettings,
@@ -16,6 +16,14 @@ export const useNotificationStore = defineStore('notifications', () => {
     const notifications = ref([]);
     const unreadCount = ref(0);
     const error = ref(null);
+    // Последнее полученное событие: при переподключении WebSocket сервер повторит только более новые
+    const lastEventId = ref(null);
+
+    function rememberEventId(eventId) {
+      if (eventId != null && (lastEventId.value === null || eventId > lastEventId.value)) {
+        lastEventId.value = eventId;
+      }
+    }
 
     // --- НОВАЯ ФУНКЦИЯ ДЛЯ "РАЗБЛОКИРОВКИ" ---
     function unlockAudioContext() {
@@ -50,6 +58,7 @@ export const useNotificationStore = defineStore('notifications', () => {
             const response = await apiClient.get('/notifications/');
             notifications.value = response.data.notifications;
             unreadCount.value = response.data.unread_count;
+            notifications.value.forEach(n => rememberEventId(n.event_id));
             error.value = null;
         } catch (e) {
             error.value = 'Не удалось загрузить уведомления.';
@@ -70,12 +79,43 @@ export const useNotificationStore = defineStore('notifications', () => {
         }
     }
     
+    async function markAllAsRead() {
+        try {
+            const response = await apiClient.post('/notifications/read-all');
+            notifications.value.forEach(n => { n.is_read = true; });
+            unreadCount.value = response.data.unread_count;
+        } catch (e) {
+            console.error('Не удалось отметить уведомления как прочитанные:', e);
+        }
+    }
+
+    function setUnreadCount(count) {
+      unreadCount.value = count;
+    }
+
     // --- НОВЫЙ ЭКШЕН ---
     function handleNewNotification(notification) {
-      // Добавляем новое уведомление в начало списка
+      // Схлопнутое уведомление приходит повторно с тем же id: заменяем старую версию
+      const index = notifications.value.findIndex(n => n.id === notification.id);
+      if (index !== -1) {
+        const known = notifications.value[index];
+        // Повтор после переподключения мог прийти позже более свежего события
+        if (known.event_id != null && notification.event_id != null && known.event_id >= notification.event_id) {
+          return;
+        }
+        notifications.value.splice(index, 1);
+      }
+      // Добавляем уведомление в начало списка
       notifications.value.unshift(notification);
-      // Увеличиваем счетчик непрочитанных
-      unreadCount.value += 1;
+      rememberEventId(notification.event_id);
+      // Счетчик непрочитанных растет только на новое уведомление
+      const isNew = notification.replayed ? index === -1 && !notification.is_read : !notification.merged;
+      if (isNew) {
+        unreadCount.value += 1;
+      }
+      if (notification.replayed) {
+        return;
+      }
 
       // --- ДОБАВЛЯЕМ ВОСПРОИЗВЕДЕНИЕ ЗВУКА ---
       // Сбрасываем текущее время звука, чтобы он мог проигрываться снова, даже если еще не закончился
@@ -93,8 +133,11 @@ export const useNotificationStore = defineStore('notifications', () => {
         notifications,
         unreadCount,
         error,
+        lastEventId,
         fetchNotifications,
         markAsRead,
+        markAllAsRead,
+        setUnreadCount,
         handleNewNotification, // <-- Экспортируем новый экшен
         unlockAudioContext
     };